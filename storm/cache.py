@@ -1,5 +1,8 @@
+from collections import OrderedDict
 import itertools
+import sys
 
+from storm import Undef
 from storm.compat import iter_items
 
 class Cache(object):
@@ -9,17 +12,19 @@ class Cache(object):
     even if the user isn't holding any strong references to it.  It does
     that by holding strong references to the objects referenced by the
     last C{N} C{obj_info} added to it (where C{N} is the cache size).
+
+    Entries are kept in an ordered dict, from the least to the most
+    recently added, so that adding, removing and evicting them takes
+    constant time regardless of the cache size.
     """
 
     def __init__(self, size=1000):
         self._size = size
-        self._cache = {} # {obj_info: obj, ...}
-        self._order = [] # [obj_info, ...]
+        self._cache = OrderedDict() # {obj_info: obj, ...}
 
     def clear(self):
         """Clear the entire cache at once."""
         self._cache.clear()
-        del self._order[:]
 
     def add(self, obj_info):
         """Add C{obj_info} as the most recent entry in the cache.
@@ -29,13 +34,12 @@ class Cache(object):
         (IOW, will be the last to leave).
         """
         if self._size != 0:
-            if obj_info in self._cache:
-                self._order.remove(obj_info)
-            else:
-                self._cache[obj_info] = obj_info.get_obj()
-            self._order.insert(0, obj_info)
+            obj = self._cache.pop(obj_info, None)
+            if obj is None:
+                obj = obj_info.get_obj()
+            self._cache[obj_info] = obj
             if len(self._cache) > self._size:
-                del self._cache[self._order.pop()]
+                self._cache.popitem(last=False)
 
     def remove(self, obj_info):
         """Remove C{obj_info} from the cache, if present.
@@ -43,11 +47,17 @@ class Cache(object):
         @return: True if C{obj_info} was cached, False otherwise.
         """
         if obj_info in self._cache:
-            self._order.remove(obj_info)
             del self._cache[obj_info]
             return True
         return False
 
+    def update(self, obj_info):
+        """Account for new values loaded into C{obj_info}.
+
+        This cache only counts objects, so there's nothing to do.  The
+        store only calls this method on caches that define it.
+        """
+
     def set_size(self, size):
         """Set the maximum number of objects that may be held in this cache.
 
@@ -59,7 +69,7 @@ class Cache(object):
         else:
             # Remove all entries above the new size.
             while len(self._cache) > size:
-                del self._cache[self._order.pop()]
+                self._cache.popitem(last=False)
         self._size = size
 
     def get_cached(self):
@@ -67,7 +77,7 @@ class Cache(object):
 
         The most recently added objects come first in the list.
         """
-        return list(self._order)
+        return list(reversed(self._cache))
 
 
 class GenerationalCache(object):
@@ -81,9 +91,9 @@ class GenerationalCache(object):
     demoted to secondary dict and a fresh primary dict is set up.  The
     previous secondary dict is evicted in its entirety.
 
-    Use this to replace the LRU cache for sizes where LRU tracking
-    overhead becomes too large (e.g. 100,000 objects) or the
-    `StupidCache` when it eats up too much memory.
+    Use this to replace the LRU cache when the cost of tracking exact
+    recency on every addition matters more than eviction precision, or
+    the `StupidCache` when it eats up too much memory.
     """
 
     def __init__(self, size=1000):
@@ -134,6 +144,9 @@ class GenerationalCache(object):
         in_old_cache = self._old_cache.pop(obj_info, None) is not None
         return in_new_cache or in_old_cache
 
+    def update(self, obj_info):
+        """See `storm.store.Cache.update`."""
+
     def set_size(self, size):
         """See `storm.store.Cache.set_size`.
 
@@ -161,3 +174,142 @@ class GenerationalCache(object):
         cached = self._new_cache.copy()
         cached.update(self._old_cache)
         return list(cached)
+
+
+# Containers are estimated from a few of their items, down to some depth.
+_SAMPLE_SIZE = 5
+_MAX_DEPTH = 3
+
+
+def _estimate_value_size(value, depth=0):
+    """Estimate the number of bytes used by a value.
+
+    The size of containers is extrapolated from a sample of their items,
+    so that estimating large values stays cheap.
+    """
+    if value is None or value is Undef:
+        return 0
+    size = sys.getsizeof(value)
+    if depth < _MAX_DEPTH:
+        if isinstance(value, dict):
+            sampled = [_estimate_value_size(key, depth + 1) +
+                       _estimate_value_size(item, depth + 1)
+                       for key, item in itertools.islice(iter_items(value),
+                                                         _SAMPLE_SIZE)]
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            sampled = [_estimate_value_size(item, depth + 1)
+                       for item in itertools.islice(value, _SAMPLE_SIZE)]
+        else:
+            return size
+        if sampled:
+            size += sum(sampled) * len(value) // len(sampled)
+    return size
+
+
+class MemoryBudgetCache(object):
+    """LRU cache bounded by the estimated memory used by its objects.
+
+    This works like L{Cache}, except that its size is a budget in bytes
+    rather than a number of objects.  The cost of each object is
+    estimated from the values of its columns when it enters the cache,
+    and the least recently added objects are dropped whenever the total
+    goes over the budget.  An object estimated to be larger than the
+    whole budget isn't kept at all.
+
+    Use this when the objects of an application vary so much in size
+    that no object count is both safe and useful.
+    """
+
+    def __init__(self, size=64 * 1024 * 1024):
+        """Create a cache with the given budget, in bytes."""
+        self._size = size
+        self._usage = 0
+        self._cache = OrderedDict() # {obj_info: (obj, estimated size), ...}
+
+    def clear(self):
+        """See `storm.store.Cache.clear`."""
+        self._cache.clear()
+        self._usage = 0
+
+    def add(self, obj_info):
+        """See `storm.store.Cache.add`.
+
+        The object's size is only estimated when it isn't cached yet,
+        and then again on L{update}.
+        """
+        if self._size != 0:
+            entry = self._cache.pop(obj_info, None)
+            if entry is None:
+                obj = obj_info.get_obj()
+                entry = (obj, self._estimate_size(obj_info, obj))
+                if entry[1] > self._size:
+                    # Caching it would only flush every other object.
+                    return
+                self._usage += entry[1]
+            self._cache[obj_info] = entry
+            self._evict(self._size)
+
+    def remove(self, obj_info):
+        """See `storm.store.Cache.remove`."""
+        entry = self._cache.pop(obj_info, None)
+        if entry is not None:
+            self._usage -= entry[1]
+            return True
+        return False
+
+    def update(self, obj_info):
+        """See `storm.store.Cache.update`.
+
+        The size of the object is estimated again, as loading values
+        (e.g. lazy columns, or after an invalidation) may have made it
+        bigger, and older objects are dropped if it went over budget.
+        If it is now larger than the whole budget, it's dropped instead.
+        """
+        entry = self._cache.get(obj_info)
+        if entry is not None:
+            obj, obj_size = entry
+            new_size = self._estimate_size(obj_info, obj)
+            if new_size > self._size:
+                del self._cache[obj_info]
+                self._usage -= obj_size
+                return
+            self._cache[obj_info] = (obj, new_size)
+            self._usage += new_size - obj_size
+            self._evict(self._size)
+
+    def set_size(self, size):
+        """Set the budget of this cache, in bytes.
+
+        If the budget is reduced, older C{obj_info} may be dropped from
+        the cache to respect it.
+        """
+        if size == 0:
+            self.clear()
+        else:
+            self._evict(size)
+        self._size = size
+
+    def get_cached(self):
+        """See `storm.store.Cache.get_cached`."""
+        return list(reversed(self._cache))
+
+    def get_usage(self):
+        """Return the estimated number of bytes used by the cached objects.
+        """
+        return self._usage
+
+    def _evict(self, size):
+        while self._usage > size and self._cache:
+            obj, obj_size = self._cache.popitem(last=False)[1]
+            self._usage -= obj_size
+
+    def _estimate_size(self, obj_info, obj):
+        """Estimate the number of bytes used by a cached object.
+
+        This accounts for the object, its info, and the values loaded
+        for its columns, without building any of its variables.
+        """
+        size = sys.getsizeof(obj) + sys.getsizeof(obj_info)
+        for value in obj_info.variables.get_loaded_values():
+            size += _estimate_value_size(value)
+        return size
@@ -27,9 +27,14 @@
 #define PyInt_FromLong PyLong_FromLong
 #define PyText_AsString _PyUnicode_AsString
 #define PyString_CheckExact(o) 0
+#define PyText_InternFromString PyUnicode_InternFromString
+#define PyBuffer_Check PyMemoryView_Check
+#define PyBytes_FromBuffer PyBytes_FromObject
 #else
 /* 2.x */
 #define PyText_AsString PyString_AsString
+#define PyText_InternFromString PyString_InternFromString
+#define PyBytes_FromBuffer PyObject_Str
 #endif
 
 #define CATCH(error_value, expression) \
@@ -59,11 +64,34 @@ static PyObject *CompileError = NULL;
 static PyObject *parenthesis_format = NULL;
 static PyObject *default_compile_join = NULL;
 
+/* Names of frequently called methods and events. */
+static PyObject *str_parse_get = NULL;
+static PyObject *str_parse_set = NULL;
+static PyObject *str_get_state = NULL;
+static PyObject *str_emit = NULL;
+static PyObject *str_changed = NULL;
+static PyObject *str_get_lazy = NULL;
+static PyObject *str_is_defined = NULL;
+static PyObject *str_set = NULL;
+static PyObject *str_get = NULL;
+static PyObject *str_checkpoint = NULL;
+static PyObject *str_set_variable = NULL;
+static PyObject *str_variable_factory = NULL;
+static PyObject *empty_tuple = NULL;
+
+/* Objects used when loading objects from rows, which are only available
+   once storm.store is imported.  See initialize_load_globals(). */
+static PyObject *AutoReload = NULL;
+static PyObject *default_set_variable = NULL;
+static PyObject *from_db_kwargs = NULL;
+static PyObject *to_db_kwargs = NULL;
+
 
 typedef struct {
     PyObject_HEAD
     PyObject *_owner_ref;
     PyObject *_hooks;
+    PyObject *_shared_hooks;
 } EventSystemObject;
 
 typedef struct {
@@ -202,6 +230,22 @@ initialize_globals(void)
     parenthesis_format = PyUnicode_DecodeASCII("(%s)", 4, "strict");
     default_compile_join = PyUnicode_DecodeASCII(", ", 2, "strict");
 
+    if (!(str_parse_get = PyText_InternFromString("parse_get")) ||
+        !(str_parse_set = PyText_InternFromString("parse_set")) ||
+        !(str_get_state = PyText_InternFromString("get_state")) ||
+        !(str_emit = PyText_InternFromString("emit")) ||
+        !(str_changed = PyText_InternFromString("changed")) ||
+        !(str_get_lazy = PyText_InternFromString("get_lazy")) ||
+        !(str_is_defined = PyText_InternFromString("is_defined")) ||
+        !(str_set = PyText_InternFromString("set")) ||
+        !(str_get = PyText_InternFromString("get")) ||
+        !(str_checkpoint = PyText_InternFromString("checkpoint")) ||
+        !(str_set_variable = PyText_InternFromString("set_variable")) ||
+        !(str_variable_factory =
+              PyText_InternFromString("variable_factory")) ||
+        !(empty_tuple = PyTuple_New(0)))
+        return 0;
+
     initialized = 1;
     return initialized;
 }
@@ -222,7 +266,9 @@ EventSystem_init(EventSystemObject *self, PyObject *args, PyObject *kwargs)
     if (self->_owner_ref) {
         /* self._hooks = {} */
         self->_hooks = PyDict_New();
-        if (self->_hooks) {
+        /* self._shared_hooks = () */
+        self->_shared_hooks = PyTuple_New(0);
+        if (self->_hooks && self->_shared_hooks) {
             result = 0;
         }
     }
@@ -235,6 +281,7 @@ EventSystem_traverse(EventSystemObject *self, visitproc visit, void *arg)
 {
     Py_VISIT(self->_owner_ref);
     Py_VISIT(self->_hooks);
+    Py_VISIT(self->_shared_hooks);
     return 0;
 }
 
@@ -243,6 +290,7 @@ EventSystem_clear(EventSystemObject *self)
 {
     Py_CLEAR(self->_owner_ref);
     Py_CLEAR(self->_hooks);
+    Py_CLEAR(self->_shared_hooks);
     return 0;
 }
 
@@ -353,6 +401,140 @@ EventSystem_unhook(EventSystemObject *self, PyObject *args)
     return result;
 }
 
+static PyObject *
+EventSystem_share(EventSystemObject *self, PyObject *hooks)
+{
+    PyObject *shared_hooks;
+    Py_ssize_t i, size = PyTuple_GET_SIZE(self->_shared_hooks);
+
+    /* Shared hooks are dispatched with objects from storm modules. */
+    if (!initialize_globals())
+        return NULL;
+
+    /*
+       for shared_hooks in self._shared_hooks:
+           if shared_hooks is hooks:
+               return
+    */
+    for (i = 0; i != size; i++) {
+        if (PyTuple_GET_ITEM(self->_shared_hooks, i) == hooks)
+            Py_RETURN_NONE;
+    }
+
+    /* self._shared_hooks += (hooks,) */
+    shared_hooks = PyTuple_New(size + 1);
+    if (!shared_hooks)
+        return NULL;
+    for (i = 0; i != size; i++) {
+        PyObject *item = PyTuple_GET_ITEM(self->_shared_hooks, i);
+        Py_INCREF(item);
+        PyTuple_SET_ITEM(shared_hooks, i, item);
+    }
+    Py_INCREF(hooks);
+    PyTuple_SET_ITEM(shared_hooks, size, hooks);
+    REPLACE(self->_shared_hooks, shared_hooks);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+EventSystem_unshare(EventSystemObject *self, PyObject *hooks)
+{
+    PyObject *shared_hooks;
+    Py_ssize_t i, j, count = 0, size = PyTuple_GET_SIZE(self->_shared_hooks);
+
+    for (i = 0; i != size; i++) {
+        if (PyTuple_GET_ITEM(self->_shared_hooks, i) == hooks)
+            count++;
+    }
+    if (count == 0)
+        Py_RETURN_NONE;
+
+    /*
+       self._shared_hooks = tuple(shared_hooks
+                                  for shared_hooks in self._shared_hooks
+                                  if shared_hooks is not hooks)
+    */
+    shared_hooks = PyTuple_New(size - count);
+    if (!shared_hooks)
+        return NULL;
+    for (i = 0, j = 0; i != size; i++) {
+        PyObject *item = PyTuple_GET_ITEM(self->_shared_hooks, i);
+        if (item != hooks) {
+            Py_INCREF(item);
+            PyTuple_SET_ITEM(shared_hooks, j++, item);
+        }
+    }
+    REPLACE(self->_shared_hooks, shared_hooks);
+    Py_RETURN_NONE;
+}
+
+static int
+EventSystem__emit_shared(EventSystemObject *self, PyObject *name,
+                         PyObject *owner, PyObject *args)
+{
+    /*
+       for shared_hooks in self._shared_hooks:
+           for callback in shared_hooks.get(name, ()):
+               callback(owner, *args)
+    */
+    PyObject *shared_hooks = self->_shared_hooks;
+    PyObject *owner_args = NULL;
+    PyObject *callbacks = NULL;
+    PyObject *callbacks_seq = NULL;
+    PyObject *res;
+    Py_ssize_t i, j;
+
+    /* Hold the tuple, since callbacks may share or unshare hooks. */
+    Py_INCREF(shared_hooks);
+    for (i = 0; i != PyTuple_GET_SIZE(shared_hooks); i++) {
+        PyObject *hooks = PyTuple_GET_ITEM(shared_hooks, i);
+        if (PyDict_CheckExact(hooks)) {
+            callbacks = PyDict_GetItem(hooks, name);
+            if (!callbacks)
+                continue;
+            Py_INCREF(callbacks);
+        } else {
+            CATCH(NULL, callbacks = PyObject_CallMethodObjArgs(
+                            hooks, str_get, name, empty_tuple, NULL));
+        }
+        CATCH(NULL, callbacks_seq = PySequence_Fast(callbacks,
+                                                    "shared callbacks must "
+                                                    "be a sequence"));
+        for (j = 0; j != PySequence_Fast_GET_SIZE(callbacks_seq); j++) {
+            if (owner_args == NULL) {
+                /* The owner and arguments are the same for all calls. */
+                Py_ssize_t k;
+                CATCH(NULL, owner_args =
+                                PyTuple_New(PyTuple_GET_SIZE(args) + 1));
+                Py_INCREF(owner);
+                PyTuple_SET_ITEM(owner_args, 0, owner);
+                for (k = 0; k != PyTuple_GET_SIZE(args); k++) {
+                    PyObject *item = PyTuple_GET_ITEM(args, k);
+                    Py_INCREF(item);
+                    PyTuple_SET_ITEM(owner_args, k + 1, item);
+                }
+            }
+            CATCH(NULL, res = PyObject_Call(
+                            PySequence_Fast_GET_ITEM(callbacks_seq, j),
+                            owner_args, NULL));
+            Py_DECREF(res);
+        }
+        Py_CLEAR(callbacks);
+        Py_CLEAR(callbacks_seq);
+    }
+
+    Py_DECREF(shared_hooks);
+    Py_XDECREF(owner_args);
+    return 0;
+
+error:
+    Py_DECREF(shared_hooks);
+    Py_XDECREF(owner_args);
+    Py_XDECREF(callbacks);
+    Py_XDECREF(callbacks_seq);
+    return -1;
+}
+
 static PyObject *
 EventSystem__do_emit_call(PyObject *callback, PyObject *owner,
                           PyObject *args, PyObject *data)
@@ -444,6 +626,10 @@ EventSystem_emit(EventSystemObject *self, PyObject *all_args)
                 Py_INCREF(Py_None);
                 result = Py_None;
             }
+            if (result && PyTuple_GET_SIZE(self->_shared_hooks) != 0 &&
+                EventSystem__emit_shared(self, name, owner, args) == -1) {
+                Py_CLEAR(result);
+            }
             Py_DECREF(owner);
         } else {
             Py_INCREF(Py_None);
@@ -459,6 +645,8 @@ EventSystem_emit(EventSystemObject *self, PyObject *all_args)
 static PyMethodDef EventSystem_methods[] = {
     {"hook", (PyCFunction)EventSystem_hook, METH_VARARGS, NULL},
     {"unhook", (PyCFunction)EventSystem_unhook, METH_VARARGS, NULL},
+    {"share", (PyCFunction)EventSystem_share, METH_O, NULL},
+    {"unshare", (PyCFunction)EventSystem_unshare, METH_O, NULL},
     {"emit", (PyCFunction)EventSystem_emit, METH_VARARGS, NULL},
     {NULL, NULL}
 };
@@ -467,6 +655,7 @@ static PyMethodDef EventSystem_methods[] = {
 static PyMemberDef EventSystem_members[] = {
     {"_object_ref", T_OBJECT, OFFSETOF(_owner_ref), READONLY, 0},
     {"_hooks", T_OBJECT, OFFSETOF(_hooks), READONLY, 0},
+    {"_shared_hooks", T_OBJECT, OFFSETOF(_shared_hooks), READONLY, 0},
     {NULL}
 };
 #undef OFFSETOF
@@ -515,6 +704,20 @@ static PyTypeObject EventSystem_Type = {
 };
 
 
+static int
+is_lazy_value(PyObject *value)
+{
+    /* isinstance(value, LazyValue), skipping the generic isinstance()
+       protocol for the plain values which are set most of the time. */
+    if (PyObject_TypeCheck(value, (PyTypeObject *)LazyValue))
+        return 1;
+    if (value == Py_None || PyUnicode_CheckExact(value) ||
+        PyBytes_CheckExact(value) || PyLong_CheckExact(value) ||
+        PyFloat_CheckExact(value) || PyBool_Check(value))
+        return 0;
+    return PyObject_IsInstance(value, LazyValue);
+}
+
 static PyObject *
 Variable_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
 {
@@ -578,16 +781,16 @@ Variable_init(VariableObject *self, PyObject *args, PyObject *kwargs)
     /* if value is not Undef: */
     if (value != Undef) {
         /* self.set(value, from_db) */
-        CATCH(NULL, tmp = PyObject_CallMethod((PyObject *)self,
-                                              "set", "OO", value, from_db));
+        CATCH(NULL, tmp = PyObject_CallMethodObjArgs((PyObject *)self, str_set,
+                                                     value, from_db, NULL));
         Py_DECREF(tmp);
     }
     /* elif value_factory is not Undef: */
     else if (value_factory != Undef) {
         /* self.set(value_factory(), from_db) */
         CATCH(NULL, value = PyObject_CallFunctionObjArgs(value_factory, NULL));
-        tmp = PyObject_CallMethod((PyObject *)self,
-                                  "set", "OO", value, from_db);
+        tmp = PyObject_CallMethodObjArgs((PyObject *)self, str_set,
+                                         value, from_db, NULL);
         Py_DECREF(value);
         CATCH(NULL, tmp);
         Py_DECREF(tmp);
@@ -742,8 +945,8 @@ Variable_get(VariableObject *self, PyObject *args, PyObject *kwargs)
     }
 
     /* return self.parse_get(value, to_db) */
-    return PyObject_CallMethod((PyObject *)self, "parse_get",
-                               "OO", self->_value, to_db);
+    return PyObject_CallMethodObjArgs((PyObject *)self, str_parse_get,
+                                      self->_value, to_db, NULL);
 
 error:
     return NULL;
@@ -758,6 +961,7 @@ Variable_set(VariableObject *self, PyObject *args, PyObject *kwargs)
     PyObject *old_value = NULL;
     PyObject *new_value = NULL;
     PyObject *tmp;
+    int lazy;
 
     if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|OO:set", kwlist,
                                      &value, &from_db))
@@ -766,7 +970,8 @@ Variable_set(VariableObject *self, PyObject *args, PyObject *kwargs)
     Py_INCREF(value);
 
     /* if isinstance(value, LazyValue): */
-    if (PyObject_IsInstance(value, LazyValue)) {
+    CATCH(-1, lazy = is_lazy_value(value));
+    if (lazy) {
         /* self._lazy_value = value */
         Py_INCREF(value);
         REPLACE(self->_lazy_value, value);
@@ -829,16 +1034,17 @@ Variable_set(VariableObject *self, PyObject *args, PyObject *kwargs)
         else {
             /* new_value = self.parse_set(value, from_db) */
             CATCH(NULL,
-                  new_value = PyObject_CallMethod((PyObject *)self, "parse_set",
-                                                  "OO", value, from_db));
+                  new_value = PyObject_CallMethodObjArgs(
+                      (PyObject *)self, str_parse_set, value, from_db, NULL));
 
             /* if from_db: */
             if (PyObject_IsTrue(from_db)) {
                 /* value = self.parse_get(new_value, False) */
                 Py_DECREF(value);
                 CATCH(NULL,
-                      value = PyObject_CallMethod((PyObject *)self, "parse_get",
-                                                  "OO", new_value, Py_False));
+                      value = PyObject_CallMethodObjArgs(
+                          (PyObject *)self, str_parse_get, new_value, Py_False,
+                          NULL));
             }
         }
     }
@@ -860,15 +1066,16 @@ Variable_set(VariableObject *self, PyObject *args, PyObject *kwargs)
         /* if old_value is not None and old_value is not Undef: */
         if (old_value != Py_None && old_value != Undef) {
             /* old_value = self.parse_get(old_value, False) */
-            CATCH(NULL, tmp = PyObject_CallMethod((PyObject *)self, "parse_get",
-                                                  "OO", old_value, Py_False));
+            CATCH(NULL, tmp = PyObject_CallMethodObjArgs(
+                            (PyObject *)self, str_parse_get, old_value,
+                            Py_False, NULL));
             Py_DECREF(old_value);
             old_value = tmp;
         }
         /* self.event.emit("changed", self, old_value, value, from_db) */
-        CATCH(NULL, tmp = PyObject_CallMethod((PyObject *)self->event, "emit",
-                                              "sOOOO", "changed", self,
-                                              old_value, value, from_db));
+        CATCH(NULL, tmp = PyObject_CallMethodObjArgs(
+                        self->event, str_emit, str_changed, (PyObject *)self,
+                        old_value, value, from_db, NULL));
         Py_DECREF(tmp);
     }
 
@@ -996,7 +1203,8 @@ static PyObject *
 Variable_checkpoint(VariableObject *self, PyObject *args)
 {
     /* self._checkpoint_state = self.get_state() */
-    PyObject *state = PyObject_CallMethod((PyObject *)self, "get_state", NULL);
+    PyObject *state = PyObject_CallMethodObjArgs((PyObject *)self,
+                                                 str_get_state, NULL);
     if (!state)
         return NULL;
     Py_DECREF(self->_checkpoint_state);
@@ -1775,6 +1983,540 @@ static PyTypeObject Compile_Type = {
 };
 
 
+typedef struct {
+    PyObject_HEAD
+    PyObject *_obj_info;
+    PyObject *_columns;
+    PyObject *_positions;
+    PyObject *_slots;
+} ObjectVariablesObject;
+
+static PyTypeObject ObjectVariables_Type;
+static PyTypeObject ObjectInfo_Type;
+
+static Py_ssize_t
+ObjectVariables_find(ObjectVariablesObject *self, PyObject *column,
+                     Py_ssize_t hint)
+{
+    /* Return the position of the column, or -1 if it's unknown, or -2
+       on errors.  The position at hint, if not -1, is tried first. */
+    PyObject *key, *position;
+    Py_ssize_t i;
+
+    if (hint != -1 && hint < PyTuple_GET_SIZE(self->_columns) &&
+        PyTuple_GET_ITEM(self->_columns, hint) == column)
+        return hint;
+
+    /* i = self._positions.get(id(column), -1) */
+    key = PyLong_FromVoidPtr(column);
+    if (!key)
+        return -2;
+    position = PyDict_GetItem(self->_positions, key);
+    Py_DECREF(key);
+    if (!position)
+        return -1;
+    i = PyNumber_AsSsize_t(position, PyExc_IndexError);
+    if (i == -1 && PyErr_Occurred())
+        return -2;
+    if (i < 0 || i >= PyTuple_GET_SIZE(self->_columns) ||
+        PyTuple_GET_ITEM(self->_columns, i) != column)
+        return -1;
+    return i;
+}
+
+static PyObject *
+ObjectVariables__create(ObjectVariablesObject *self, Py_ssize_t i)
+{
+    ObjectInfoObject *obj_info = (ObjectInfoObject *)self->_obj_info;
+    PyObject *column = PyTuple_GET_ITEM(self->_columns, i);
+    PyObject *value = PyList_GET_ITEM(self->_slots, i);
+    PyObject *kwargs = NULL;
+    PyObject *get_obj = NULL;
+    PyObject *factory = NULL;
+    PyObject *variable = NULL;
+    PyObject *tmp;
+    int lazy = 0;
+
+    if (value != Undef)
+        CATCH(-1, lazy = is_lazy_value(value));
+    CATCH(NULL, kwargs = PyDict_New());
+    CATCH(NULL, get_obj = PyObject_GetAttrString((PyObject *)obj_info,
+                                                 "get_obj"));
+    CATCH(-1, PyDict_SetItemString(kwargs, "column", column));
+    CATCH(-1, PyDict_SetItemString(kwargs, "event", obj_info->event));
+    CATCH(-1, PyDict_SetItemString(kwargs, "validator_object_factory",
+                                   get_obj));
+    if (value != Undef) {
+        /* Values given to the constructor don't emit events. */
+        CATCH(-1, PyDict_SetItemString(kwargs, "value", value));
+        CATCH(-1, PyDict_SetItemString(kwargs, "from_db", Py_True));
+    }
+
+    CATCH(NULL, factory = PyObject_GetAttr(column, str_variable_factory));
+    CATCH(NULL, variable = PyObject_Call(factory, empty_tuple, kwargs));
+
+    if (value != Undef && !lazy) {
+        /* variable.checkpoint() */
+        CATCH(NULL, tmp = PyObject_CallMethodObjArgs(variable, str_checkpoint,
+                                                     NULL));
+        Py_DECREF(tmp);
+    }
+
+    /* self._slots[i] = variable */
+    Py_INCREF(variable);
+    CATCH(-1, PyList_SetItem(self->_slots, i, variable));
+
+    Py_DECREF(kwargs);
+    Py_DECREF(get_obj);
+    Py_DECREF(factory);
+    return variable;
+
+error:
+    Py_XDECREF(kwargs);
+    Py_XDECREF(get_obj);
+    Py_XDECREF(factory);
+    Py_XDECREF(variable);
+    return NULL;
+}
+
+static PyObject *
+ObjectVariables_get_variable(ObjectVariablesObject *self, Py_ssize_t i)
+{
+    PyObject *variable = PyList_GET_ITEM(self->_slots, i);
+    if (PyObject_TypeCheck(variable, &Variable_Type)) {
+        Py_INCREF(variable);
+        return variable;
+    }
+    return ObjectVariables__create(self, i);
+}
+
+static int
+ObjectVariables_init(ObjectVariablesObject *self, PyObject *args)
+{
+    PyObject *obj_info;
+    PyObject *cls_info = NULL;
+    PyObject *eager_variables_pos = NULL;
+    PyObject *eager_seq = NULL;
+    Py_ssize_t i, size;
+
+    if (!PyArg_ParseTuple(args, "O!", &ObjectInfo_Type, &obj_info))
+        return -1;
+
+    CATCH(0, initialize_globals());
+
+    Py_INCREF(obj_info);
+    Py_XSETREF(self->_obj_info, obj_info);
+
+    /* self._slots = [Undef] * len(cls_info.columns) */
+    cls_info = ((ObjectInfoObject *)obj_info)->cls_info;
+    Py_INCREF(cls_info);
+    Py_XSETREF(self->_columns, PyObject_GetAttrString(cls_info, "columns"));
+    if (!self->_columns)
+        goto error;
+    if (!PyTuple_Check(self->_columns)) {
+        PyErr_SetString(PyExc_TypeError, "columns must be a tuple");
+        goto error;
+    }
+    Py_XSETREF(self->_positions,
+               PyObject_GetAttrString(cls_info, "column_positions"));
+    if (!self->_positions)
+        goto error;
+    if (!PyDict_Check(self->_positions)) {
+        PyErr_SetString(PyExc_TypeError, "column_positions must be a dict");
+        goto error;
+    }
+    size = PyTuple_GET_SIZE(self->_columns);
+    Py_XSETREF(self->_slots, PyList_New(size));
+    if (!self->_slots)
+        goto error;
+    for (i = 0; i != size; i++) {
+        Py_INCREF(Undef);
+        PyList_SET_ITEM(self->_slots, i, Undef);
+    }
+
+    /* for i in cls_info.eager_variables_pos:
+           self._create(i) */
+    CATCH(NULL, eager_variables_pos =
+                    PyObject_GetAttrString(cls_info, "eager_variables_pos"));
+    CATCH(NULL, eager_seq = PySequence_Fast(eager_variables_pos,
+                                            "eager_variables_pos must be a "
+                                            "sequence"));
+    for (i = 0; i != PySequence_Fast_GET_SIZE(eager_seq); i++) {
+        PyObject *variable;
+        Py_ssize_t pos = PyNumber_AsSsize_t(
+            PySequence_Fast_GET_ITEM(eager_seq, i), PyExc_IndexError);
+        if (pos == -1 && PyErr_Occurred())
+            goto error;
+        if (pos < 0 || pos >= size) {
+            PyErr_SetString(PyExc_IndexError, "column position out of range");
+            goto error;
+        }
+        CATCH(NULL, variable = ObjectVariables__create(self, pos));
+        Py_DECREF(variable);
+    }
+
+    Py_DECREF(cls_info);
+    Py_DECREF(eager_variables_pos);
+    Py_DECREF(eager_seq);
+    return 0;
+
+error:
+    Py_XDECREF(cls_info);
+    Py_XDECREF(eager_variables_pos);
+    Py_XDECREF(eager_seq);
+    return -1;
+}
+
+static PyObject *
+ObjectVariables_subscript(ObjectVariablesObject *self, PyObject *column)
+{
+    Py_ssize_t i = ObjectVariables_find(self, column, -1);
+    if (i < 0) {
+        if (i == -1)
+            PyErr_SetObject(PyExc_KeyError, column);
+        return NULL;
+    }
+    return ObjectVariables_get_variable(self, i);
+}
+
+static Py_ssize_t
+ObjectVariables_length(ObjectVariablesObject *self)
+{
+    return PyList_GET_SIZE(self->_slots);
+}
+
+static int
+ObjectVariables_contains(ObjectVariablesObject *self, PyObject *column)
+{
+    Py_ssize_t i = ObjectVariables_find(self, column, -1);
+    if (i == -2)
+        return -1;
+    return i != -1;
+}
+
+static PyObject *
+ObjectVariables_iter(ObjectVariablesObject *self)
+{
+    return PyObject_GetIter(self->_columns);
+}
+
+static PyObject *
+ObjectVariables_get(ObjectVariablesObject *self, PyObject *args)
+{
+    PyObject *column, *default_ = Py_None;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTuple(args, "O|O:get", &column, &default_))
+        return NULL;
+
+    i = ObjectVariables_find(self, column, -1);
+    if (i == -2)
+        return NULL;
+    if (i == -1) {
+        Py_INCREF(default_);
+        return default_;
+    }
+    return ObjectVariables_get_variable(self, i);
+}
+
+static PyObject *
+ObjectVariables_keys(ObjectVariablesObject *self, PyObject *args)
+{
+    return PySequence_List(self->_columns);
+}
+
+static PyObject *
+ObjectVariables_values(ObjectVariablesObject *self, PyObject *args)
+{
+    Py_ssize_t i, size = PyList_GET_SIZE(self->_slots);
+    PyObject *result, *variable;
+
+    CATCH(NULL, result = PyList_New(size));
+    for (i = 0; i != size; i++) {
+        variable = ObjectVariables_get_variable(self, i);
+        if (!variable) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, variable);
+    }
+    return result;
+
+error:
+    return NULL;
+}
+
+static PyObject *
+ObjectVariables_items(ObjectVariablesObject *self, PyObject *args)
+{
+    Py_ssize_t i, size = PyList_GET_SIZE(self->_slots);
+    PyObject *result, *variable, *item;
+
+    CATCH(NULL, result = PyList_New(size));
+    for (i = 0; i != size; i++) {
+        variable = ObjectVariables_get_variable(self, i);
+        if (!variable) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        item = PyTuple_Pack(2, PyTuple_GET_ITEM(self->_columns, i), variable);
+        Py_DECREF(variable);
+        if (!item) {
+            Py_DECREF(result);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, item);
+    }
+    return result;
+
+error:
+    return NULL;
+}
+
+static PyObject *
+ObjectVariables_get_lazy(ObjectVariablesObject *self, PyObject *column)
+{
+    PyObject *variable;
+    Py_ssize_t i = ObjectVariables_find(self, column, -1);
+
+    if (i < 0) {
+        if (i == -1)
+            PyErr_SetObject(PyExc_KeyError, column);
+        return NULL;
+    }
+    variable = PyList_GET_ITEM(self->_slots, i);
+    if (PyObject_TypeCheck(variable, &Variable_Type))
+        return PyObject_CallMethodObjArgs(variable, str_get_lazy, NULL);
+    if (variable != Undef) {
+        int lazy = is_lazy_value(variable);
+        if (lazy == -1)
+            return NULL;
+        if (lazy) {
+            Py_INCREF(variable);
+            return variable;
+        }
+    }
+    Py_RETURN_NONE;
+}
+
+static int
+ObjectVariables__load_value(ObjectVariablesObject *self, Py_ssize_t i,
+                            PyObject *value, int keep_defined)
+{
+    /* Set the slot, returning whether the variable was built instead,
+       or -1 on errors. */
+    PyObject *variable = PyList_GET_ITEM(self->_slots, i);
+
+    if (PyObject_TypeCheck(variable, &Variable_Type))
+        return 1;
+    if (keep_defined && variable != Undef) {
+        int lazy = is_lazy_value(variable);
+        if (lazy == -1)
+            return -1;
+        if (!lazy)
+            return 0;
+    }
+    Py_INCREF(value);
+    PyList_SetItem(self->_slots, i, value);
+    return 0;
+}
+
+static PyObject *
+ObjectVariables_load_value(ObjectVariablesObject *self, PyObject *args,
+                           PyObject *kwargs)
+{
+    static char *kwlist[] = {"column", "value", "keep_defined", NULL};
+    PyObject *column, *value, *keep_defined = Py_False;
+    Py_ssize_t i;
+    int keep, loaded;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|O:load_value", kwlist,
+                                     &column, &value, &keep_defined))
+        return NULL;
+
+    i = ObjectVariables_find(self, column, -1);
+    if (i < 0) {
+        if (i == -1)
+            PyErr_SetObject(PyExc_KeyError, column);
+        return NULL;
+    }
+    if ((keep = PyObject_IsTrue(keep_defined)) == -1)
+        return NULL;
+    if ((loaded = ObjectVariables__load_value(self, i, value, keep)) == -1)
+        return NULL;
+    if (loaded) {
+        PyObject *variable = PyList_GET_ITEM(self->_slots, i);
+        Py_INCREF(variable);
+        return variable;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+ObjectVariables_get_loaded_values(ObjectVariablesObject *self, PyObject *args)
+{
+    Py_ssize_t i, size = PyList_GET_SIZE(self->_slots);
+    PyObject *values, *variable;
+
+    /*
+       values = []
+       for variable in self._slots:
+           if isinstance(variable, Variable):
+               variable = variable._value
+           values.append(variable)
+    */
+    values = PyList_New(size);
+    if (!values)
+        return NULL;
+    for (i = 0; i != size; i++) {
+        variable = PyList_GET_ITEM(self->_slots, i);
+        if (PyObject_TypeCheck(variable, &Variable_Type))
+            variable = ((VariableObject *)variable)->_value;
+        Py_INCREF(variable);
+        PyList_SET_ITEM(values, i, variable);
+    }
+    return values;
+}
+
+static PyObject *
+ObjectVariables_checkpoint(ObjectVariablesObject *self, PyObject *args)
+{
+    PyObject *variable, *tmp;
+    Py_ssize_t i;
+
+    /* for variable in self._slots:
+           if isinstance(variable, Variable):
+               variable.checkpoint() */
+    for (i = 0; i != PyList_GET_SIZE(self->_slots); i++) {
+        variable = PyList_GET_ITEM(self->_slots, i);
+        if (PyObject_TypeCheck(variable, &Variable_Type)) {
+            CATCH(NULL, tmp = PyObject_CallMethodObjArgs(
+                            variable, str_checkpoint, NULL));
+            Py_DECREF(tmp);
+        }
+    }
+    Py_RETURN_NONE;
+
+error:
+    return NULL;
+}
+
+static int
+ObjectVariables_traverse(ObjectVariablesObject *self, visitproc visit,
+                         void *arg)
+{
+    Py_VISIT(self->_obj_info);
+    Py_VISIT(self->_columns);
+    Py_VISIT(self->_positions);
+    Py_VISIT(self->_slots);
+    return 0;
+}
+
+static int
+ObjectVariables_clear(ObjectVariablesObject *self)
+{
+    Py_CLEAR(self->_obj_info);
+    Py_CLEAR(self->_columns);
+    Py_CLEAR(self->_positions);
+    Py_CLEAR(self->_slots);
+    return 0;
+}
+
+static void
+ObjectVariables_dealloc(ObjectVariablesObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    ObjectVariables_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyMethodDef ObjectVariables_methods[] = {
+    {"get", (PyCFunction)ObjectVariables_get, METH_VARARGS, NULL},
+    {"keys", (PyCFunction)ObjectVariables_keys, METH_NOARGS, NULL},
+    {"values", (PyCFunction)ObjectVariables_values, METH_NOARGS, NULL},
+    {"items", (PyCFunction)ObjectVariables_items, METH_NOARGS, NULL},
+#if PY_VERSION_HEX < 0x03000000
+    {"iterkeys", (PyCFunction)ObjectVariables_iter, METH_NOARGS, NULL},
+#endif
+    {"get_lazy", (PyCFunction)ObjectVariables_get_lazy, METH_O, NULL},
+    {"load_value", (PyCFunction)ObjectVariables_load_value,
+        METH_VARARGS | METH_KEYWORDS, NULL},
+    {"get_loaded_values", (PyCFunction)ObjectVariables_get_loaded_values,
+        METH_NOARGS, NULL},
+    {"checkpoint", (PyCFunction)ObjectVariables_checkpoint, METH_NOARGS,
+        NULL},
+    {NULL, NULL}
+};
+
+#define OFFSETOF(x) offsetof(ObjectVariablesObject, x)
+static PyMemberDef ObjectVariables_members[] = {
+    {"_obj_info", T_OBJECT, OFFSETOF(_obj_info), READONLY, 0},
+    {"_slots", T_OBJECT, OFFSETOF(_slots), READONLY, 0},
+    {NULL}
+};
+#undef OFFSETOF
+
+static PyMappingMethods ObjectVariables_as_mapping = {
+    (lenfunc)ObjectVariables_length, /*mp_length*/
+    (binaryfunc)ObjectVariables_subscript, /*mp_subscript*/
+    0,                      /*mp_ass_subscript*/
+};
+
+static PySequenceMethods ObjectVariables_as_sequence = {
+    0,                      /*sq_length*/
+    0,                      /*sq_concat*/
+    0,                      /*sq_repeat*/
+    0,                      /*sq_item*/
+    0,                      /*sq_slice*/
+    0,                      /*sq_ass_item*/
+    0,                      /*sq_ass_slice*/
+    (objobjproc)ObjectVariables_contains, /*sq_contains*/
+};
+
+static PyTypeObject ObjectVariables_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "storm.info.ObjectVariables", /*tp_name*/
+    sizeof(ObjectVariablesObject), /*tp_basicsize*/
+    0,                      /*tp_itemsize*/
+    (destructor)ObjectVariables_dealloc, /*tp_dealloc*/
+    0,                      /*tp_print*/
+    0,                      /*tp_getattr*/
+    0,                      /*tp_setattr*/
+    0,                      /*tp_compare*/
+    0,                      /*tp_repr*/
+    0,                      /*tp_as_number*/
+    &ObjectVariables_as_sequence, /*tp_as_sequence*/
+    &ObjectVariables_as_mapping, /*tp_as_mapping*/
+    0,                      /*tp_hash*/
+    0,                      /*tp_call*/
+    0,                      /*tp_str*/
+    0,                      /*tp_getattro*/
+    0,                      /*tp_setattro*/
+    0,                      /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT|Py_TPFLAGS_HAVE_GC, /*tp_flags*/
+    0,                      /*tp_doc*/
+    (traverseproc)ObjectVariables_traverse, /*tp_traverse*/
+    (inquiry)ObjectVariables_clear, /*tp_clear*/
+    0,                      /*tp_richcompare*/
+    0,                      /*tp_weaklistoffset*/
+    (getiterfunc)ObjectVariables_iter, /*tp_iter*/
+    0,                      /*tp_iternext*/
+    ObjectVariables_methods, /*tp_methods*/
+    ObjectVariables_members, /*tp_members*/
+    0,                      /*tp_getset*/
+    0,                      /*tp_base*/
+    0,                      /*tp_dict*/
+    0,                      /*tp_descr_get*/
+    0,                      /*tp_descr_set*/
+    0,                      /*tp_dictoffset*/
+    (initproc)ObjectVariables_init, /*tp_init*/
+    0,                      /*tp_alloc*/
+    0,                      /*tp_new*/
+    0,                      /*tp_free*/
+    0,                      /*tp_is_gc*/
+};
+
+
 static PyObject *
 ObjectInfo__emit_object_deleted(ObjectInfoObject *self, PyObject *args)
 {
@@ -1789,10 +2531,7 @@ static PyMethodDef ObjectInfo_deleted_callback =
 static int
 ObjectInfo_init(ObjectInfoObject *self, PyObject *args)
 {
-    PyObject *self_get_obj = NULL;
     PyObject *empty_args = NULL;
-    PyObject *factory_kwargs = NULL;
-    PyObject *columns = NULL;
     PyObject *primary_key = NULL;
     PyObject *obj;
     Py_ssize_t i;
@@ -1823,39 +2562,9 @@ ObjectInfo_init(ObjectInfoObject *self, PyObject *args)
     CATCH(NULL,
           self->event = PyObject_CallFunctionObjArgs(EventSystem, self, NULL));
 
-    /* self->variables = variables = {} */
-    CATCH(NULL, self->variables = PyDict_New());
-
-    CATCH(NULL, self_get_obj = PyObject_GetAttrString((PyObject *)self,
-                                                      "get_obj"));
-    CATCH(NULL, factory_kwargs = PyDict_New());
-    CATCH(-1, PyDict_SetItemString(factory_kwargs, "event", self->event));
-    CATCH(-1, PyDict_SetItemString(factory_kwargs, "validator_object_factory",
-                                   self_get_obj));
-
-    /* for column in self.cls_info.columns: */
-    CATCH(NULL, columns = PyObject_GetAttrString(self->cls_info, "columns"));
-    for (i = 0; i != PyTuple_GET_SIZE(columns); i++) {
-        /*
-           variables[column] = \
-               column.variable_factory(column=column,
-                                       event=event,
-                                       validator_object_factory=self.get_obj)
-        */
-        PyObject *column = PyTuple_GET_ITEM(columns, i);
-        PyObject *variable, *factory;
-        CATCH(-1, PyDict_SetItemString(factory_kwargs, "column", column));
-        CATCH(NULL, factory = PyObject_GetAttrString(column,
-                                                     "variable_factory"));
-        variable = PyObject_Call(factory, empty_args, factory_kwargs);
-        Py_DECREF(factory);
-        CATCH(NULL, variable);
-        if (PyDict_SetItem(self->variables, column, variable) == -1) {
-            Py_DECREF(variable);
-            goto error;
-        }
-        Py_DECREF(variable);
-    }
+    /* self.variables = variables = ObjectVariables(self) */
+    CATCH(NULL, self->variables = PyObject_CallFunctionObjArgs(
+                    (PyObject *)&ObjectVariables_Type, self, NULL));
 
     /* self.primary_vars = tuple(variables[column]
                                  for column in self.cls_info.primary_key) */
@@ -1867,23 +2576,17 @@ ObjectInfo_init(ObjectInfoObject *self, PyObject *args)
           self->primary_vars = PyTuple_New(PyTuple_GET_SIZE(primary_key)));
     for (i = 0; i != PyTuple_GET_SIZE(primary_key); i++) {
         PyObject *column = PyTuple_GET_ITEM(primary_key, i);
-        PyObject *variable = PyDict_GetItem(self->variables, column);
-        Py_INCREF(variable);
+        PyObject *variable;
+        CATCH(NULL, variable = PyObject_GetItem(self->variables, column));
         PyTuple_SET_ITEM(self->primary_vars, i, variable);
     }
 
-    Py_DECREF(self_get_obj);
     Py_DECREF(empty_args);
-    Py_DECREF(factory_kwargs);
-    Py_DECREF(columns);
     Py_DECREF(primary_key);
     return 0;
 
 error:
-    Py_XDECREF(self_get_obj);
     Py_XDECREF(empty_args);
-    Py_XDECREF(factory_kwargs);
-    Py_XDECREF(columns);
     Py_XDECREF(primary_key);
     return -1;
 }
@@ -1916,18 +2619,8 @@ ObjectInfo_set_obj(ObjectInfoObject *self, PyObject *args)
 static PyObject *
 ObjectInfo_checkpoint(ObjectInfoObject *self, PyObject *args)
 {
-    PyObject *column, *variable, *tmp;
-    Py_ssize_t i = 0;
-
-    /* for variable in self.variables.itervalues(): */
-    while (PyDict_Next(self->variables, &i, &column, &variable)) {
-        /* variable.checkpoint() */
-        CATCH(NULL, tmp = PyObject_CallMethod(variable, "checkpoint", NULL));
-        Py_DECREF(tmp);
-    }
-    Py_RETURN_NONE;
-error:
-    return NULL;
+    /* self.variables.checkpoint() */
+    return PyObject_CallMethodObjArgs(self->variables, str_checkpoint, NULL);
 }
 
 static PyObject *
@@ -2100,8 +2793,410 @@ get_obj_info(PyObject *self, PyObject *obj)
 }
 
 
+static int
+initialize_load_globals(void)
+{
+    static int initialized = -1;
+    PyObject *module, *Result;
+
+    if (initialized >= 0) {
+        if (!initialized)
+            PyErr_SetString(PyExc_RuntimeError,
+                            "initialize_load_globals() failed the first "
+                            "time it was run");
+        return initialized;
+    }
+    initialized = 0;
+
+    if (!initialize_globals())
+        return 0;
+
+    /* Import objects from storm.store module */
+    module = PyImport_ImportModule("storm.store");
+    if (!module)
+        return 0;
+
+    AutoReload = PyObject_GetAttrString(module, "AutoReload");
+    if (!AutoReload)
+        return 0;
+
+    Py_DECREF(module);
+
+    /* Import objects from storm.database module */
+    module = PyImport_ImportModule("storm.database");
+    if (!module)
+        return 0;
+
+    Result = PyObject_GetAttrString(module, "Result");
+    if (!Result)
+        return 0;
+
+    default_set_variable = PyObject_GetAttrString(Result, "set_variable");
+    if (!default_set_variable)
+        return 0;
+
+    Py_DECREF(Result);
+    Py_DECREF(module);
+
+    if (!(from_db_kwargs = PyDict_New()) ||
+        PyDict_SetItemString(from_db_kwargs, "from_db", Py_True) == -1 ||
+        !(to_db_kwargs = PyDict_New()) ||
+        PyDict_SetItemString(to_db_kwargs, "to_db", Py_True) == -1)
+        return 0;
+
+    initialized = 1;
+    return initialized;
+}
+
+static int
+has_own_method(PyObject *variable, PyObject *name)
+{
+    /* Whether the given method of the variable is the one implemented
+       here, in which case its logic may be inlined. */
+    return (PyObject_TypeCheck(variable, &Variable_Type) &&
+            _PyType_Lookup(Py_TYPE(variable), name) ==
+                _PyType_Lookup(&Variable_Type, name));
+}
+
+static PyObject *
+call_variable_method(PyObject *variable, PyObject *name,
+                     PyObject *args, PyObject *kwargs)
+{
+    PyObject *method, *result;
+
+    CATCH(NULL, method = PyObject_GetAttr(variable, name));
+    result = PyObject_Call(method, args, kwargs);
+    Py_DECREF(method);
+    return result;
+
+error:
+    return NULL;
+}
+
+static PyObject *
+get_primary_values(PyObject *self, PyObject *args)
+{
+    PyObject *columns, *primary_key_pos, *values;
+    PyObject *values_seq = NULL;
+    PyObject *pos_seq = NULL;
+    PyObject *kwargs = NULL;
+    PyObject *primary_values = NULL;
+    PyObject *column = NULL;
+    PyObject *factory = NULL;
+    PyObject *variable = NULL;
+    Py_ssize_t i, size;
+
+    if (!PyArg_ParseTuple(args, "OOO:_get_primary_values", &columns,
+                          &primary_key_pos, &values))
+        return NULL;
+
+    CATCH(0, initialize_load_globals());
+
+    CATCH(NULL, values_seq = PySequence_Fast(values,
+                                             "values must be a sequence"));
+
+    /*
+       for value in values:
+           if value is not None:
+               break
+       else:
+           return None
+    */
+    size = PySequence_Fast_GET_SIZE(values_seq);
+    for (i = 0; i != size; i++) {
+        if (PySequence_Fast_GET_ITEM(values_seq, i) != Py_None)
+            break;
+    }
+    if (i == size) {
+        Py_DECREF(values_seq);
+        Py_RETURN_NONE;
+    }
+
+    CATCH(NULL, pos_seq = PySequence_Fast(primary_key_pos,
+                                          "primary_key_pos must be a "
+                                          "sequence"));
+    CATCH(NULL, kwargs = PyDict_New());
+    CATCH(-1, PyDict_SetItemString(kwargs, "from_db", Py_True));
+
+    size = PySequence_Fast_GET_SIZE(pos_seq);
+    CATCH(NULL, primary_values = PyTuple_New(size));
+    for (i = 0; i != size; i++) {
+        PyObject *primary_value;
+        Py_ssize_t pos;
+
+        pos = PyNumber_AsSsize_t(PySequence_Fast_GET_ITEM(pos_seq, i),
+                                 PyExc_IndexError);
+        if (pos == -1 && PyErr_Occurred())
+            goto error;
+        if (pos < 0 || pos >= PySequence_Fast_GET_SIZE(values_seq)) {
+            PyErr_SetString(PyExc_IndexError, "tuple index out of range");
+            goto error;
+        }
+
+        /*
+           variable = columns[pos].variable_factory(value=values[pos],
+                                                    from_db=True)
+        */
+        CATCH(NULL, column = PySequence_GetItem(columns, pos));
+        CATCH(NULL, factory = PyObject_GetAttr(column, str_variable_factory));
+        CATCH(-1, PyDict_SetItemString(kwargs, "value",
+                  PySequence_Fast_GET_ITEM(values_seq, pos)));
+        CATCH(NULL, variable = PyObject_Call(factory, empty_tuple, kwargs));
+
+        /* primary_values[i] = variable.get(to_db=True) */
+        if (has_own_method(variable, str_get)) {
+            primary_value = Variable_get((VariableObject *)variable,
+                                         empty_tuple, to_db_kwargs);
+        } else {
+            primary_value = call_variable_method(variable, str_get,
+                                                 empty_tuple, to_db_kwargs);
+        }
+        CATCH(NULL, primary_value);
+        PyTuple_SET_ITEM(primary_values, i, primary_value);
+
+        Py_CLEAR(column);
+        Py_CLEAR(factory);
+        Py_CLEAR(variable);
+    }
+
+    Py_DECREF(values_seq);
+    Py_DECREF(pos_seq);
+    Py_DECREF(kwargs);
+    return primary_values;
+
+error:
+    Py_XDECREF(values_seq);
+    Py_XDECREF(pos_seq);
+    Py_XDECREF(kwargs);
+    Py_XDECREF(primary_values);
+    Py_XDECREF(column);
+    Py_XDECREF(factory);
+    Py_XDECREF(variable);
+    return NULL;
+}
+
+static PyObject *
+set_column_values(PyObject *self, PyObject *args)
+{
+    PyObject *variables, *columns, *result, *values;
+    int keep_defined = 0;
+    int replace_unknown_lazy = 0;
+    PyObject *columns_seq = NULL;
+    PyObject *values_seq = NULL;
+    PyObject *set_variable = NULL;
+    PyObject *variable = NULL;
+    PyObject *value_args = NULL;
+    PyObject *tmp;
+    Py_ssize_t i, size;
+
+    if (!PyArg_ParseTuple(args, "OOOO|ii:_set_column_values", &variables,
+                          &columns, &result, &values, &keep_defined,
+                          &replace_unknown_lazy))
+        return NULL;
+
+    CATCH(0, initialize_load_globals());
+
+    CATCH(NULL, columns_seq = PySequence_Fast(columns,
+                                              "columns must be a sequence"));
+    CATCH(NULL, values_seq = PySequence_Fast(values,
+                                             "values must be a sequence"));
+
+    /* Results which don't customize set_variable() just set the value
+       on the variable, and that's done inline below. */
+    CATCH(NULL, set_variable = PyObject_GetAttr(result, str_set_variable));
+    if (set_variable == default_set_variable)
+        Py_CLEAR(set_variable);
+
+    /* for column, value in zip(columns, values): */
+    size = PySequence_Fast_GET_SIZE(columns_seq);
+    if (PySequence_Fast_GET_SIZE(values_seq) < size)
+        size = PySequence_Fast_GET_SIZE(values_seq);
+    for (i = 0; i != size; i++) {
+        PyObject *column = PySequence_Fast_GET_ITEM(columns_seq, i);
+        PyObject *value = PySequence_Fast_GET_ITEM(values_seq, i);
+        PyObject *lazy_value;
+        int is_unknown_lazy;
+
+        if (Py_TYPE(variables) == &ObjectVariables_Type) {
+            ObjectVariablesObject *object_variables =
+                (ObjectVariablesObject *)variables;
+            /* Values usually come in the order of the columns. */
+            Py_ssize_t pos = ObjectVariables_find(object_variables, column,
+                                                  i);
+            if (pos < 0) {
+                if (pos == -1)
+                    PyErr_SetObject(PyExc_KeyError, column);
+                goto error;
+            }
+            /*
+               if load_values or value is None:
+                   variable = variables.load_value(column, value,
+                                                   keep_defined)
+                   if variable is None:
+                       continue
+               else:
+                   variable = variables[column]
+            */
+            if (set_variable == NULL || value == Py_None) {
+                int loaded;
+                CATCH(-1, loaded = ObjectVariables__load_value(
+                                object_variables, pos, value, keep_defined));
+                if (!loaded)
+                    continue;
+            }
+            CATCH(NULL, variable = ObjectVariables_get_variable(
+                            object_variables, pos));
+        } else if (PyDict_CheckExact(variables)) {
+            /* variable = variables[column] */
+            variable = PyDict_GetItem(variables, column);
+            if (!variable) {
+                PyErr_SetObject(PyExc_KeyError, column);
+                goto error;
+            }
+            Py_INCREF(variable);
+        } else {
+            CATCH(NULL, variable = PyObject_GetItem(variables, column));
+        }
+
+        /*
+           lazy_value = variable.get_lazy()
+           is_unknown_lazy = not (lazy_value is None or
+                                  lazy_value is AutoReload)
+        */
+        if (has_own_method(variable, str_get_lazy)) {
+            lazy_value = ((VariableObject *)variable)->_lazy_value;
+            is_unknown_lazy = !(lazy_value == Undef ||
+                                lazy_value == Py_None ||
+                                lazy_value == AutoReload);
+        } else {
+            CATCH(NULL, lazy_value = PyObject_CallMethodObjArgs(
+                            variable, str_get_lazy, NULL));
+            is_unknown_lazy = !(lazy_value == Py_None ||
+                                lazy_value == AutoReload);
+            Py_DECREF(lazy_value);
+        }
+
+        if (keep_defined) {
+            /*
+               if variable.is_defined() or is_unknown_lazy:
+                   continue
+            */
+            int is_defined;
+            if (has_own_method(variable, str_is_defined)) {
+                is_defined = ((VariableObject *)variable)->_value != Undef;
+            } else {
+                CATCH(NULL, tmp = PyObject_CallMethodObjArgs(
+                                variable, str_is_defined, NULL));
+                is_defined = PyObject_IsTrue(tmp);
+                Py_DECREF(tmp);
+                CATCH(-1, is_defined);
+            }
+            if (is_defined || is_unknown_lazy) {
+                Py_CLEAR(variable);
+                continue;
+            }
+        } else if (is_unknown_lazy && !replace_unknown_lazy) {
+            /* See the comment in Store._set_values(). */
+            PyErr_SetString(PyExc_RuntimeError,
+                            "Unexpected situation. "
+                            "Please contact the developers.");
+            goto error;
+        }
+
+        if (value == Py_None || set_variable == NULL) {
+            /* variable.set(value, from_db=True) */
+            CATCH(NULL, value_args = PyTuple_Pack(1, value));
+            if (has_own_method(variable, str_set)) {
+                tmp = Variable_set((VariableObject *)variable, value_args,
+                                   from_db_kwargs);
+            } else {
+                tmp = call_variable_method(variable, str_set, value_args,
+                                           from_db_kwargs);
+            }
+            Py_CLEAR(value_args);
+        } else {
+            /* result.set_variable(variable, value) */
+            tmp = PyObject_CallFunctionObjArgs(set_variable, variable, value,
+                                               NULL);
+        }
+        CATCH(NULL, tmp);
+        Py_DECREF(tmp);
+
+        /* variable.checkpoint() */
+        if (has_own_method(variable, str_checkpoint)) {
+            tmp = Variable_checkpoint((VariableObject *)variable, NULL);
+        } else {
+            tmp = PyObject_CallMethodObjArgs(variable, str_checkpoint, NULL);
+        }
+        CATCH(NULL, tmp);
+        Py_DECREF(tmp);
+
+        Py_CLEAR(variable);
+    }
+
+    Py_DECREF(columns_seq);
+    Py_DECREF(values_seq);
+    Py_XDECREF(set_variable);
+    Py_RETURN_NONE;
+
+error:
+    Py_XDECREF(columns_seq);
+    Py_XDECREF(values_seq);
+    Py_XDECREF(set_variable);
+    Py_XDECREF(variable);
+    Py_XDECREF(value_args);
+    return NULL;
+}
+
+static PyObject *
+convert_buffers(PyObject *self, PyObject *row)
+{
+    PyObject *row_seq = NULL;
+    PyObject *result = NULL;
+    Py_ssize_t i, size;
+
+    CATCH(NULL, row_seq = PySequence_Fast(row, "row must be a sequence"));
+    size = PySequence_Fast_GET_SIZE(row_seq);
+
+    /* Rows rarely have buffers in them, so avoid copying those. */
+    for (i = 0; i != size; i++) {
+        if (PyBuffer_Check(PySequence_Fast_GET_ITEM(row_seq, i)))
+            break;
+    }
+    if (i == size) {
+        result = PySequence_Tuple(row_seq);
+        Py_DECREF(row_seq);
+        return result;
+    }
+
+    CATCH(NULL, result = PyTuple_New(size));
+    for (i = 0; i != size; i++) {
+        PyObject *value = PySequence_Fast_GET_ITEM(row_seq, i);
+        if (PyBuffer_Check(value)) {
+            /* bstr(value) */
+            CATCH(NULL, value = PyBytes_FromBuffer(value));
+        } else {
+            Py_INCREF(value);
+        }
+        PyTuple_SET_ITEM(result, i, value);
+    }
+    Py_DECREF(row_seq);
+    return result;
+
+error:
+    Py_XDECREF(row_seq);
+    Py_XDECREF(result);
+    return NULL;
+}
+
+
 static PyMethodDef cextensions_methods[] = {
     {"get_obj_info", (PyCFunction)get_obj_info, METH_O, NULL},
+    {"_get_primary_values", (PyCFunction)get_primary_values,
+        METH_VARARGS, NULL},
+    {"_set_column_values", (PyCFunction)set_column_values,
+        METH_VARARGS, NULL},
+    {"_convert_buffers", (PyCFunction)convert_buffers, METH_O, NULL},
     {NULL, NULL}
 };
 
@@ -2133,6 +3228,7 @@ do_init(PyObject *module)
     ObjectInfo_Type.tp_base = &PyDict_Type;
     ObjectInfo_Type.tp_hash = (hashfunc)_Py_HashPointer;
     prepare_type(&ObjectInfo_Type);
+    prepare_type(&ObjectVariables_Type);
     prepare_type(&Variable_Type);
 
     Py_INCREF(&Variable_Type);
@@ -2145,6 +3241,7 @@ do_init(PyObject *module)
 
     REGISTER_TYPE(Variable);
     REGISTER_TYPE(ObjectInfo);
+    REGISTER_TYPE(ObjectVariables);
     REGISTER_TYPE(Compile);
     REGISTER_TYPE(EventSystem);
     return 0;
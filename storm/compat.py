@@ -19,13 +19,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import functools
+import inspect
 import sys
 
+from storm import Undef
+
 
 __all__ = [
     "add_metaclass",
     "buffer",
     "bstr",
+    "get_parameters",
     "is_python2",
     "iter_range",
     "iter_items",
@@ -114,6 +119,59 @@ try:
 except ImportError:
     buffer = memoryview
 
+if version >= (3, 0):
+    def get_parameters(func):
+        """Get the parameters of a callable.
+
+        @raises TypeError: Raised if C{func} takes variable parameters.
+        @return: A list of C{(name, keyword_only, default)} tuples, where
+            C{default} is C{Undef} for parameters without one.
+        """
+        parameters = []
+        for name, parameter in inspect.signature(func).parameters.items():
+            if parameter.kind in (parameter.VAR_POSITIONAL,
+                                  parameter.VAR_KEYWORD):
+                raise TypeError("%r takes variable parameters" % (func,))
+            if parameter.default is parameter.empty:
+                default = Undef
+            else:
+                default = parameter.default
+            parameters.append(
+                (name, parameter.kind == parameter.KEYWORD_ONLY, default))
+        return parameters
+else:
+    def get_parameters(func):
+        """Get the parameters of a callable.
+
+        @raises TypeError: Raised if C{func} takes variable parameters.
+        @return: A list of C{(name, keyword_only, default)} tuples, where
+            C{default} is C{Undef} for parameters without one.
+        """
+        if isinstance(func, functools.partial):
+            parameters = get_parameters(func.func)[len(func.args or ()):]
+            keywords = func.keywords or {}
+            return [(name, keyword_only or name in keywords,
+                     keywords.get(name, default))
+                    for name, keyword_only, default in parameters]
+        if inspect.ismethod(func):
+            parameters = get_parameters(func.__func__)
+            if func.__self__ is not None:
+                del parameters[:1]
+            return parameters
+        if not inspect.isfunction(func):
+            call = getattr(func, "__call__", None)
+            if call is None or not inspect.ismethod(call):
+                raise TypeError("%r is not a supported callable" % (func,))
+            return get_parameters(call)
+        spec = inspect.getargspec(func)
+        if spec.varargs is not None or spec.keywords is not None:
+            raise TypeError("%r takes variable parameters" % (func,))
+        defaults = spec.defaults or ()
+        defaults = (Undef,) * (len(spec.args) - len(defaults)) + defaults
+        return [(name, False, default)
+                for name, default in zip(spec.args, defaults)]
+
+
 def add_metaclass(metaclass):
     """
     Class decorator for creating a class with a metaclass. Shamelessly copied
@@ -25,13 +25,16 @@ This is the common code for database support; specific databases are
 supported in modules in L{storm.databases}.
 """
 
+from decimal import Decimal
 from importlib import import_module
 
-from storm.compat import iter_range, string_types, ustr
-from storm.expr import Expr, State, compile
+from storm.compat import iter_range, long_int, string_types, ustr
+from storm.expr import Expr, SQL, State, compile
 # Circular import: imported at the end of the module.
 # from storm.tracer import trace
-from storm.variables import Variable
+from storm.variables import (
+    Variable, BoolVariable, IntVariable, FloatVariable, DecimalVariable,
+    UnicodeVariable)
 from storm.xid import Xid
 from storm.exceptions import (
     ClosedError, ConnectionBlockedError, DatabaseError, DisconnectionError,
@@ -44,6 +47,17 @@ __all__ = ["Database", "Connection", "Result",
            "convert_param_marks", "create_database", "register_scheme"]
 
 
+# Variable classes mapped to the types of database values that they
+# store and return unchanged.
+_UNCONVERTED_TYPES = {
+    BoolVariable: (bool,),
+    IntVariable: (int, long_int),
+    FloatVariable: (float,),
+    DecimalVariable: (Decimal,),
+    UnicodeVariable: (ustr,),
+}
+
+
 STATE_CONNECTED = 1
 STATE_DISCONNECTED = 2
 STATE_RECONNECT = 3
@@ -150,6 +164,40 @@ class Result(object):
         """Set the given variable's value from the database."""
         variable.set(value, from_db=True)
 
+    def get_converter(self, variable_factory):
+        """Get a callable converting database values for a column.
+
+        Calling it is equivalent to setting a variable created by
+        C{variable_factory} with L{set_variable} and getting its value
+        back, but values whose type needs no conversion are returned
+        right away, without touching the variable.
+
+        @param variable_factory: The C{variable_factory} of a column.
+        @return: The callable, or C{None} if every value can be used
+            as it comes from the database.
+        """
+        variable = variable_factory()
+        set_variable = self.set_variable
+        if type(variable) is Variable:
+            if variable._allow_none:
+                return None
+            unconverted_types = None
+        else:
+            unconverted_types = _UNCONVERTED_TYPES.get(type(variable), ())
+            if variable._allow_none:
+                unconverted_types += (type(None),)
+
+        def convert(value):
+            if unconverted_types is None:
+                if value is not None:
+                    return value
+            elif type(value) in unconverted_types:
+                return value
+            set_variable(variable, value)
+            return variable.get()
+
+        return convert
+
     @staticmethod
     def from_database(row):
         """Convert a row fetched from the database to an agnostic format.
@@ -173,11 +221,16 @@ class Connection(object):
     @cvar param_mark: The dbapi paramstyle that the database backend expects.
     @type compile: L{storm.expr.Compile}
     @cvar compile: The compiler to use for connections of this type.
+    @type max_parameters: C{int}
+    @cvar max_parameters: The maximum number of parameters which may be
+        bound in a single statement, or C{None} if the backend imposes
+        no practical limit.
     """
 
     result_factory = Result
     param_mark = "?"
     compile = compile
+    max_parameters = None
 
     _blocked = False
     _closed = False
@@ -189,6 +242,7 @@ class Connection(object):
         self._database = database # Ensures deallocation order.
         self._event = event
         self._raw_connection = self._database.raw_connect()
+        self._compiled_statements = {}
 
     def __del__(self):
         """Close the connection."""
@@ -247,6 +301,101 @@ class Connection(object):
             return None
         return self.result_factory(self, raw_cursor)
 
+    def compile_cached(self, key, build, variables):
+        """Get a statement whose SQL is compiled only once per C{key}.
+
+        The first time a key is seen, C{build(variables)} is compiled,
+        and the positions at which the given variables are bound are
+        remembered.  Later calls reuse the same SQL, binding the new
+        variables in their place, without building or compiling the
+        statement again.
+
+        C{build} must return statements with the same shape for every
+        call with the same key, only differing by the given variables.
+
+        @param key: A hashable value identifying the statement shape.
+        @param build: A callable taking C{variables} and returning an
+            L{Expr}.
+        @param variables: A sequence of L{Variable}s to bind.
+        @return: An L{Expr} which can be given to L{execute}.
+        """
+        cached = self._compiled_statements.get(key)
+        if cached is None:
+            state = State()
+            statement = self.compile(build(variables), state)
+            positions = dict((id(variable), position)
+                             for position, variable in enumerate(variables))
+            params = list(state.parameters)
+            slots = []
+            for index, param in enumerate(params):
+                position = positions.get(id(param))
+                if position is not None:
+                    slots.append((index, position))
+                    params[index] = None
+            if len(set(position for index, position in slots)) < len(
+                variables):
+                # Some variable wasn't bound as a parameter, so the SQL
+                # may depend on its value.
+                cached = False
+            else:
+                cached = (statement, params, slots)
+            self._compiled_statements[key] = cached
+            return SQL(statement, state.parameters)
+        if cached is False:
+            return build(variables)
+        statement, params, slots = cached
+        params = list(params)
+        for index, position in slots:
+            params[index] = variables[position]
+        return SQL(statement, params)
+
+    def execute_streaming(self, statement, params=None, batch_size=1000):
+        """Execute a query whose rows are fetched as they're iterated.
+
+        This is like L{execute}, but rows are fetched from the database
+        C{batch_size} at a time when iterating the result.  Backends
+        able to keep the pending rows on the server rather than in
+        client memory, like PostgreSQL, do so.
+
+        @return: The result of C{self.result_factory}.
+        """
+        result = self.execute(statement, params)
+        result._raw_cursor.arraysize = batch_size
+        return result
+
+    def execute_many(self, statements):
+        """Execute several statements which return no results.
+
+        Consecutive statements which compile to the same SQL are run
+        together with L{raw_execute_many}, so that backends able to do
+        so may send them to the database at once, saving a round trip
+        for each of them.
+
+        @param statements: A sequence of L{Expr} statements.
+        """
+        if self._closed:
+            raise ClosedError("Connection is closed")
+        if self._blocked:
+            raise ConnectionBlockedError("Access to connection is blocked")
+        if self._event:
+            self._event.emit("register-transaction")
+        self._ensure_connected()
+        groups = []
+        for statement in statements:
+            state = State()
+            statement = convert_param_marks(self.compile(statement, state),
+                                            "?", self.param_mark)
+            if groups and groups[-1][0] == statement:
+                groups[-1][1].append(state.parameters)
+            else:
+                groups.append((statement, [state.parameters]))
+        for statement, params_list in groups:
+            if len(params_list) == 1:
+                raw_cursor = self.raw_execute(statement, params_list[0])
+            else:
+                raw_cursor = self.raw_execute_many(statement, params_list)
+            self._check_disconnect(raw_cursor.close)
+
     def close(self):
         """Close the connection if it is not already closed."""
         if not self._closed:
@@ -377,6 +526,40 @@ class Connection(object):
         self._run_execution(raw_cursor, args, params, statement)
         return raw_cursor
 
+    def raw_execute_many(self, statement, params_list):
+        """Execute a raw statement once for each set of parameters.
+
+        Like L{raw_execute}, it's acceptable to override this method in
+        subclasses, but it is not intended to be called externally.
+        Each set of parameters is traced as a separate execution.
+
+        @return: The dbapi cursor object, as fetched from L{build_raw_cursor}.
+        """
+        raw_cursor = self._check_disconnect(self.build_raw_cursor)
+        for params in params_list:
+            self._prepare_execution(raw_cursor, params, statement)
+        raw_params_list = [tuple(self.to_database(params))
+                           for params in params_list]
+        try:
+            self._check_disconnect(self._run_execution_many, raw_cursor,
+                                   statement, raw_params_list)
+        except Exception as error:
+            for params in params_list:
+                self._check_disconnect(
+                    trace, "connection_raw_execute_error", self, raw_cursor,
+                    statement, params, error)
+            raise
+        else:
+            for params in params_list:
+                self._check_disconnect(
+                    trace, "connection_raw_execute_success", self,
+                    raw_cursor, statement, params)
+        return raw_cursor
+
+    def _run_execution_many(self, raw_cursor, statement, raw_params_list):
+        """Run a statement with several sets of database parameters."""
+        raw_cursor.executemany(statement, raw_params_list)
+
     def _execution_args(self, params, statement):
         """Get the appropriate statement execution arguments."""
         if params:
@@ -19,18 +19,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from collections import OrderedDict
 from datetime import datetime, date, time, timedelta
 import json
+import re
 
 from storm.databases import dummy
 
 try:
     import psycopg2
     import psycopg2.extensions
+    import psycopg2.extras
 except ImportError:
     psycopg2 = dummy
 
-from storm.compat import bstr, iter_zip, ustr
+from storm.compat import bstr, iter_zip, string_types, ustr
 from storm.expr import (
     Undef, Expr, SetExpr, Select, Insert, Alias, And, Eq, FuncExpr, SQLRaw,
     Sequence, Like, SQLToken, BinaryOper, COLUMN, COLUMN_NAME, COLUMN_PREFIX,
@@ -39,16 +42,22 @@ from storm.expr import (
 from storm.variables import (
     Variable, ListVariable, JSONVariable as BaseJSONVariable)
 from storm.properties import SimpleProperty
-from storm.database import Database, Connection, Result
+from storm.database import Database, Connection, Result, STATE_RECONNECT
 from storm.exceptions import (
-    install_exceptions, DatabaseError, DatabaseModuleError, InterfaceError,
-    OperationalError, ProgrammingError, TimeoutError, Error)
+    install_exceptions, DatabaseError, DatabaseModuleError, DisconnectionError,
+    InterfaceError, OperationalError, ProgrammingError, TimeoutError, Error)
 
 
 install_exceptions(psycopg2)
 compile = compile.create_child()
 
 
+# Statements which may be run through PREPARE and EXECUTE.
+_preparable_statement = re.compile(
+    r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+_param_mark = re.compile(r"%[s%]")
+
+
 class Returning(Expr):
     """Appends the "RETURNING <columns>" suffix to an INSERT or UPDATE.
 
@@ -268,6 +277,19 @@ class PostgresConnection(Connection):
     result_factory = PostgresResult
     param_mark = "%s"
     compile = compile
+    # The wire protocol counts parameters with a 16-bit integer.
+    max_parameters = 65535
+    _streaming = False
+    _stream_count = 0
+    _prepare_count = 0
+
+    def __init__(self, database, event=None):
+        super(PostgresConnection, self).__init__(database, event)
+        # How many times each statement ran with each combination of
+        # parameter types, or False for those which can't be prepared.
+        self._statement_counts = {} # (statement, types) = count
+        # Names of the prepared statements, least recently used first.
+        self._prepared_statements = OrderedDict()
 
     def execute(self, statement, params=None, noresult=False):
         """Execute a statement with the given parameters.
@@ -279,12 +301,17 @@ class PostgresConnection(Connection):
         if (isinstance(statement, Insert) and
             self._database._version >= 80200 and
             statement.primary_variables is not Undef and
-            statement.primary_columns is not Undef):
+            statement.primary_columns is not Undef and
+            (statement.values is Undef or
+             isinstance(statement.values, Expr))):
 
             # Here we decorate the Insert statement with a Returning
             # expression, so that we get back in the result the values
             # for the primary key just inserted.  This prevents a round
             # trip to the database for obtaining these values.
+            #
+            # Multi-row inserts are left alone, since the order of the
+            # rows returned isn't guaranteed to follow the VALUES list.
 
             result = Connection.execute(self, Returning(statement), params)
             for variable, value in iter_zip(statement.primary_variables,
@@ -294,6 +321,159 @@ class PostgresConnection(Connection):
 
         return Connection.execute(self, statement, params, noresult)
 
+    def execute_streaming(self, statement, params=None, batch_size=1000):
+        """Execute a query whose rows are kept on the server until fetched.
+
+        This extends L{Connection.execute_streaming} to run the query
+        through a named (server-side) cursor, from which rows are fetched
+        C{batch_size} at a time.  The cursor lives until the end of the
+        transaction, so the result can't be iterated after a commit or
+        rollback.
+        """
+        self._streaming = True
+        try:
+            return Connection.execute_streaming(self, statement, params,
+                                                batch_size)
+        finally:
+            self._streaming = False
+
+    def raw_execute(self, statement, params=None):
+        """Execute a raw statement with the given parameters.
+
+        When the C{prepare_threshold} URI option is set, statements
+        with parameters which were run that many times on this
+        connection are prepared on the server, and from then on run
+        with C{EXECUTE}, so that they're no longer planned every time.
+        """
+        if (self._database._prepare_threshold and params and
+            not self._streaming):
+            name = self._get_prepared_name(statement, params)
+            if name is not None:
+                statement = "EXECUTE %s (%s)" % (
+                    name, ", ".join(["%s"] * len(params)))
+        return Connection.raw_execute(self, statement, params)
+
+    def _get_prepared_name(self, statement, params):
+        """Get the name of the prepared statement for C{statement}.
+
+        Statements are prepared separately for each combination of
+        parameter types they're run with, since the plan is typed after
+        the parameters of the first run.
+
+        @param params: The parameters the statement is run with, which
+            are checked against the types the server gives to them when
+            preparing it.
+        @return: The name, or C{None} if the statement isn't prepared.
+        """
+        params = list(self.to_database(params))
+        key = (statement, tuple(type(param) for param in params))
+        prepared_statements = self._prepared_statements
+        name = prepared_statements.pop(key, None)
+        if name is not None:
+            prepared_statements[key] = name
+            return name
+        count = self._statement_counts.get(key, 0)
+        if count is False:
+            return None
+        if count + 1 < self._database._prepare_threshold:
+            if len(self._statement_counts) >= 10 * self._database._prepare_size:
+                # Don't let statements seen only a few times pile up.
+                self._statement_counts.clear()
+            self._statement_counts[key] = count + 1
+            return None
+        if ";" in statement or not _preparable_statement.match(statement):
+            self._statement_counts[key] = False
+            return None
+
+        if len(prepared_statements) >= self._database._prepare_size:
+            old_key, old_name = prepared_statements.popitem(last=False)
+            Connection.raw_execute(self, "DEALLOCATE %s" % old_name)
+        self._prepare_count += 1
+        name = "storm_prepared_%d" % self._prepare_count
+        positions = iter(range(1, statement.count("%s") + 1))
+        prepare = "PREPARE %s AS %s" % (name, _param_mark.sub(
+            lambda match: "%" if match.group() == "%%"
+            else "$%d" % next(positions), statement))
+        if self._raw_connection.autocommit:
+            savepoint = None
+        else:
+            # A failure must not abort the ongoing transaction.  If the
+            # transaction is already aborted, this fails just like the
+            # statement itself would.
+            savepoint = "storm_prepare"
+            Connection.raw_execute(self, "SAVEPOINT %s" % savepoint)
+            prepare += "; RELEASE SAVEPOINT %s" % savepoint
+        prepare += ("; SELECT parameter_types::text[] "
+                    "FROM pg_prepared_statements WHERE name = '%s'" % name)
+        try:
+            raw_cursor = Connection.raw_execute(self, prepare)
+            parameter_types = raw_cursor.fetchone()[0]
+        except Exception as exc:
+            if (isinstance(exc, DisconnectionError) or
+                not isinstance(exc, Error)):
+                raise
+            if savepoint is not None:
+                try:
+                    Connection.raw_execute(
+                        self, "ROLLBACK TO SAVEPOINT %s; RELEASE SAVEPOINT %s"
+                        % (savepoint, savepoint))
+                except Error:
+                    # Whatever went wrong, the original error says more.
+                    raise exc
+            # The server couldn't prepare it, e.g. because it can't tell
+            # the type of a parameter, so it will keep being run as is.
+            self._statement_counts[key] = False
+            return None
+        for parameter_type, param in iter_zip(parameter_types, params):
+            if (parameter_type in ("text", "unknown") and
+                param is not None and not isinstance(param, string_types)):
+                # The type came from nothing but the parameter not being
+                # quoted, so values would come back as strings, unlike
+                # when they're given in the query.
+                Connection.raw_execute(self, "DEALLOCATE %s" % name)
+                self._statement_counts[key] = False
+                return None
+        self._statement_counts.pop(key, None)
+        prepared_statements[key] = name
+        return name
+
+    def _ensure_connected(self):
+        if self._state == STATE_RECONNECT:
+            # Prepared statements are lost with the old connection, so
+            # they're prepared again the next time they're run.
+            threshold = self._database._prepare_threshold
+            for key in self._prepared_statements:
+                self._statement_counts[key] = threshold - 1
+            self._prepared_statements.clear()
+        Connection._ensure_connected(self)
+
+    def build_raw_cursor(self):
+        if not self._streaming:
+            return Connection.build_raw_cursor(self)
+        self._stream_count += 1
+        # Named cursors need a transaction, unless they're held past it,
+        # which is the only option in autocommit mode.
+        return self._raw_connection.cursor(
+            "storm_stream_%d" % self._stream_count,
+            withhold=self._raw_connection.autocommit)
+
+    def raw_execute_many(self, statement, params_list):
+        """Execute a raw statement once for each set of parameters.
+
+        Statements are sent in pages with C{psycopg2.extras.execute_batch},
+        rather than in a round trip each.  They're run through C{EXECUTE}
+        under the same conditions as in L{raw_execute}.
+        """
+        if self._database._prepare_threshold and params_list[0]:
+            name = self._get_prepared_name(statement, params_list[0])
+            if name is not None:
+                statement = "EXECUTE %s (%s)" % (
+                    name, ", ".join(["%s"] * len(params_list[0])))
+        return Connection.raw_execute_many(self, statement, params_list)
+
+    def _run_execution_many(self, raw_cursor, statement, raw_params_list):
+        psycopg2.extras.execute_batch(raw_cursor, statement, raw_params_list)
+
     def to_database(self, params):
         """
         Like L{Connection.to_database}, but this converts datetime types
@@ -362,6 +542,8 @@ class Postgres(Database):
         if psycopg2 is dummy:
             raise DatabaseModuleError("psycopg2>=2.5 not found")
         self._dsn = make_dsn(uri)
+        self._prepare_threshold = int(uri.options.get("prepare_threshold", 0))
+        self._prepare_size = int(uri.options.get("prepare_size", 100))
         isolation = uri.options.get("isolation", "repeatable-read")
         isolation_mapping = {
             "autocommit": psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT,
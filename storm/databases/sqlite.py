@@ -22,6 +22,7 @@ from datetime import datetime, date, time, timedelta
 from time import sleep, time as now
 import sys
 
+from storm import has_cextensions
 from storm.compat import buffer
 from storm.databases import dummy
 
@@ -38,8 +39,8 @@ from storm.variables import Variable, RawStrVariable
 from storm.database import Database, Connection, Result
 from storm.exceptions import install_exceptions, DatabaseModuleError
 from storm.expr import (
-    Insert, Select, SELECT, Undef, SQLRaw, Union, Except, Intersect,
-    compile, compile_insert, compile_select)
+    EXPR, Insert, Row, Select, SELECT, Undef, SQLRaw, Union, Except,
+    Intersect, compile, compile_insert, compile_select)
 
 
 install_exceptions(sqlite)
@@ -68,6 +69,14 @@ def compile_select_sqlite(compile, select, state):
 # Considering the above, selects have a greater precedence.
 compile.set_precedence(5, Union, Except, Intersect)
 
+@compile.when(Row)
+def compile_row_sqlite(compile, row, state):
+    # SQLite supports row values, but not the ROW keyword.
+    state.push("context", EXPR)
+    args = compile(row.args, state)
+    state.pop()
+    return "(%s)" % args
+
 @compile.when(Insert)
 def compile_insert_sqlite(compile, insert, state):
     # SQLite fails with INSERT INTO table VALUES (), so we transform
@@ -77,6 +86,23 @@ def compile_insert_sqlite(compile, insert, state):
     return compile_insert(compile, insert, state)
 
 
+def _convert_buffers(row):
+    """Convert SQLite-specific datatypes to "normal" Python types.
+
+    If there are anny C{buffer} instances in the row, convert them
+    to strings.
+    """
+    for value in row:
+        if isinstance(value, buffer):
+            yield bstr(value)
+        else:
+            yield value
+
+
+if has_cextensions:
+    from storm.cextensions import _convert_buffers
+
+
 class SQLiteResult(Result):
 
     def get_insert_identity(self, primary_key, primary_variables):
@@ -93,24 +119,15 @@ class SQLiteResult(Result):
                 value = bstr(value)
         variable.set(value, from_db=True)
 
-    @staticmethod
-    def from_database(row):
-        """Convert SQLite-specific datatypes to "normal" Python types.
-
-        If there are anny C{buffer} instances in the row, convert them
-        to strings.
-        """
-        for value in row:
-            if isinstance(value, buffer):
-                yield bstr(value)
-            else:
-                yield value
+    from_database = staticmethod(_convert_buffers)
 
 
 class SQLiteConnection(Connection):
 
     result_factory = SQLiteResult
     compile = compile
+    # SQLITE_MAX_VARIABLE_NUMBER defaults to 999 before SQLite 3.32.0.
+    max_parameters = 999
     _in_transaction = False
 
     @staticmethod
@@ -149,6 +166,15 @@ class SQLiteConnection(Connection):
         versions < 2.3.4, so we make sure the timeout is respected
         here.
         """
+        return self._retry_locked(Connection.raw_execute,
+                                  (statement, params), _end)
+
+    def raw_execute_many(self, statement, params_list):
+        """Like L{raw_execute}, for several sets of parameters."""
+        return self._retry_locked(Connection.raw_execute_many,
+                                  (statement, params_list))
+
+    def _retry_locked(self, execute, args, _end=False):
         if _end:
             self._in_transaction = False
         elif not self._in_transaction:
@@ -162,7 +188,7 @@ class SQLiteConnection(Connection):
         started = now()
         while True:
             try:
-                return Connection.raw_execute(self, statement, params)
+                return execute(self, *args)
             except sqlite.OperationalError as e:
                 if ustr(e) != "database is locked":
                     raise
@@ -27,10 +27,20 @@ __all__ = ["EventSystem"]
 
 
 class EventSystem(object):
+    """Dispatch named events to the callbacks hooked into them.
+
+    Callbacks are usually hooked into a single event system.  Those
+    which listen to the events of many owners in the same way may
+    instead be kept in a dict of shared hooks, mapping event names to
+    tuples of callbacks, and attached to each event system with
+    L{share}.  That keeps owners from carrying hook sets of their own
+    for such listeners.
+    """
 
     def __init__(self, owner):
         self._owner_ref = weakref.ref(owner)
         self._hooks = {}
+        self._shared_hooks = ()
 
     def hook(self, name, callback, *data):
         callbacks = self._hooks.get(name)
@@ -44,6 +54,27 @@ class EventSystem(object):
         if callbacks is not None:
             callbacks.discard((callback, data))
 
+    def share(self, hooks):
+        """Also dispatch events to the given shared hooks.
+
+        Shared callbacks are called with the owner and the emitted
+        arguments, after the callbacks hooked into this event system.
+        Unlike those, they aren't unhooked by returning C{False}.
+
+        @param hooks: A dict mapping event names to tuples of callbacks.
+            It's used by identity, and sharing it again has no effect.
+        """
+        for shared_hooks in self._shared_hooks:
+            if shared_hooks is hooks:
+                return
+        self._shared_hooks += (hooks,)
+
+    def unshare(self, hooks):
+        """Stop dispatching events to the given shared hooks."""
+        self._shared_hooks = tuple(shared_hooks
+                                   for shared_hooks in self._shared_hooks
+                                   if shared_hooks is not hooks)
+
     def emit(self, name, *args):
         owner = self._owner_ref()
         if owner is not None:
@@ -52,6 +83,9 @@ class EventSystem(object):
                 for callback, data in tuple(callbacks):
                     if callback(owner, *(args+data)) is False:
                         callbacks.discard((callback, data))
+            for shared_hooks in self._shared_hooks:
+                for callback in shared_hooks.get(name, ()):
+                    callback(owner, *args)
 
 
 if has_cextensions:
@@ -20,16 +20,17 @@
 #
 from weakref import ref
 
-from storm.compat import iter_values, string_types
+from storm.compat import is_python2, string_types
 from storm.exceptions import ClassInfoError
 from storm.expr import Column, Desc, TABLE
 from storm.expr import compile, Table
 from storm.event import EventSystem
+from storm.variables import Variable, LazyValue
 from storm import Undef, has_cextensions
 
 
 __all__ = ["get_obj_info", "set_obj_info", "get_cls_info",
-           "ClassInfo", "ObjectInfo", "ClassAlias"]
+           "ClassInfo", "ObjectInfo", "ObjectVariables", "ClassAlias"]
 
 
 def get_obj_info(obj):
@@ -65,6 +66,17 @@ class ClassInfo(dict):
     @ivar columns: Tuple of column properties found in the class.
     @ivar primary_key: Tuple of column properties used to form the primary key
     @ivar primary_key_pos: Position of primary_key items in the columns tuple.
+    @ivar lazy_columns: Tuple of the columns declared with C{lazy=True},
+        which are only loaded when first accessed.
+    @ivar loaded_columns: Tuple of the columns loaded along with objects,
+        that is, all of them but the lazy ones.
+    @ivar loaded_primary_key_pos: Position of primary_key items in the
+        loaded_columns tuple.
+    @ivar column_positions: Position of each column in the columns
+        tuple, keyed by the column's C{id()}.
+    @ivar eager_variables_pos: Position of the columns whose variables
+        are built along with the L{ObjectInfo} rather than when first
+        accessed.
     """
 
     def __init__(self, cls):
@@ -118,12 +130,50 @@ class ClassInfo(dict):
         id_positions = dict((id(column), i)
                              for i, column in enumerate(self.columns))
 
+        self.column_positions = id_positions
+
         self.primary_key_idx = dict((id(column), i)
                                     for i, column in
                                     enumerate(self.primary_key))
         self.primary_key_pos = tuple(id_positions[id(column)]
                                      for column in self.primary_key)
 
+        self.lazy_columns = tuple(column for column in self.columns
+                                  if getattr(column, "lazy", False))
+        if self.lazy_columns:
+            for column in self.primary_key:
+                if getattr(column, "lazy", False):
+                    raise ClassInfoError("%s has a lazy primary key column: "
+                                         "%s" % (repr(cls), column.name))
+            self.loaded_columns = tuple(column for column in self.columns
+                                        if not getattr(column, "lazy", False))
+            loaded_positions = dict((id(column), i) for i, column in
+                                    enumerate(self.loaded_columns))
+            self.loaded_primary_key_pos = tuple(
+                loaded_positions[id(column)] for column in self.primary_key)
+        else:
+            self.loaded_columns = self.columns
+            self.loaded_primary_key_pos = self.primary_key_pos
+
+        # Variables are built when first accessed, unless building them
+        # does more than holding a value: defaults must be computed when
+        # the object is created, variable classes with their own
+        # constructor may hook into the object's events, and those with
+        # their own get_lazy() expect to be asked before values are loaded.
+        eager_variables_pos = set(self.primary_key_pos)
+        for i, column in enumerate(self.columns):
+            factory = column.variable_factory
+            variable_class = getattr(factory, "func", None)
+            keywords = getattr(factory, "keywords", None) or {}
+            if (not isinstance(variable_class, type) or
+                not issubclass(variable_class, Variable) or
+                variable_class.__init__ is not Variable.__init__ or
+                variable_class.get_lazy is not Variable.get_lazy or
+                keywords.get("value", Undef) is not Undef or
+                keywords.get("value_factory", Undef) is not Undef):
+                eager_variables_pos.add(i)
+        self.eager_variables_pos = tuple(sorted(eager_variables_pos))
+
         __order__ = getattr(cls, "__storm_order__", None)
         if __order__ is None:
             self.default_order = Undef
@@ -165,14 +215,8 @@ class ObjectInfo(dict):
 
         self.set_obj(obj)
 
-        self.event = event = EventSystem(self)
-        self.variables = variables = {}
-
-        for column in self.cls_info.columns:
-            variables[column] = \
-                column.variable_factory(column=column,
-                                        event=event,
-                                        validator_object_factory=self.get_obj)
+        self.event = EventSystem(self)
+        self.variables = variables = ObjectVariables(self)
 
         self.primary_vars = tuple(variables[column]
                                   for column in self.cls_info.primary_key)
@@ -193,12 +237,150 @@ class ObjectInfo(dict):
         self.event.emit("object-deleted")
 
     def checkpoint(self):
-        for variable in iter_values(self.variables):
-            variable.checkpoint()
+        self.variables.checkpoint()
+
+
+class ObjectVariables(object):
+    """The variables of an object, by column.
+
+    This is a read-only mapping from the columns of the object's class
+    to their L{Variable}s.  Variables are kept in a list following
+    L{ClassInfo.columns}, and most of them are only built when first
+    accessed.  Until then, their slot holds C{Undef}, a value loaded
+    from the database, or a L{LazyValue} such as C{AutoReload}.
+    """
+
+    __slots__ = ("_obj_info", "_positions", "_slots")
+
+    def __init__(self, obj_info):
+        # FASTPATH This method is part of the fast path.  Be careful when
+        #          changing it (try to profile any changes).
+        cls_info = obj_info.cls_info
+        self._obj_info = obj_info
+        self._positions = cls_info.column_positions
+        self._slots = [Undef] * len(cls_info.columns)
+        for i in cls_info.eager_variables_pos:
+            self._create(i)
+
+    def _create(self, i):
+        obj_info = self._obj_info
+        column = obj_info.cls_info.columns[i]
+        value = self._slots[i]
+        if value is Undef:
+            variable = column.variable_factory(
+                column=column, event=obj_info.event,
+                validator_object_factory=obj_info.get_obj)
+        else:
+            # Values given to the constructor don't emit events.
+            variable = column.variable_factory(
+                value=value, from_db=True, column=column, event=obj_info.event,
+                validator_object_factory=obj_info.get_obj)
+            if not isinstance(value, LazyValue):
+                variable.checkpoint()
+        self._slots[i] = variable
+        return variable
+
+    def __getitem__(self, column):
+        # FASTPATH This method is part of the fast path.  Be careful when
+        #          changing it (try to profile any changes).
+        try:
+            i = self._positions[id(column)]
+        except KeyError:
+            raise KeyError(column)
+        variable = self._slots[i]
+        if isinstance(variable, Variable):
+            return variable
+        return self._create(i)
+
+    def get(self, column, default=None):
+        if id(column) in self._positions:
+            return self[column]
+        return default
+
+    def __contains__(self, column):
+        return id(column) in self._positions
+
+    def __iter__(self):
+        return iter(self._obj_info.cls_info.columns)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def keys(self):
+        return list(self._obj_info.cls_info.columns)
+
+    def values(self):
+        return [self[column] for column in self._obj_info.cls_info.columns]
+
+    def items(self):
+        return [(column, self[column])
+                for column in self._obj_info.cls_info.columns]
+
+    if is_python2:
+        iterkeys = __iter__
+
+        def itervalues(self):
+            return iter(self.values())
+
+        def iteritems(self):
+            return iter(self.items())
+
+    def get_lazy(self, column):
+        """Get the lazy value of a column, without building its variable.
+
+        @return: The L{LazyValue} the column's variable is set to, or
+            C{None}.
+        """
+        variable = self._slots[self._positions[id(column)]]
+        if isinstance(variable, Variable):
+            return variable.get_lazy()
+        if isinstance(variable, LazyValue):
+            return variable
+        return None
+
+    def load_value(self, column, value, keep_defined=False):
+        """Set a column to a value without building its variable.
+
+        @param value: A value loaded from the database, or a
+            L{LazyValue} to be resolved when the variable is accessed.
+        @param keep_defined: If true, a value which was previously
+            loaded is kept.
+        @return: The column's variable if it was already built, in which
+            case it's left to the caller to set its value, or C{None}.
+        """
+        i = self._positions[id(column)]
+        variable = self._slots[i]
+        if isinstance(variable, Variable):
+            return variable
+        if not (keep_defined and variable is not Undef and
+                not isinstance(variable, LazyValue)):
+            self._slots[i] = value
+        return None
+
+    def get_loaded_values(self):
+        """Get the values held for all columns, without building variables.
+
+        @return: A list following L{ClassInfo.columns}, with the value
+            loaded for columns whose variable wasn't built yet, and the
+            internal value of the others.  Columns without a value give
+            C{Undef} or a L{LazyValue}.
+        """
+        values = []
+        for variable in self._slots:
+            if isinstance(variable, Variable):
+                variable = variable._value
+            values.append(variable)
+        return values
+
+    def checkpoint(self):
+        """Checkpoint the variables which were built."""
+        for variable in self._slots:
+            if isinstance(variable, Variable):
+                variable.checkpoint()
 
 
 if has_cextensions:
-    from storm.cextensions import ObjectInfo, get_obj_info
+    from storm.cextensions import ObjectInfo, ObjectVariables, get_obj_info
 
 
 class ClassAlias(object):
@@ -57,11 +57,12 @@ __all__ = [
 class Property(object):
 
     def __init__(self, name=None, primary=False,
-                 variable_class=Variable, variable_kwargs={}):
+                 variable_class=Variable, variable_kwargs={}, lazy=False):
         self._name = name
         self._primary = primary
         self._variable_class = variable_class
         self._variable_kwargs = variable_kwargs
+        self._lazy = lazy
 
     def __get__(self, obj, cls=None):
         if obj is None:
@@ -116,7 +117,7 @@ class Property(object):
                 name = self._name
             column = PropertyColumn(self, cls, attr, name, self._primary,
                                     self._variable_class,
-                                    self._variable_kwargs)
+                                    self._variable_kwargs, self._lazy)
             cls._storm_columns[self] = column
         return column
 
@@ -124,13 +125,14 @@ class Property(object):
 class PropertyColumn(Column):
 
     def __init__(self, prop, cls, attr, name, primary,
-                 variable_class, variable_kwargs):
+                 variable_class, variable_kwargs, lazy=False):
         Column.__init__(self, name, cls, primary,
                         VariableFactory(variable_class, column=self,
                                         validator_attribute=attr,
                                         **variable_kwargs))
 
         self.cls = cls # Used by references
+        self.lazy = lazy # Left out of queries loading objects
 
         # Copy attributes from the property to avoid one additional
         # function call on each access.
@@ -150,7 +152,9 @@ class SimpleProperty(Property):
     def __init__(self, name=None, primary=False, **kwargs):
         kwargs["value"] = kwargs.pop("default", Undef)
         kwargs["value_factory"] = kwargs.pop("default_factory", Undef)
-        Property.__init__(self, name, primary, self.variable_class, kwargs)
+        lazy = kwargs.pop("lazy", False)
+        Property.__init__(self, name, primary, self.variable_class, kwargs,
+                          lazy)
 
 
 class Bool(SimpleProperty):
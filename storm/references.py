@@ -20,14 +20,14 @@
 #
 import weakref
 
-from storm.compat import iter_items, iter_zip, string_types
+from storm.compat import iter_items, iter_range, iter_zip, string_types
 from storm.exceptions import (
-    ClassInfoError, FeatureError, NoStoreError, WrongStoreError)
+    ClassInfoError, FeatureError, NoStoreError, NotOneError, WrongStoreError)
 from storm.store import Store, get_where_for_args, LostObjectError
 from storm.variables import LazyValue
 from storm.expr import (
-    Select, Column, Exists, ComparableExpr, SuffixExpr, LeftJoin, Not, SQLRaw,
-    compare_columns, compile)
+    Select, Column, Exists, ComparableExpr, SuffixExpr, LeftJoin, Not, Or,
+    SQLRaw, compare_columns, compile)
 from storm.info import get_cls_info, get_obj_info
 
 
@@ -165,6 +165,38 @@ class Reference(object):
 
         return remote
 
+    def _prefetch(self, store, objects):
+        """Resolve this reference for many objects at once.
+
+        Objects of other classes, or which have the reference resolved
+        already, are ignored.  See L{ResultSet.prefetch}.
+        """
+        relation = self._relation
+        pending = []
+        for local in objects:
+            if (isinstance(local, self._cls) and
+                relation.get_remote(local) is None and
+                not relation.local_variables_are_none(local)):
+                pending.append((local, relation.get_local_values(local)))
+        if not pending:
+            return
+
+        keys = [key for local, key in pending]
+        if relation.remote_key_is_primary:
+            remotes = store.get_many(relation.remote_cls, keys)
+        else:
+            found = _find_by_keys(store, relation.remote_cls,
+                                  relation.remote_key, keys)
+            remotes = []
+            for key in keys:
+                # Leave ambiguous references to fail when accessed.
+                objs = found.get(key, ())
+                remotes.append(objs[0] if len(objs) == 1 else None)
+
+        for (local, key), remote in iter_zip(pending, remotes):
+            if remote is not None:
+                relation.link(local, remote)
+
     def __set__(self, local, remote):
         # Don't use local here, as it might be security proxied or something.
         local = get_obj_info(local).get_obj()
@@ -250,6 +282,41 @@ class ReferenceSet(object):
     def __set__(self, local, value):
         raise FeatureError("Assigning to ResultSets not supported")
 
+    def _prefetch(self, store, objects):
+        """Load this reference set for many objects at once.
+
+        The remote objects are found with a single query and remembered
+        by the store, so that iterating the set of each of C{objects}
+        won't hit the database.  See L{ResultSet.prefetch}.
+        """
+        relation1 = self._relation1
+        relation2 = self._relation2
+        pending = {}
+        for local in objects:
+            if isinstance(local, self._cls) and id(local) not in pending:
+                pending[id(local)] = (local,
+                                      relation1.get_local_values(local))
+        if not pending:
+            return
+
+        if relation2 is None:
+            target_cls = relation1.remote_cls
+            classes = (target_cls,)
+            where = None
+        else:
+            target_cls = relation2.local_cls
+            classes = (target_cls, relation1.remote_cls)
+            where = relation2.get_where_for_join()
+        keys = [key for local, key in pending.values()]
+        found = _find_by_keys(store, target_cls, relation1.remote_key, keys,
+                              where, self._order_by)
+
+        for local, key in pending.values():
+            local_info = get_obj_info(local)
+            store._cache_reference_set(local_info, relation1,
+                                       classes + (local_info.cls_info.cls,),
+                                       found.get(key, []))
+
     def _build_relations(self):
         resolver = PropertyResolver(self, self._cls)
 
@@ -274,6 +341,20 @@ class ReferenceSet(object):
 
 class BoundReferenceSetBase(object):
 
+    def _get_cached(self):
+        """Return the objects prefetched for this set, or None."""
+        store = Store.of(self._local)
+        if store is None:
+            return None
+        return store._get_cached_reference_set(get_obj_info(self._local),
+                                               self._cache_key)
+
+    def _forget_cached(self):
+        store = Store.of(self._local)
+        if store is not None:
+            store._forget_reference_set(get_obj_info(self._local),
+                                        self._cache_key)
+
     def find(self, *args, **kwargs):
         store = Store.of(self._local)
         if store is None:
@@ -285,21 +366,46 @@ class BoundReferenceSetBase(object):
         return result
 
     def __iter__(self):
+        cached = self._get_cached()
+        if cached is not None:
+            return iter(list(cached))
         return self.find().__iter__()
 
     def __contains__(self, item):
+        cached = self._get_cached()
+        if cached is not None:
+            return item in cached
         return item in self.find()
 
     def first(self, *args, **kwargs):
+        if not (args or kwargs) and self._order_by is not None:
+            cached = self._get_cached()
+            if cached is not None:
+                return cached[0] if cached else None
         return self.find(*args, **kwargs).first()
 
     def last(self, *args, **kwargs):
+        if not (args or kwargs) and self._order_by is not None:
+            cached = self._get_cached()
+            if cached is not None:
+                return cached[-1] if cached else None
         return self.find(*args, **kwargs).last()
 
     def any(self, *args, **kwargs):
+        if not (args or kwargs):
+            cached = self._get_cached()
+            if cached is not None:
+                return cached[0] if cached else None
         return self.find(*args, **kwargs).any()
 
     def one(self, *args, **kwargs):
+        if not (args or kwargs):
+            cached = self._get_cached()
+            if cached is not None:
+                if len(cached) > 1:
+                    raise NotOneError("one() used with more than one result "
+                                      "available")
+                return cached[0] if cached else None
         return self.find(*args, **kwargs).one()
 
     def values(self, *columns):
@@ -309,6 +415,9 @@ class BoundReferenceSetBase(object):
         return self.find().order_by(*args)
 
     def count(self):
+        cached = self._get_cached()
+        if cached is not None:
+            return len(cached)
         return self.find().count()
 
 
@@ -319,6 +428,7 @@ class BoundReferenceSet(BoundReferenceSetBase):
         self._local = local
         self._target_cls = self._relation.remote_cls
         self._order_by = order_by
+        self._cache_key = relation
 
     def _get_where_clause(self):
         return self._relation.get_where_for_remote(self._local)
@@ -332,13 +442,16 @@ class BoundReferenceSet(BoundReferenceSetBase):
             raise NoStoreError("Can't perform operation without a store")
         where = self._relation.get_where_for_remote(self._local)
         store.find(self._target_cls, where, *args, **kwargs).set(**set_kwargs)
+        self._forget_cached()
 
     def add(self, remote):
         self._relation.link(self._local, remote, True)
+        self._forget_cached()
 
     def remove(self, remote):
         self._relation.unlink(get_obj_info(self._local),
                               get_obj_info(remote), True)
+        self._forget_cached()
 
 
 class BoundIndirectReferenceSet(BoundReferenceSetBase):
@@ -351,6 +464,7 @@ class BoundIndirectReferenceSet(BoundReferenceSetBase):
 
         self._target_cls = relation2.local_cls
         self._link_cls = relation1.remote_cls
+        self._cache_key = relation1
 
     def _get_where_clause(self):
         return (self._relation1.get_where_for_remote(self._local) &
@@ -367,6 +481,7 @@ class BoundIndirectReferenceSet(BoundReferenceSetBase):
             table = get_cls_info(self._target_cls).table
             where &= Exists(Select(SQLRaw("*"), join & filter, tables=table))
         store.find(self._link_cls, where).remove()
+        self._forget_cached()
 
     def add(self, remote):
         link = self._link_cls()
@@ -374,6 +489,7 @@ class BoundIndirectReferenceSet(BoundReferenceSetBase):
         # Don't use remote here, as it might be security proxied or something.
         remote = get_obj_info(remote).get_obj()
         self._relation2.link(remote, link, True)
+        self._forget_cached()
 
     def remove(self, remote):
         store = Store.of(self._local)
@@ -384,6 +500,7 @@ class BoundIndirectReferenceSet(BoundReferenceSetBase):
         where = (self._relation1.get_where_for_remote(self._local) &
                  self._relation2.get_where_for_remote(remote))
         store.find(self._link_cls, where).remove()
+        self._forget_cached()
 
 
 class Proxy(ComparableExpr):
@@ -544,6 +661,19 @@ class Relation(object):
         return tuple(local_info.variables[column]
                      for column in self._get_local_columns(local.__class__))
 
+    def get_local_values(self, local):
+        """Return the values of the local key of C{local} as a tuple.
+
+        Like L{get_where_for_remote}, the store is flushed if any of
+        them isn't defined yet.
+        """
+        local_variables = self.get_local_variables(local)
+        for variable in local_variables:
+            if not variable.is_defined():
+                Store.of(local).flush()
+                break
+        return tuple(variable.get() for variable in local_variables)
+
     def local_variables_are_none(self, local):
         """Return true if all variables of the local key have None values."""
         local_info = get_obj_info(local)
@@ -936,6 +1066,39 @@ class PropertyResolver(object):
         return self._registry.get(property_path, self._namespace)
 
 
+def _find_by_keys(store, cls, columns, keys, where=None, order_by=None):
+    """Find objects of C{cls} whose C{columns} match any of C{keys}.
+
+    The keys are split in as many queries as the parameter limit of the
+    connection requires.
+
+    @return: A dictionary mapping each key found to the list of objects
+        having it.
+    """
+    keys = list(set(keys))
+    max_parameters = store._connection.max_parameters
+    if max_parameters is None:
+        chunk_size = len(keys)
+    else:
+        chunk_size = max(1, max_parameters // len(columns))
+    found = {}
+    for start in iter_range(0, len(keys), chunk_size):
+        chunk = keys[start:start+chunk_size]
+        if len(columns) == 1:
+            chunk_where = columns[0].is_in([key[0] for key in chunk])
+        else:
+            chunk_where = Or(*[compare_columns(columns, key)
+                               for key in chunk])
+        if where is not None:
+            chunk_where &= where
+        result = store.find((cls,) + tuple(columns), chunk_where)
+        if order_by is not None:
+            result.order_by(*order_by)
+        for row in result:
+            found.setdefault(tuple(row[1:]), []).append(row[0])
+    return found
+
+
 def _find_descriptor_class(used_cls, descr):
     for cls in used_cls.__mro__:
         for attr, _descr in iter_items(cls.__dict__):
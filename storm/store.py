@@ -24,25 +24,39 @@
 This module contains the highest-level ORM interface in Storm.
 """
 
+from array import array
+from base64 import (
+    b64decode, b64encode, urlsafe_b64decode, urlsafe_b64encode)
 from copy import copy
 from weakref import WeakValueDictionary
-from operator import itemgetter
-
-from storm.compat import iter_items, iter_values, iter_zip, long_int
-from storm.info import get_cls_info, get_obj_info, set_obj_info
-from storm.variables import Variable, LazyValue
+from heapq import heapify, heappop, heappush
+from itertools import islice
+import json
+
+from storm.compat import (
+    bstr, buffer, get_parameters, iter_items, iter_range, iter_values,
+    iter_zip, long_int, string_types, ustr)
+from storm.info import get_cls_info, get_obj_info, set_obj_info, ClassAlias
+from storm.variables import Variable, LazyValue, IntVariable, FloatVariable
 from storm.expr import (
     Expr, Select, Insert, Update, Delete, Column, Count, Max, Min,
-    Avg, Sum, Eq, And, Asc, Desc, compile_python, compare_columns, SQLRaw,
-    Union, Except, Intersect, Alias, SetExpr)
+    Avg, Sum, Eq, And, Or, Asc, Desc, compile_python, compare_columns,
+    SQLRaw, SQLToken, SQL, Table, Union, Except, Intersect, Alias, SetExpr,
+    AutoTables, JoinExpr, LeftJoin, Row, State)
 from storm.exceptions import (
     WrongStoreError, NotFlushedError, OrderLoopError, UnorderedError,
     NotOneError, FeatureError, CompileError, LostObjectError, ClassInfoError)
 from storm.properties import PropertyColumn
-from storm import Undef
+from storm.database import Result
+from storm import Undef, has_cextensions
 from storm.cache import Cache
 from storm.event import EventSystem
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 __all__ = ["Store", "AutoReload", "EmptyResultSet"]
 
@@ -65,22 +79,37 @@ class Store(object):
 
     _result_set_factory = None
 
-    def __init__(self, database, cache=None):
+    def __init__(self, database, cache=None, table_aware_flushes=False):
         """
         @param database: The L{storm.database.Database} instance to use.
         @param cache: The cache to use.  Defaults to a L{Cache} instance.
+            Its C{update()} method is optional, and only called when
+            the cache defines it.
+        @param table_aware_flushes: If True, implicit flushes done before
+            running a query only flush the dirty objects stored in the
+            tables the query uses, when those can be determined from its
+            expression.  Queries given as raw SQL still flush everything.
         """
         self._database = database
         self._event = EventSystem(self)
+        # Hooks shared by the event systems of all objects in the store.
+        self._change_hooks = {"changed": (self._variable_changed,)}
+        self._lazy_hooks = {"resolve-lazy-value": (self._resolve_lazy_value,)}
         self._connection = database.connect(self._event)
         self._alive = WeakValueDictionary()
+        self._missing = set() # (cls, primary_values) known not to exist.
+        self._reference_sets = {} # (obj_info, relation) = objects
+        self._reference_sets_by_cls = {} # cls = set of (obj_info, relation)
         self._dirty = {}
         self._order = {} # (info, info) = count
         if cache is None:
             self._cache = Cache()
         else:
             self._cache = cache
+        # Older caches don't know about values loaded after add().
+        self._update_cache = getattr(self._cache, "update", None)
         self._implicit_flush_block_count = 0
+        self._table_aware_flushes = table_aware_flushes
         self._sequence = 0 # Advisory ordering.
 
     def get_database(self):
@@ -105,8 +134,13 @@ class Store(object):
         This is just like L{storm.database.Database.execute}, except
         that a flush is performed first.
         """
-        if self._implicit_flush_block_count == 0:
-            self.flush()
+        if isinstance(statement, Expr):
+            self._implicit_flush(statement)
+        else:
+            self._implicit_flush()
+        # The statement may change rows behind our back.
+        self._missing.clear()
+        self._forget_reference_sets()
         return self._connection.execute(statement, params, noresult)
 
     def close(self):
@@ -167,8 +201,7 @@ class Store(object):
             if no object is found.
         """
 
-        if self._implicit_flush_block_count == 0:
-            self.flush()
+        self._implicit_flush(cls)
 
         if type(key) != tuple:
             key = (key,)
@@ -188,10 +221,13 @@ class Store(object):
         if obj_info is not None and not obj_info.get("invalidated"):
             return self._get_object(obj_info)
 
-        where = compare_columns(cls_info.primary_key, primary_vars)
-
-        select = Select(cls_info.columns, where,
-                        default_tables=cls_info.table, limit=1)
+        select = self._connection.compile_cached(
+            (cls_info.cls, "get"),
+            lambda primary_vars: Select(
+                cls_info.loaded_columns,
+                compare_columns(cls_info.primary_key, primary_vars),
+                default_tables=cls_info.table, limit=1),
+            primary_vars)
 
         result = self._connection.execute(select)
         values = result.get_one()
@@ -199,6 +235,112 @@ class Store(object):
             return None
         return self._load_object(cls_info, result, values)
 
+    def get_many(self, cls, keys):
+        """Get objects of type cls with the given primary keys.
+
+        Objects which are alive are returned without touching the
+        database, and the remaining ones are all fetched at once.  Keys
+        which turn out to have no object are remembered as such until the
+        end of the transaction.
+
+        @param cls: Class of the objects to be retrieved.
+        @param keys: Sequence of primary keys.  Each may be a tuple for
+            composed keys.
+
+        @return: A list holding the object found for each key, in the
+            order of C{keys}, or None for keys without an object.
+        """
+        self._implicit_flush(cls)
+
+        cls_info = get_cls_info(cls)
+        primary_key = cls_info.primary_key
+
+        found = {}
+        unknown = {}
+        keys_values = []
+        for key in keys:
+            if type(key) != tuple:
+                key = (key,)
+
+            assert len(key) == len(primary_key)
+
+            primary_vars = []
+            for column, variable in iter_zip(primary_key, key):
+                if not isinstance(variable, Variable):
+                    variable = column.variable_factory(value=variable)
+                primary_vars.append(variable)
+
+            primary_values = tuple(var.get(to_db=True) for var in primary_vars)
+            keys_values.append(primary_values)
+            if primary_values in found or primary_values in unknown:
+                continue
+            obj_info = self._alive.get((cls_info.cls, primary_values))
+            if obj_info is not None and not obj_info.get("invalidated"):
+                found[primary_values] = self._get_object(obj_info)
+            elif (cls_info.cls, primary_values) in self._missing:
+                found[primary_values] = None
+            else:
+                unknown[primary_values] = primary_vars
+
+        if unknown:
+            unknown_vars = list(iter_values(unknown))
+            max_parameters = self._connection.max_parameters
+            if max_parameters is None:
+                chunk_size = len(unknown_vars)
+            else:
+                chunk_size = max(1, max_parameters // len(primary_key))
+            for start in iter_range(0, len(unknown_vars), chunk_size):
+                chunk = unknown_vars[start:start+chunk_size]
+                if len(primary_key) == 1:
+                    where = primary_key[0].is_in([primary_vars[0]
+                                                  for primary_vars in chunk])
+                else:
+                    where = Or(*[compare_columns(primary_key, primary_vars)
+                                 for primary_vars in chunk])
+                select = Select(cls_info.loaded_columns, where,
+                                default_tables=cls_info.table)
+                result = self._connection.execute(select)
+                for values in result:
+                    obj = self._load_object(cls_info, result, values)
+                    primary_values = tuple(
+                        var.get(to_db=True)
+                        for var in get_obj_info(obj).primary_vars)
+                    found[primary_values] = obj
+
+            for primary_values in unknown:
+                if primary_values not in found:
+                    found[primary_values] = None
+                    self._missing.add((cls_info.cls, primary_values))
+
+        return [found[primary_values] for primary_values in keys_values]
+
+    def load_reference_sets(self, objects, reference_set):
+        """Load a reference set of many objects at once.
+
+        The remote objects of all of them are found with a single query
+        (split only to respect the parameter limit of the database), and
+        the reference set of each object is then served from memory when
+        iterated or counted::
+
+            store.load_reference_sets(parents, Parent.children)
+            for parent in parents:
+                for child in parent.children:
+                    ...
+
+        The loaded sets are dropped when the transaction ends, when they
+        are modified, or when an object of one of the classes involved
+        changes.
+
+        @param objects: The objects owning the sets, all in this store.
+        @param reference_set: The L{ReferenceSet} property, such as
+            C{Parent.children}.
+        """
+        objects = list(objects)
+        for obj in objects:
+            if self.of(obj) is not self:
+                raise WrongStoreError("%s is not in this store" % repr(obj))
+        reference_set._prefetch(self, objects)
+
     def find(self, cls_spec, *args, **kwargs):
         """Perform a query.
 
@@ -219,8 +361,7 @@ class Store(object):
         @return: A L{ResultSet} of instances C{cls_spec}. If C{cls_spec}
             was a tuple, then an iterator of tuples of such instances.
         """
-        if self._implicit_flush_block_count == 0:
-            self.flush()
+        self._implicit_flush((cls_spec, args))
         find_spec = FindSpec(cls_spec)
         where = get_where_for_args(args, kwargs, find_spec.default_cls)
         return self._result_set_factory(self, find_spec, where)
@@ -250,6 +391,31 @@ class Store(object):
         """
         return self._table_set(self, tables)
 
+    def prepare_find(self, build):
+        """Prepare a query which is built and compiled only once.
+
+        C{build} is called right away with a placeholder for each of
+        its arguments, and must return the result of a L{find} using
+        them as values.  Calling the returned object with values for
+        those arguments gives a L{ResultSet} for the query using them,
+        without building it again, and its SQL is compiled once and
+        reused as long as the result set isn't changed further::
+
+            find_by_name = store.prepare_find(
+                lambda name: store.find(Person, Person.name == name))
+            for person in find_by_name(u"Joe"):
+                print(person.id)
+
+        Values are converted for the database by the variables of the
+        columns they're compared to, as in L{find}.  Values used
+        elsewhere are bound as they are given, unless a L{Variable} is
+        given in their place.
+
+        @param build: A callable taking the query parameters.
+        @return: A L{PreparedFind}.
+        """
+        return PreparedFind(self, build)
+
     def add(self, obj):
         """Add the given object to the store.
 
@@ -322,9 +488,13 @@ class Store(object):
         if "primary_vars" not in obj_info:
             raise NotFlushedError("Can't reload an object if it was "
                                   "never flushed")
-        where = compare_columns(cls_info.primary_key, obj_info["primary_vars"])
-        select = Select(cls_info.columns, where,
-                        default_tables=cls_info.table, limit=1)
+        select = self._connection.compile_cached(
+            (cls_info.cls, "reload"),
+            lambda primary_vars: Select(
+                cls_info.columns,
+                compare_columns(cls_info.primary_key, primary_vars),
+                default_tables=cls_info.table, limit=1),
+            obj_info["primary_vars"])
         result = self._connection.execute(select)
         values = result.get_one()
         self._set_values(obj_info, cls_info.columns, result, values,
@@ -360,8 +530,10 @@ class Store(object):
         """
         if obj is None:
             self._cache.clear()
+            self._missing.clear()
         else:
             self._cache.remove(get_obj_info(obj))
+        self._forget_reference_sets()
         self._mark_autoreload(obj, True)
 
     def reset(self):
@@ -379,6 +551,8 @@ class Store(object):
             if "store" in obj_info:
                 del obj_info["store"]
         self._alive.clear()
+        self._missing.clear()
+        self._forget_reference_sets()
         self._dirty.clear()
         self._cache.clear()
         # The following line is untested, but then, I can't really find a way
@@ -393,9 +567,10 @@ class Store(object):
             obj_infos = (get_obj_info(obj),)
         for obj_info in obj_infos:
             cls_info = obj_info.cls_info
+            variables = obj_info.variables
             for column in cls_info.columns:
                 if id(column) not in cls_info.primary_key_idx:
-                    obj_info.variables[column].set(AutoReload)
+                    _set_autoreload(variables, column)
             if invalidate:
                 # Marking an object with 'invalidated' means that we're
                 # not sure if the object is actually in the database
@@ -437,7 +612,7 @@ class Store(object):
         pair = (get_obj_info(before), get_obj_info(after))
         self._order[pair] -= 1
 
-    def flush(self):
+    def flush(self, objects=None):
         """Flush all dirty objects in cache to database.
 
         This method will first call the __storm_pre_flush__ hook of all dirty
@@ -455,90 +630,314 @@ class Store(object):
         only need to call this method explicitly in very rare cases where
         normal flushing times are insufficient, such as when you want to
         make sure a database trigger gets run at a particular time.
+
+        @param objects: Optionally, an object or a sequence of objects to
+            flush.  Only these and the dirty objects which must be flushed
+            before them, as specified with L{add_flush_order}, are flushed.
+            Other dirty objects are left for a later flush.
+        """
+        if objects is None:
+            self._flush()
+        else:
+            try:
+                obj_infos = [get_obj_info(objects)]
+            except ClassInfoError:
+                obj_infos = [get_obj_info(obj) for obj in objects]
+            self._flush(obj_infos)
+
+    def _flush(self, obj_infos=None, tables=None):
+        """Flush dirty objects, as described in L{flush}.
+
+        @param obj_infos: If not C{None}, the object infos of the objects
+            to flush along with the ones they depend on.
+        @param tables: If not C{None}, a set of table names.  The dirty
+            objects stored in these tables are flushed along with the ones
+            they depend on.
         """
         self._event.emit("flush")
 
-        # The _dirty list may change under us while we're running
-        # the flush hooks, so we cannot just simply loop over it
-        # once.  To prevent infinite looping we keep track of which
-        # objects we've called the hook for using a `flushing` dict.
-        flushing = {}
-        while self._dirty:
-            (obj_info, obj) = self._dirty.popitem()
-            if obj_info not in flushing:
-                flushing[obj_info] = obj
-                self._run_hook(obj_info, "__storm_pre_flush__")
-        self._dirty = flushing
-
-        predecessors = {}
-        for (before_info, after_info), n in iter_items(self._order):
-            if n > 0:
-                before_set = predecessors.get(after_info)
-                if before_set is None:
-                    predecessors[after_info] = set((before_info,))
-                else:
-                    before_set.add(before_info)
-
-        key_func = itemgetter("sequence")
+        if tables is not None:
+            obj_infos = []
+            for obj_info in self._dirty:
+                table_name = get_table_name(obj_info.cls_info)
+                if table_name is None or table_name in tables:
+                    obj_infos.append(obj_info)
+            if not obj_infos:
+                return
+
+        if obj_infos is None:
+            # The _dirty list may change under us while we're running
+            # the flush hooks, so we cannot just simply loop over it
+            # once.  To prevent infinite looping we keep track of which
+            # objects we've called the hook for using a `flushing` dict.
+            flushing = {}
+            while self._dirty:
+                (obj_info, obj) = self._dirty.popitem()
+                if obj_info not in flushing:
+                    flushing[obj_info] = obj
+                    self._run_hook(obj_info, "__storm_pre_flush__")
+            self._dirty = flushing
+            scope = None
+            predecessors, successors = self._get_flush_order_graph()
+        else:
+            # Hooks may make objects dirty and change the flush order, so
+            # the objects to flush are collected again until no new dirty
+            # object shows up.
+            hooked = set()
+            while True:
+                predecessors, successors = self._get_flush_order_graph()
+                scope = self._get_flush_scope(obj_infos, predecessors)
+                obj_infos_to_hook = [obj_info for obj_info in scope
+                                     if obj_info in self._dirty and
+                                     obj_info not in hooked]
+                if not obj_infos_to_hook:
+                    break
+                for obj_info in obj_infos_to_hook:
+                    hooked.add(obj_info)
+                    self._run_hook(obj_info, "__storm_pre_flush__")
 
         # The external loop is important because items can get into the dirty
         # state while we're flushing objects, ...
-        while self._dirty:
-            # ... but we don't have to resort everytime an object is flushed,
-            # so we have an internal loop too.  If no objects become dirty
-            # during flush, this will clean self._dirty and the external loop
-            # will exit too.
-            sorted_dirty = sorted(self._dirty, key=key_func)
-            while sorted_dirty:
-                for i, obj_info in enumerate(sorted_dirty):
-                    for before_info in predecessors.get(obj_info, ()):
-                        if before_info in self._dirty:
-                            break # A predecessor is still dirty.
-                    else:
-                        break # Found an item without dirty predecessors.
+        while True:
+            # ... but we don't have to schedule them everytime an object is
+            # flushed, so objects getting dirty are only considered in the
+            # next round.  If no objects become dirty during flush, this will
+            # clean self._dirty and the external loop will exit too.
+            if scope is None:
+                round_infos = self._dirty
+            else:
+                round_infos = set(obj_info for obj_info in scope
+                                  if obj_info in self._dirty)
+            if not round_infos:
+                break
+
+            # Objects are flushed in topological order, picking the ready
+            # one which got dirty first whenever there's a choice.
+            waiting = {}
+            ready = []
+            for obj_info in round_infos:
+                count = 0
+                for before_info in predecessors.get(obj_info, ()):
+                    if before_info in round_infos:
+                        count += 1
+                if count:
+                    waiting[obj_info] = count
+                else:
+                    ready.append((obj_info["sequence"], id(obj_info),
+                                  obj_info))
+            heapify(ready)
+            while ready:
+                obj_info = heappop(ready)[2]
+                if obj_info in self._dirty:
+                    flushed = self._flush_batch(obj_info, ready)
                 else:
-                    raise OrderLoopError("Can't flush due to ordering loop")
-                del sorted_dirty[i]
-                self._dirty.pop(obj_info, None)
-                self._flush_one(obj_info)
+                    # Some hook flushed it already.
+                    flushed = [obj_info]
+                for before_info in flushed:
+                    for after_info in successors.get(before_info, ()):
+                        count = waiting.get(after_info)
+                        if count is None:
+                            continue
+                        if count == 1:
+                            del waiting[after_info]
+                            heappush(ready, (after_info["sequence"],
+                                             id(after_info), after_info))
+                        else:
+                            waiting[after_info] = count - 1
+            if waiting:
+                raise OrderLoopError("Can't flush due to ordering loop")
 
-        self._order.clear()
+        if not self._dirty:
+            self._order.clear()
 
-        # That's not stricly necessary, but prevents getting into bigints.
-        self._sequence = 0
+            # That's not stricly necessary, but prevents getting into
+            # bigints.
+            self._sequence = 0
+        else:
+            # Drop the ordering of objects which were both flushed.
+            for pair in list(self._order):
+                if pair[0] not in self._dirty and pair[1] not in self._dirty:
+                    del self._order[pair]
+
+    def _implicit_flush(self, expr=Undef):
+        """Flush before running a query, unless implicit flushes are blocked.
+
+        @param expr: The expression, or sequence of expressions, the query
+            is built from.  With table aware flushes, only the dirty objects
+            stored in the tables it uses are flushed.
+        """
+        if self._implicit_flush_block_count == 0:
+            tables = None
+            if self._table_aware_flushes and expr is not Undef:
+                tables = get_tables_for_expr(expr)
+            if tables is None:
+                self.flush()
+            else:
+                self._flush(tables=tables)
+
+    def _get_flush_order_graph(self):
+        """Return the C{(predecessors, successors)} of the flush order.
+
+        Both are dictionaries mapping object infos to the lists of object
+        infos which must be flushed before or after them, respectively.
+        """
+        predecessors = {}
+        successors = {}
+        for (before_info, after_info), n in iter_items(self._order):
+            if n > 0:
+                predecessors.setdefault(after_info, []).append(before_info)
+                successors.setdefault(before_info, []).append(after_info)
+        return predecessors, successors
+
+    def _get_flush_scope(self, obj_infos, predecessors):
+        """Return the set of C{obj_infos} and all of their predecessors."""
+        scope = set()
+        stack = list(obj_infos)
+        while stack:
+            obj_info = stack.pop()
+            if obj_info not in scope:
+                scope.add(obj_info)
+                stack.extend(predecessors.get(obj_info, ()))
+        return scope
+
+    def _flush_batch(self, obj_info, ready):
+        """Flush C{obj_info} along with the ready objects batched with it.
+
+        @param ready: Heap of C{(sequence, id, obj_info)} entries for the
+            objects which may be flushed next.  Objects batched with
+            C{obj_info} are taken out of it.
+        @return: The list of flushed objects.
+        """
+        taken = []
+        candidates = self._iter_batch_candidates(obj_info, ready, taken)
+        pending = obj_info.get("pending")
+        if pending is PENDING_ADD:
+            batch = self._get_insert_batch(candidates)
+            flushed = [obj_info for obj_info, changes in batch]
+            flush_batch = self._flush_inserts
+        elif pending is PENDING_REMOVE:
+            batch = flushed = self._get_remove_batch(candidates)
+            flush_batch = self._flush_removes
+        else:
+            batch = self._get_update_batch(candidates)
+            flushed = [obj_info for obj_info, changes in batch]
+            flush_batch = self._flush_updates
+
+        # Give back the objects looked at but left out of the batch.
+        for entry in taken[len(flushed)-1:]:
+            heappush(ready, entry)
+
+        for obj_info in flushed:
+            self._dirty.pop(obj_info, None)
+        flush_batch(batch)
+        return flushed
+
+    def _iter_batch_candidates(self, obj_info, ready, taken):
+        """Iterate over the objects which may be flushed along with another.
+
+        The first object yielded is C{obj_info} itself, followed by the
+        ones ready to be flushed next, as long as they are of the same
+        class and have the same pending state.  Entries taken out of the
+        C{ready} heap are appended to C{taken}.
+        """
+        cls_info = obj_info.cls_info
+        pending = obj_info.get("pending")
+        yield obj_info
+        while ready:
+            obj_info = ready[0][2]
+            if (obj_info.get("pending") is not pending or
+                obj_info.cls_info is not cls_info or
+                obj_info not in self._dirty):
+                break
+            taken.append(heappop(ready))
+            yield obj_info
 
-    def _flush_one(self, obj_info):
+    def _prepare_insert(self, obj_info):
+        """Return the C{{column: value}} map to insert C{obj_info} with."""
         cls_info = obj_info.cls_info
 
-        pending = obj_info.pop("pending", None)
+        # Give a chance to the backend to process primary variables.
+        self._connection.preset_primary_key(cls_info.primary_key,
+                                            obj_info.primary_vars)
 
-        if pending is PENDING_REMOVE:
-            expr = Delete(compare_columns(cls_info.primary_key,
-                                          obj_info["primary_vars"]),
-                          cls_info.table)
-            self._connection.execute(expr, noresult=True)
+        return self._get_changes_map(obj_info, True)
 
-            # We're sure the cache is valid at this point.
-            obj_info.pop("invalidated", None)
+    def _get_insert_batch(self, candidates):
+        """Collect pending adds which may be inserted with a single statement.
 
-            self._disable_change_notification(obj_info)
-            self._remove_from_alive(obj_info)
-            del obj_info["store"]
+        The batch is made of the candidates given by
+        L{_iter_batch_candidates} which set the same columns to plain
+        values, including their whole primary key, since keys generated
+        by the database can't be told apart for a multi-row insert.  It's
+        cut short so that the statement binds no more parameters than the
+        backend accepts.
 
-        elif pending is PENDING_ADD:
+        Objects looked at but left out of the batch are prepared for
+        insertion again when they're flushed, as the hooks of the objects
+        flushed before them may still change them.
+
+        @return: A list of C{(obj_info, changes)} pairs, holding at least
+            the first candidate.
+        """
+        max_parameters = self._connection.max_parameters
+        batch = []
+        columns = None
+        for obj_info in candidates:
+            if (batch and max_parameters is not None and
+                (len(batch) + 1) * len(columns) > max_parameters):
+                break
+            changes = self._prepare_insert(obj_info)
+            if batch and tuple(changes) != columns:
+                break
+            batch.append((obj_info, changes))
+            if columns is None:
+                columns = tuple(changes)
+                if not columns:
+                    break
+            for value in iter_values(changes):
+                if not isinstance(value, Variable):
+                    # Lazy expressions may bind any number of parameters.
+                    break
+            else:
+                for variable in obj_info.primary_vars:
+                    if not variable.is_defined():
+                        break
+                else:
+                    continue
+            if len(batch) > 1:
+                batch.pop()
+            break
+        return batch
+
+    def _flush_inserts(self, batch):
+        """Insert objects collected by L{_get_insert_batch}.
 
-            # Give a chance to the backend to process primary variables.
-            self._connection.preset_primary_key(cls_info.primary_key,
-                                                obj_info.primary_vars)
+        A batch of several objects is inserted with a single multi-row
+        statement.
+        """
+        obj_infos = [obj_info for obj_info, changes in batch]
+        cls_info = obj_infos[0].cls_info
 
-            changes = self._get_changes_map(obj_info, True)
+        for obj_info in obj_infos:
+            del obj_info["pending"]
 
+        if len(batch) == 1:
+            obj_info, changes = batch[0]
             expr = Insert(changes, cls_info.table,
                           primary_columns=cls_info.primary_key,
                           primary_variables=obj_info.primary_vars)
-
             result = self._connection.execute(expr)
+        else:
+            columns = tuple(batch[0][1])
+            expr = Insert(columns, cls_info.table,
+                          primary_columns=cls_info.primary_key,
+                          values=[tuple(changes[column] for column in columns)
+                                  for obj_info, changes in batch])
+            # The primary key of every object is known after this, so
+            # there's no result to query for missing values.
+            result = self._connection.execute(expr, noresult=True)
 
+        for obj_info in obj_infos:
             # We're sure the cache is valid at this point. We just added
             # the object.
             obj_info.pop("invalidated", None)
@@ -547,25 +946,144 @@ class Store(object):
 
             self._enable_change_notification(obj_info)
             self._add_to_alive(obj_info)
+
+        for obj_info in obj_infos:
+            self._run_hook(obj_info, "__storm_flushed__")
+            obj_info.event.emit("flushed")
+
+    def _get_remove_batch(self, candidates):
+        """Collect pending removals which may be deleted at once.
+
+        @return: A list with the candidates given by
+            L{_iter_batch_candidates}, cut short so that the statement
+            binds no more parameters than the backend accepts.
+        """
+        max_parameters = self._connection.max_parameters
+        batch = []
+        for obj_info in candidates:
+            key_length = len(obj_info.cls_info.primary_key)
+            if (batch and max_parameters is not None and
+                (len(batch) + 1) * key_length > max_parameters):
+                break
+            batch.append(obj_info)
+        return batch
+
+    def _flush_removes(self, batch):
+        """Delete objects collected by L{_get_remove_batch}.
+
+        A batch of several objects is deleted with a single statement
+        matching all of their primary keys.
+        """
+        cls_info = batch[0].cls_info
+        primary_key = cls_info.primary_key
+
+        for obj_info in batch:
+            del obj_info["pending"]
+
+        if len(batch) == 1:
+            delete = self._connection.compile_cached(
+                (cls_info.cls, "delete"),
+                lambda primary_vars: Delete(
+                    compare_columns(primary_key, primary_vars),
+                    cls_info.table),
+                batch[0]["primary_vars"])
         else:
-            cached_primary_vars = obj_info["primary_vars"]
+            if len(primary_key) == 1:
+                where = primary_key[0].is_in([obj_info["primary_vars"][0]
+                                              for obj_info in batch])
+            else:
+                where = Or(*[compare_columns(primary_key,
+                                             obj_info["primary_vars"])
+                             for obj_info in batch])
+            delete = Delete(where, cls_info.table)
+        self._connection.execute(delete, noresult=True)
 
+        for obj_info in batch:
+            # We're sure the cache is valid at this point.
+            obj_info.pop("invalidated", None)
+
+            self._disable_change_notification(obj_info)
+            self._remove_from_alive(obj_info)
+            del obj_info["store"]
+
+        for obj_info in batch:
+            self._run_hook(obj_info, "__storm_flushed__")
+            obj_info.event.emit("flushed")
+
+    def _get_update_batch(self, candidates):
+        """Collect changed objects which may be updated together.
+
+        @return: A list of C{(obj_info, changes)} pairs for the candidates
+            given by L{_iter_batch_candidates} which changed the same set
+            of columns as the first one.
+        """
+        batch = []
+        columns = None
+        for obj_info in candidates:
             changes = self._get_changes_map(obj_info)
+            if columns is None:
+                columns = set(changes)
+            elif set(changes) != columns:
+                break
+            batch.append((obj_info, changes))
+            if not columns:
+                break
+        return batch
+
+    def _get_update(self, obj_info, changes):
+        """Build the statement updating C{changes} on the given object.
+
+        Changes made only of variables have their compiled statement
+        cached by the connection, keyed on the changed columns.
+        """
+        cls_info = obj_info.cls_info
+        primary_vars = obj_info["primary_vars"]
+        if not all(isinstance(value, Variable)
+                   for value in iter_values(changes)):
+            return Update(changes,
+                          compare_columns(cls_info.primary_key, primary_vars),
+                          cls_info.table)
+        columns = tuple(changes)
+        count = len(columns)
+
+        def build(variables):
+            return Update(dict(iter_zip(columns, variables[:count])),
+                          compare_columns(cls_info.primary_key,
+                                          variables[count:]),
+                          cls_info.table)
+
+        return self._connection.compile_cached(
+            (cls_info.cls, "update", columns), build,
+            [changes[column] for column in columns] + list(primary_vars))
+
+    def _flush_updates(self, batch):
+        """Update objects collected by L{_get_update_batch}.
+
+        The statements for a batch of several objects are handed to the
+        connection at once, so that backends may save round trips.
+        """
+        cls_info = batch[0][0].cls_info
 
+        updates = []
+        for obj_info, changes in batch:
+            obj_info.pop("pending", None)
             if changes:
-                expr = Update(changes,
-                              compare_columns(cls_info.primary_key,
-                                              cached_primary_vars),
-                              cls_info.table)
-                self._connection.execute(expr, noresult=True)
+                updates.append(self._get_update(obj_info, changes))
 
+        if len(updates) == 1:
+            self._connection.execute(updates[0], noresult=True)
+        elif updates:
+            self._connection.execute_many(updates)
+
+        if updates:
+            for obj_info, changes in batch:
                 self._fill_missing_values(obj_info, obj_info.primary_vars)
 
                 self._add_to_alive(obj_info)
 
-        self._run_hook(obj_info, "__storm_flushed__")
-
-        obj_info.event.emit("flushed")
+        for obj_info, changes in batch:
+            self._run_hook(obj_info, "__storm_flushed__")
+            obj_info.event.emit("flushed")
 
     def block_implicit_flushes(self):
         """Block implicit flushes from operations like execute()."""
@@ -670,39 +1188,41 @@ class Store(object):
 
     def _validate_alive(self, obj_info):
         """Perform cache validation for the given obj_info."""
-        where = compare_columns(obj_info.cls_info.primary_key,
-                                obj_info["primary_vars"])
-        result = self._connection.execute(Select(SQLRaw("1"), where))
+        primary_key = obj_info.cls_info.primary_key
+        select = self._connection.compile_cached(
+            (obj_info.cls_info.cls, "alive"),
+            lambda primary_vars: Select(
+                SQLRaw("1"), compare_columns(primary_key, primary_vars)),
+            obj_info["primary_vars"])
+        result = self._connection.execute(select)
         if not result.get_one():
             raise LostObjectError("Object is not in the database anymore")
         obj_info.pop("invalidated", None)
 
-    def _load_object(self, cls_info, result, values):
+    def _load_object(self, cls_info, result, values, partial=None):
         # _set_values() need the cls_info columns for the class of the
         # actual object, not from a possible wrapper (e.g. an alias).
         cls = cls_info.cls
         cls_info = get_cls_info(cls)
 
-        # Prepare cache key.
-        primary_vars = []
-        columns = cls_info.columns
-
-        for value in values:
-            if value is not None:
-                break
+        if partial is None:
+            columns = cls_info.loaded_columns
+            primary_key_pos = cls_info.loaded_primary_key_pos
+            unloaded_columns = cls_info.lazy_columns
         else:
+            columns = partial.columns
+            primary_key_pos = partial.primary_key_pos
+            unloaded_columns = partial.unloaded_columns
+
+        # Prepare cache key.
+        primary_values = _get_primary_values(columns, primary_key_pos, values)
+        if primary_values is None:
             # We've got a row full of NULLs, so consider that the object
             # wasn't found.  This is useful for joins, where non-existent
             # rows are represented like that.
             return None
 
-        for i in cls_info.primary_key_pos:
-            value = values[i]
-            variable = columns[i].variable_factory(value=value, from_db=True)
-            primary_vars.append(variable)
-
         # Lookup cache.
-        primary_values = tuple(var.get(to_db=True) for var in primary_vars)
         obj_info = self._alive.get((cls, primary_values))
 
         if obj_info is not None:
@@ -712,7 +1232,7 @@ class Store(object):
 
             # Take that chance and fill up any undefined variables
             # with fresh data, since we got it anyway.
-            self._set_values(obj_info, cls_info.columns, result,
+            self._set_values(obj_info, columns, result,
                              values, keep_defined=True)
 
             # We're not sure if the obj is still in memory at this
@@ -725,8 +1245,10 @@ class Store(object):
             obj_info = get_obj_info(obj)
             obj_info["store"] = self
 
-            self._set_values(obj_info, cls_info.columns, result, values,
+            self._set_values(obj_info, columns, result, values,
                              replace_unknown_lazy=True)
+            for column in unloaded_columns:
+                _set_autoreload(obj_info.variables, column)
 
             self._add_to_alive(obj_info)
             self._enable_change_notification(obj_info)
@@ -764,30 +1286,10 @@ class Store(object):
             raise LostObjectError("Can't obtain values from the database "
                                   "(object got removed?)")
         obj_info.pop("invalidated", None)
-        for column, value in iter_zip(columns, values):
-            variable = obj_info.variables[column]
-            lazy_value = variable.get_lazy()
-            is_unknown_lazy = not (lazy_value is None or
-                                   lazy_value is AutoReload)
-            if keep_defined:
-                if variable.is_defined() or is_unknown_lazy:
-                    continue
-            elif is_unknown_lazy and not replace_unknown_lazy:
-                # This should *never* happen, because whenever we get
-                # to this point it should be after a flush() which
-                # updated the database with lazy values and then replaced
-                # them by AutoReload.  Letting this go through means
-                # we're blindly discarding an unknown lazy value and
-                # replacing it by the value from the database.
-                raise RuntimeError("Unexpected situation. "
-                                   "Please contact the developers.")
-            if value is None:
-                variable.set(value, from_db=True)
-            else:
-                result.set_variable(variable, value)
-
-            variable.checkpoint()
-
+        _set_column_values(obj_info.variables, columns, result, values,
+                           keep_defined, replace_unknown_lazy)
+        if self._update_cache is not None:
+            self._update_cache(obj_info)
 
     def _is_dirty(self, obj_info):
         return obj_info in self._dirty
@@ -796,6 +1298,8 @@ class Store(object):
         if obj_info not in self._dirty:
             self._dirty[obj_info] = obj_info.get_obj()
             obj_info["sequence"] = self._sequence = self._sequence + 1
+        if self._reference_sets_by_cls:
+            self._forget_reference_sets(obj_info.cls_info.cls)
 
     def _set_clean(self, obj_info):
         self._dirty.pop(obj_info, None)
@@ -803,6 +1307,65 @@ class Store(object):
     def _iter_dirty(self):
         return self._dirty
 
+    def _cache_reference_set(self, obj_info, relation, classes, objects):
+        """Remember the objects of a reference set of an object.
+
+        The objects are served by the reference set until the end of the
+        transaction, or until an object of one of C{classes} changes.
+
+        @param obj_info: Info of the object owning the reference set.
+        @param relation: The relation to the remote objects, which
+            identifies the reference set.
+        @param classes: Classes whose changes may alter the set.
+        @param objects: List of the objects in the set.
+        """
+        key = (obj_info, relation)
+        self._reference_sets[key] = objects
+        for cls in classes:
+            self._reference_sets_by_cls.setdefault(cls, set()).add(key)
+
+    def _get_cached_reference_set(self, obj_info, relation):
+        """Return the objects remembered for a reference set, or None."""
+        return self._reference_sets.get((obj_info, relation))
+
+    def _release(self, obj_infos):
+        """Stop holding clean objects in memory on behalf of the store.
+
+        The objects are removed from the cache, and reference sets loaded
+        for them are forgotten, so that they're deallocated as soon as
+        nothing else uses them.  Until then they stay in the identity map,
+        so queries keep returning the same objects.  Dirty objects are
+        left alone.
+        """
+        released = set()
+        for obj_info in obj_infos:
+            if obj_info not in self._dirty:
+                self._cache.remove(obj_info)
+                released.add(obj_info)
+        if released and self._reference_sets:
+            keys = [key for key in self._reference_sets
+                    if key[0] in released]
+            for key in keys:
+                del self._reference_sets[key]
+            for cls_keys in iter_values(self._reference_sets_by_cls):
+                cls_keys.difference_update(keys)
+
+    def _forget_reference_set(self, obj_info, relation):
+        """Forget the objects remembered for a reference set."""
+        self._reference_sets.pop((obj_info, relation), None)
+
+    def _forget_reference_sets(self, cls=None):
+        """Forget remembered reference sets which C{cls} may alter.
+
+        All of them are forgotten if C{cls} is None.
+        """
+        if cls is None:
+            self._reference_sets.clear()
+            self._reference_sets_by_cls.clear()
+        else:
+            for key in self._reference_sets_by_cls.pop(cls, ()):
+                self._reference_sets.pop(key, None)
+
 
     def _add_to_alive(self, obj_info):
         """Add an object to the set of known in-memory objects.
@@ -827,11 +1390,14 @@ class Store(object):
             old_primary_values = tuple(
                 var.get(to_db=True) for var in old_primary_vars)
             self._alive.pop((cls_info.cls, old_primary_values), None)
+            self._missing.discard((cls_info.cls, old_primary_values))
         new_primary_vars = tuple(variable.copy()
                                  for variable in obj_info.primary_vars)
         new_primary_values = tuple(
             var.get(to_db=True) for var in new_primary_vars)
         self._alive[cls_info.cls, new_primary_values] = obj_info
+        # The row exists now, even if get_many() found it missing before.
+        self._missing.discard((cls_info.cls, new_primary_values))
         obj_info["primary_vars"] = new_primary_vars
         self._cache.add(obj_info)
 
@@ -855,10 +1421,10 @@ class Store(object):
 
     def _enable_change_notification(self, obj_info):
         obj_info.event.emit("start-tracking-changes", self._event)
-        obj_info.event.hook("changed", self._variable_changed)
+        obj_info.event.share(self._change_hooks)
 
     def _disable_change_notification(self, obj_info):
-        obj_info.event.unhook("changed", self._variable_changed)
+        obj_info.event.unshare(self._change_hooks)
         obj_info.event.emit("stop-tracking-changes", self._event)
 
     def _variable_changed(self, obj_info, variable,
@@ -877,10 +1443,10 @@ class Store(object):
 
 
     def _enable_lazy_resolving(self, obj_info):
-        obj_info.event.hook("resolve-lazy-value", self._resolve_lazy_value)
+        obj_info.event.share(self._lazy_hooks)
 
     def _disable_lazy_resolving(self, obj_info):
-        obj_info.event.unhook("resolve-lazy-value", self._resolve_lazy_value)
+        obj_info.event.unshare(self._lazy_hooks)
 
     def _resolve_lazy_value(self, obj_info, variable, lazy_value):
         """Resolve a variable set to a lazy value when it's touched.
@@ -888,29 +1454,37 @@ class Store(object):
         This method is hooked into the obj_info to resolve variables
         set to lazy values when they're accessed.  It will first flush
         the store, and then set all variables set to AutoReload to
-        their database values.
+        their database values.  Variables of columns declared as lazy
+        are only loaded when one of them is the variable accessed.
         """
         if lazy_value is not AutoReload and not isinstance(lazy_value, Expr):
             # It's not something we handle.
             return
 
-        # XXX This will do it for now, but it should really flush
-        #     just this single object and ones that it depends on.
-        #     _flush_one() doesn't consider dependencies, so it may
-        #     not be used directly.  Maybe allow flush(obj)?
+        # Only this object and the ones it depends on need to be flushed.
         if self._implicit_flush_block_count == 0:
-            self.flush()
+            self._flush([obj_info])
 
+        cls_info = obj_info.cls_info
+        columns = cls_info.columns
+        if cls_info.lazy_columns and not getattr(variable.column, "lazy",
+                                                 False):
+            # Lazy columns are only loaded when one of them is touched.
+            columns = cls_info.loaded_columns
+        variables = obj_info.variables
         autoreload_columns = []
-        for column in obj_info.cls_info.columns:
-            if obj_info.variables[column].get_lazy() is AutoReload:
+        for column in columns:
+            if variables.get_lazy(column) is AutoReload:
                 autoreload_columns.append(column)
 
         if autoreload_columns:
-            where = compare_columns(obj_info.cls_info.primary_key,
-                                    obj_info["primary_vars"])
-            result = self._connection.execute(
-                Select(autoreload_columns, where))
+            select = self._connection.compile_cached(
+                (cls_info.cls, "autoreload", tuple(autoreload_columns)),
+                lambda primary_vars: Select(
+                    autoreload_columns,
+                    compare_columns(cls_info.primary_key, primary_vars)),
+                obj_info["primary_vars"])
+            result = self._connection.execute(select)
             self._set_values(obj_info, autoreload_columns,
                              result, result.get_one())
 
@@ -939,6 +1513,11 @@ class ResultSet(object):
         self._distinct = False
         self._group_by = Undef
         self._having = Undef
+        self._prefetch = ()
+        self._joined = ()
+        self._partials = None
+        self._stream_batch_size = None
+        self._prepared = None
 
     def copy(self):
         """Return a copy of this ResultSet object, with the same configuration.
@@ -982,21 +1561,444 @@ class ResultSet(object):
             if self._offset is not Undef: # XXX UNTESTED!
                 self._select.offset = self._offset
             return self._select
-        columns, default_tables = self._find_spec.get_columns_and_tables()
-        return Select(columns, self._where, self._tables, default_tables,
+        columns, default_tables = self._find_spec.get_columns_and_tables(
+            self._partials)
+        tables = self._tables
+        if self._joined:
+            columns, tables = self._add_joins(columns, tables)
+        return Select(columns, self._where, tables, default_tables,
                       self._order_by, offset=self._offset, limit=self._limit,
                       distinct=self._distinct, group_by=self._group_by,
                       having=self._having)
 
+    def _get_statement(self, select, kind=None):
+        """Get the statement to execute for the given select.
+
+        For results of a L{PreparedFind}, this binds their values to the
+        placeholders, and gets the statement compiled for C{kind} if the
+        result set wasn't changed since it was prepared.
+        """
+        if self._prepared is None:
+            return select
+        prepared, values = self._prepared
+        prepared._bind(values)
+        if kind is None:
+            return select
+        return prepared._get_statement(self, select, kind)
+
+    def _add_joins(self, columns, tables):
+        """Extend a query with the joins requested with L{joined}.
+
+        @return: The columns and tables of the extended query.
+        """
+        columns = list(columns)
+        for join in self._joined:
+            columns.extend(join.columns)
+        if tables is not Undef:
+            # Explicit tables: each join goes right after the joins
+            # chained to the table it references, since a join can't
+            # refer to tables elsewhere in a comma-separated list.
+            if type(tables) not in (list, tuple):
+                tables = [tables]
+            tables = list(tables)
+            spec_info = self._find_spec._cls_spec_info
+            for join in self._joined:
+                cls_info = spec_info[join.spec_index][1]
+                for i, table in enumerate(tables):
+                    if _uses_table(table, cls_info):
+                        i += 1
+                        while (i < len(tables) and
+                               isinstance(tables[i], JoinExpr) and
+                               tables[i].left is Undef):
+                            i += 1
+                        tables.insert(i, LeftJoin(join.table, join.on))
+                        break
+                else:
+                    raise FeatureError("Can't find the table of %r in the "
+                                       "tables of the query"
+                                       % (cls_info.cls,))
+        else:
+            # Automatic tables: the table of each joined class is
+            # replaced by its chain of joins.
+            spec_info = self._find_spec._cls_spec_info
+            chains = {}
+            for join in self._joined:
+                left = chains.get(join.spec_index)
+                if left is None:
+                    # The table as given by the columns, so that it's
+                    # aliased like them.
+                    left = spec_info[join.spec_index][1].columns[0].table
+                chains[join.spec_index] = LeftJoin(left, join.table, join.on)
+            first = len(columns) - sum(len(join.columns)
+                                       for join in self._joined)
+            columns[first] = AutoTables(columns[first],
+                                        list(iter_values(chains)))
+        return columns, tables
+
     def _load_objects(self, result, values):
-        return self._find_spec.load_objects(self._store, result, values)
+        if not self._joined:
+            return self._find_spec.load_objects(self._store, result, values,
+                                                self._partials)
+        end = len(values) - sum(len(join.columns) for join in self._joined)
+        item = self._find_spec.load_objects(self._store, result, values[:end],
+                                            self._partials)
+        if self._find_spec.is_tuple:
+            objects = item
+        else:
+            objects = (item,)
+        for join in self._joined:
+            start = end
+            end += len(join.columns)
+            remote_values = values[start:end]
+            for pos in join.cls_info.loaded_primary_key_pos:
+                if remote_values[pos] is not None:
+                    break
+            else:
+                # The outer join found nothing.
+                continue
+            remote = self._store._load_object(join.cls_info, result,
+                                              remote_values)
+            join.relation.link(objects[join.spec_index], remote)
+        return item
+
+    def _load_one(self, result, values):
+        item = self._load_objects(result, values)
+        if self._prefetch:
+            self._prefetch_references([item])
+        return item
+
+    def _get_objects(self, items):
+        """Return the objects in items of this result set, in a list."""
+        if self._find_spec.is_tuple:
+            return [obj for item in items for obj in item]
+        return items
+
+    def _prefetch_references(self, items):
+        objects = self._get_objects(items)
+        for reference in self._prefetch:
+            reference._prefetch(self._store, objects)
 
     def __iter__(self):
         """Iterate the results of the query.
         """
-        result = self._store._connection.execute(self._get_select())
-        for values in result:
-            yield self._load_objects(result, values)
+        connection = self._store._connection
+        statement = self._get_statement(self._get_select(), "iter")
+        if self._stream_batch_size is None:
+            result = connection.execute(statement)
+        else:
+            result = connection.execute_streaming(
+                statement, batch_size=self._stream_batch_size)
+        if not self._prefetch:
+            for values in result:
+                yield self._load_objects(result, values)
+            return
+        # References are prefetched for all the objects at once, or for
+        # each batch of them when streaming.
+        rows = iter(result)
+        while True:
+            items = [self._load_objects(result, values)
+                     for values in islice(rows, self._stream_batch_size)]
+            if not items:
+                break
+            self._prefetch_references(items)
+            for item in items:
+                yield item
+
+    def iter_batches(self, size, release=True):
+        """Iterate the results in lists of up to C{size} items.
+
+        Once the caller asks for the next batch, the objects of the
+        previous one are released by the store if they're clean: they're
+        dropped from its cache, so they're deallocated when the caller no
+        longer references them.  This keeps memory usage flat when going
+        over many objects, without breaking the guarantee that a row is
+        represented by a single object::
+
+            for batch in store.find(Person).stream().iter_batches(500):
+                for person in batch:
+                    export(person)
+
+        @param size: The maximum number of items in each batch.
+        @param release: If False, objects aren't released.
+        """
+        batch = []
+        for item in self:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                if release:
+                    self._release_items(batch)
+                batch = []
+        if batch:
+            yield batch
+            if release:
+                self._release_items(batch)
+
+    def _release_items(self, items):
+        obj_infos = []
+        for obj in self._get_objects(items):
+            obj_info = getattr(obj, "__storm_object_info__", None)
+            if obj_info is not None:
+                obj_infos.append(obj_info)
+        self._store._release(obj_infos)
+
+    def stream(self, batch_size=1000):
+        """Fetch the results from the database in batches when iterating.
+
+        Rather than transferring the whole result before the first
+        object is returned, rows are fetched C{batch_size} at a time.
+        On PostgreSQL, the pending rows are kept on the server with a
+        named cursor, which only lives until the end of the transaction.
+        This makes it possible to go over results that don't fit in
+        memory::
+
+            for row in store.find(LogEntry).stream(batch_size=5000):
+                export(row)
+
+        @param batch_size: The number of rows fetched at a time.  When
+            prefetching references, they're loaded for each batch.
+
+        @return: self (not a copy).
+        """
+        self._stream_batch_size = batch_size
+        return self
+
+    def prefetch(self, *references):
+        """Load references of the found objects along with them.
+
+        When this result set is iterated, each of the given L{Reference}
+        or L{ReferenceSet} properties is resolved for all of the objects
+        found using a single query, rather than one query per object::
+
+            for bar in store.find(Bar).prefetch(Bar.foo, Bar.children):
+                print(bar.foo.title, list(bar.children))
+
+        Referenced objects are linked as if the reference had been
+        accessed, and reference sets are served from memory until the
+        end of the transaction, or until an object which may alter them
+        changes.
+
+        @param references: Reference or ReferenceSet properties of the
+            found classes, such as C{Bar.foo}.
+
+        @return: self (not a copy).
+        """
+        self._prefetch += references
+        return self
+
+    def load_only(self, *columns):
+        """Load only the given columns of the objects found.
+
+        The objects are still tracked by the store as usual, but only
+        the given columns and the primary key are selected.  Any other
+        column of objects which weren't already in memory is loaded when
+        first accessed::
+
+            for person in store.find(Person).load_only(Person.name):
+                print(person.name)
+
+        Calling this method again replaces the columns given before,
+        and calling it without columns loads objects completely again.
+
+        @param columns: Columns of the classes found, such as
+            C{Person.name}.  They may include columns declared as lazy.
+
+        @raises FeatureError: Raised if a column isn't from one of the
+            classes found, or if this result is a set expression such as
+            a union.
+        @return: self (not a copy).
+        """
+        if self._select is not Undef:
+            raise FeatureError("Partial loading isn't supported with "
+                               "set expressions (unions, etc)")
+        if not columns:
+            self._partials = None
+            return self
+        spec_columns = {}
+        for column in columns:
+            for spec_index, (is_expr, info) in enumerate(
+                    self._find_spec._cls_spec_info):
+                if not is_expr and any(column is spec_column
+                                       for spec_column in info.columns):
+                    spec_columns.setdefault(spec_index, []).append(column)
+                    break
+            else:
+                raise FeatureError("%r isn't a column of the classes found"
+                                   % (column,))
+        partials = {}
+        for spec_index, columns in iter_items(spec_columns):
+            info = self._find_spec._cls_spec_info[spec_index][1]
+            partials[spec_index] = _PartialLoad(info, columns)
+        self._partials = partials
+        return self
+
+    def joined(self, *references):
+        """Load referenced objects in the same query as the found ones.
+
+        Each of the given L{Reference} properties is resolved with a
+        C{LEFT JOIN}, so that accessing it on the objects found doesn't
+        hit the database::
+
+            for order in store.find(Order).joined(Order.customer):
+                print(order.customer.name)
+
+        Only references to the primary key of the remote class are
+        supported, as others might match several rows for each object.
+        See also L{prefetch}, which loads them with a separate query.
+
+        @param references: Reference properties of the found classes,
+            such as C{Order.customer}.
+
+        @raises FeatureError: Raised if a reference isn't supported, or
+            if this result is grouped or is a set expression such as a
+            union.
+        @return: self (not a copy).
+        """
+        if self._select is not Undef:
+            raise FeatureError("Joining isn't supported with "
+                               "set expressions (unions, etc)")
+        if self._group_by is not Undef:
+            raise FeatureError("Joining isn't supported after a "
+                               "GROUP BY clause")
+        joined = list(self._joined)
+        for reference in references:
+            joined.append(_Join(self._find_spec, reference, len(joined)))
+        self._joined = tuple(joined)
+        return self
+
+    def after(self, item):
+        """Restrict the result set to the items ordered after C{item}.
+
+        This is keyset (or seek) pagination: rather than skipping rows
+        with an C{OFFSET}, which the database must still walk over, the
+        ordering columns are compared with the values of the last item
+        seen, so that every page costs about the same::
+
+            page = result.order_by(Person.name, Person.id)[:50]
+            next_page = result.after(page[-1])[:50]
+
+        Every ordering expression must be a column of one of the found
+        classes, and the ordering should be unique (e.g. end with the
+        primary key), or rows sharing the same values would be skipped.
+        Columns may be wrapped in L{Desc}, but C{NULL} values aren't
+        supported, since they can't be compared.
+
+        @param item: An item of this result set (a tuple of items for
+            tuple finds), or a token returned by L{keyset_token}.
+
+        @raises UnorderedError: Raised if the result set isn't ordered.
+        @raises FeatureError: Raised if the ordering isn't made of
+            columns of the found classes, or the item has a C{NULL}
+            value for one of them.
+        @raises ValueError: Raised if the given token is invalid.
+        @return: A new L{ResultSet} of the following items.
+        """
+        order = self._get_keyset_order()
+        if isinstance(item, string_types):
+            variables = _decode_keyset_token(order, item)
+        else:
+            variables = self._get_keyset_variables(order, item)
+        columns = [column for column, descending in order]
+        directions = set(descending for column, descending in order)
+        if len(columns) > 1 and len(directions) == 1:
+            # A row value comparison can be used as an index range.
+            if directions.pop():
+                return self.find(Row(*columns) < Row(*variables))
+            return self.find(Row(*columns) > Row(*variables))
+        where = None
+        for (column, descending), variable in reversed(
+            list(iter_zip(order, variables))):
+            if descending:
+                next_items = column < variable
+            else:
+                next_items = column > variable
+            if where is not None:
+                next_items = Or(next_items, And(column == variable, where))
+            where = next_items
+        if len(columns) > 1:
+            # The expansion above can't be used as an index range, so
+            # bound the leading column as well.
+            column, descending = order[0]
+            if descending:
+                where = And(column <= variables[0], where)
+            else:
+                where = And(column >= variables[0], where)
+        return self.find(where)
+
+    def keyset_token(self, item):
+        """Get an opaque token pointing after the given item.
+
+        The token is a URL-safe string holding the values of the
+        ordering columns for C{item}, which can later be given to
+        L{after} (or to L{paginate}) in place of the item itself.
+
+        @param item: An item of this result set.
+        @raises FeatureError: Raised if the value of an ordering column
+            can't be stored in a token.
+        @return: The token string.
+        """
+        order = self._get_keyset_order()
+        values = [_encode_keyset_value(column, variable)
+                  for (column, descending), variable
+                  in iter_zip(order, self._get_keyset_variables(order, item))]
+        token = urlsafe_b64encode(json.dumps(values).encode("utf-8"))
+        return token.decode("ascii")
+
+    def paginate(self, page_size, after=None):
+        """Get a page of items using keyset pagination.
+
+        @param page_size: The maximum number of items in the page.
+        @param after: The token returned along with the previous page,
+            or C{None} to get the first one.
+
+        @return: A tuple C{(items, token)}, where C{token} should be
+            given back to get the next page, or is C{None} if this is
+            the last one.
+        @seealso: L{after}.
+        """
+        self._get_keyset_order()
+        result = self if after is None else self.after(after)
+        items = list(result[:page_size + 1])
+        if len(items) <= page_size:
+            return items, None
+        del items[page_size:]
+        return items, self.keyset_token(items[-1])
+
+    def _get_keyset_order(self):
+        if self._order_by is Undef:
+            raise UnorderedError("Can't paginate an unordered result set")
+        order = []
+        for expr in self._order_by:
+            descending = isinstance(expr, Desc)
+            if descending or isinstance(expr, Asc):
+                expr = expr.expr
+            if not isinstance(expr, Column):
+                raise FeatureError("Can't paginate on %r, only columns "
+                                   "are supported" % (expr,))
+            order.append((expr, descending))
+        return order
+
+    def _get_keyset_variables(self, order, item):
+        if not self._find_spec.is_tuple:
+            item = (item,)
+        obj_infos = [get_obj_info(obj) for (is_expr, info), obj
+                     in iter_zip(self._find_spec._cls_spec_info, item)
+                     if not is_expr]
+        variables = []
+        for column, descending in order:
+            for obj_info in obj_infos:
+                variable = obj_info.variables.get(column)
+                if variable is not None:
+                    break
+            else:
+                raise FeatureError("Can't paginate on %r, it's not a column "
+                                   "of the found classes" % (column,))
+            value = variable.get()
+            if value is None:
+                raise FeatureError("Can't paginate after a NULL value "
+                                   "of %r" % (column,))
+            variables.append(column.variable_factory(value=value))
+        return variables
 
     def __getitem__(self, index):
         """Get an individual item by offset, or a range of items by slice.
@@ -1065,7 +2067,8 @@ class ResultSet(object):
             where = [Eq(*pair) for pair in iter_zip(aliased_columns, values)]
             select = Select(1, And(*where), Alias(subquery, "_tmp"))
 
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select))
         return result.get_one() is not None
 
     def is_empty(self):
@@ -1074,7 +2077,8 @@ class ResultSet(object):
         subselect.limit = 1
         subselect.order_by = Undef
         select = Select(1, tables=Alias(subselect, "_tmp"), limit=1)
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select))
         return (not result.get_one())
 
     def any(self):
@@ -1086,10 +2090,11 @@ class ResultSet(object):
         select = self._get_select()
         select.limit = 1
         select.order_by = Undef
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select, "any"))
         values = result.get_one()
         if values:
-            return self._load_objects(result, values)
+            return self._load_one(result, values)
         return None
 
     def _any(self):
@@ -1099,10 +2104,11 @@ class ResultSet(object):
         """
         select = self._get_select()
         select.limit = 1
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select, "_any"))
         values = result.get_one()
         if values:
-            return self._load_objects(result, values)
+            return self._load_one(result, values)
         return None
 
     def first(self):
@@ -1140,10 +2146,11 @@ class ResultSet(object):
                 select.order_by.append(Desc(expr.expr))
             else:
                 select.order_by.append(Desc(expr))
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select, "last"))
         values = result.get_one()
         if values:
-            return self._load_objects(result, values)
+            return self._load_one(result, values)
         return None
 
     def one(self):
@@ -1158,12 +2165,13 @@ class ResultSet(object):
         # limit could be 1 due to slicing, for instance.
         if select.limit is not Undef and select.limit > 2:
             select.limit = 2
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select, "one"))
         values = result.get_one()
         if result.get_one():
             raise NotOneError("one() used with more than one result available")
         if values:
-            return self._load_objects(result, values)
+            return self._load_one(result, values)
         return None
 
     def order_by(self, *args):
@@ -1198,8 +2206,10 @@ class ResultSet(object):
         if self._select is not Undef:
             raise FeatureError("Removing isn't supported with "
                                "set expressions (unions, etc)")
+        cls_info = self._find_spec.default_cls_info
         result = self._store._connection.execute(
-            Delete(self._where, self._find_spec.default_cls_info.table))
+            self._get_statement(Delete(self._where, cls_info.table)))
+        self._store._forget_reference_sets(cls_info.cls)
         return result.rowcount
 
     def group_by(self, *expr):
@@ -1212,6 +2222,9 @@ class ResultSet(object):
         if self._select is not Undef:
             raise FeatureError("Grouping isn't supported with "
                                "set expressions (unions, etc)")
+        if self._joined:
+            raise FeatureError("Grouping isn't supported with joined "
+                               "references")
 
         find_spec = FindSpec(expr)
         columns, dummy = find_spec.get_columns_and_tables()
@@ -1253,7 +2266,8 @@ class ResultSet(object):
             select.order_by = Undef
             subquery = replace_columns(select, columns)
             select = Select(aggregate, tables=Alias(subquery, "_tmp"))
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select))
         value = result.get_one()[0]
         variable_factory = getattr(column, "variable_factory", None)
         if variable_factory:
@@ -1291,7 +2305,8 @@ class ResultSet(object):
         @param columns: One or more L{storm.expr.Column} objects whose values
             will be fetched.
         @raises FeatureError: Raised if no columns are specified or if this
-            result is a set expression such as a union.
+            result is a set expression such as a union, or comes from a
+            L{PreparedFind}.
         @return: A L{Select} expression configured to use the query parameters
             specified for this result set, and also limited to only retrieving
             data for the specified columns.
@@ -1302,6 +2317,9 @@ class ResultSet(object):
         if self._select is not Undef:
             raise FeatureError(
                 "Can't generate subselect expression for set expressions")
+        if self._prepared is not None:
+            raise FeatureError(
+                "Can't generate subselect expression for prepared queries")
         select = self._get_select()
         select.columns = columns
         return select
@@ -1325,18 +2343,97 @@ class ResultSet(object):
             raise FeatureError("values() can't be used with set expressions")
         select = self._get_select()
         select.columns = columns
-        result = self._store._connection.execute(select)
+        result = self._store._connection.execute(
+            self._get_statement(select))
+        converters = [result.get_converter(column.variable_factory)
+                      for column in columns]
         if len(columns) == 1:
-            variable = columns[0].variable_factory()
+            convert = converters[0]
+            if convert is None:
+                for values in result:
+                    yield values[0]
+            else:
+                for values in result:
+                    yield convert(values[0])
+        elif not any(converters):
             for values in result:
-                result.set_variable(variable, values[0])
-                yield variable.get()
+                yield tuple(values)
         else:
-            variables = [column.variable_factory() for column in columns]
+            converters = [(index, convert)
+                          for index, convert in enumerate(converters)
+                          if convert is not None]
             for values in result:
-                for variable, value in iter_zip(variables, values):
-                    result.set_variable(variable, value)
-                yield tuple(variable.get() for variable in variables)
+                values = list(values)
+                for index, convert in converters:
+                    values[index] = convert(values[index])
+                yield tuple(values)
+
+    def columns(self, *columns, **kwargs):
+        """Retrieve the specified columns into one buffer per column.
+
+        Rows are fetched in batches and their values are appended
+        straight to the buffers, without building objects or result
+        tuples, which makes this suitable for feeding large results
+        to vectorised computations::
+
+            buffers = store.find(Sale).columns(Sale.id, Sale.amount)
+            total = sum(buffers[Sale.amount])
+
+        Integer and float columns are stored in C{array('q')} and
+        C{array('d')} buffers, and other columns in lists.  With
+        C{as_="numpy"}, buffers are converted to NumPy arrays instead,
+        those of other columns having the C{object} dtype.  Typed
+        buffers can't hold C{NULL}s, and integer columns holding values
+        beyond 64 bits are returned in lists instead.
+
+        @param columns: One or more L{storm.expr.Column} objects whose
+            values will be fetched.
+        @param as_: Either C{"array"} (the default) or C{"numpy"}.
+        @param batch_size: The number of rows fetched at a time.
+        @raises FeatureError: Raised if no columns are specified, if
+            this result is a set expression such as a union, if NumPy
+            isn't installed when requested, or if a typed column has a
+            C{NULL} value.
+        @return: A dictionary mapping each column to its buffer.
+        """
+        as_ = kwargs.pop("as_", "array")
+        batch_size = kwargs.pop("batch_size", 1000)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: %s"
+                            % ", ".join(sorted(kwargs)))
+        if not columns:
+            raise FeatureError("columns() takes at least one column "
+                               "as argument")
+        if self._select is not Undef:
+            raise FeatureError("columns() can't be used with set expressions")
+        buffers = _create_column_buffers(columns, as_)
+        select = self._get_select()
+        select.columns = columns
+        result = self._store._connection.execute(
+            self._get_statement(select))
+        converters = [result.get_converter(column.variable_factory)
+                      for column in columns]
+        rows = iter(result)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            for i, (column, convert, values) in enumerate(iter_zip(
+                columns, converters, iter_zip(*batch))):
+                if convert is not None:
+                    values = list(map(convert, values))
+                buf = buffers[i]
+                size = len(buf)
+                try:
+                    buf.extend(values)
+                except TypeError:
+                    raise FeatureError("Can't store NULL values of %r "
+                                       "in a typed buffer" % (column,))
+                except OverflowError:
+                    # Integers too big for the typed buffer.
+                    del buf[size:]
+                    buffers[i] = buf.tolist() + list(values)
+        return _finish_column_buffers(columns, buffers, as_)
 
     def set(self, *args, **kwargs):
         """Update objects in the result set with the given arguments.
@@ -1390,7 +2487,7 @@ class ResultSet(object):
 
         expr = Update(changes, self._where,
                       self._find_spec.default_cls_info.table)
-        self._store.execute(expr, noresult=True)
+        self._store.execute(self._get_statement(expr), noresult=True)
 
         try:
             cached = self.cached()
@@ -1434,6 +2531,8 @@ class ResultSet(object):
         if self._where is Undef:
             match = None
         else:
+            # Results of a PreparedFind must have their values bound.
+            self._get_statement(self._where)
             match = compile_python.get_matcher(self._where)
 
             def get_column(column):
@@ -1484,6 +2583,15 @@ class ResultSet(object):
     def _set_expr(self, expr_cls, other, all=False):
         if not self._find_spec.is_compatible(other._find_spec):
             raise FeatureError("Incompatible results for set operation")
+        if self._joined or other._joined:
+            raise FeatureError("Set operations aren't supported with "
+                               "joined references")
+        if self._partials or other._partials:
+            raise FeatureError("Set operations aren't supported with "
+                               "partially loaded objects")
+        if self._prepared is not None or other._prepared is not None:
+            raise FeatureError("Set operations aren't supported with "
+                               "prepared queries")
 
         expr = expr_cls(self._get_select(), other._get_select(), all=all)
         return ResultSet(self._store, self._find_spec, select=expr)
@@ -1516,6 +2624,389 @@ class ResultSet(object):
         return self._set_expr(Intersect, other, all)
 
 
+def _uses_table(expr, cls_info):
+    """Tell whether a table of a query includes the table of C{cls_info}.
+
+    @param expr: A table given to L{Store.using} or C{find(tables=...)}.
+    @param cls_info: The class info whose table is looked for.
+    """
+    if isinstance(expr, JoinExpr):
+        return (_uses_table(expr.left, cls_info) or
+                _uses_table(expr.right, cls_info))
+    elif isinstance(expr, type):
+        return get_cls_info(expr).table is cls_info.table
+    elif isinstance(expr, string_types):
+        return (isinstance(cls_info.table, Table) and
+                expr == cls_info.table.name)
+    return expr is cls_info.table
+
+
+class _Join(object):
+    """A reference loaded with a join by L{ResultSet.joined}.
+
+    The remote class is aliased, so the join doesn't clash with other
+    uses of its table in the query.
+
+    @ivar spec_index: Position of the local class in the find spec.
+    @ivar relation: The relation of the reference.
+    @ivar cls_info: Class info of the remote class.
+    @ivar table: Alias of the remote class.
+    @ivar columns: Aliased columns of the remote class, in the order
+        of C{cls_info.loaded_columns}.
+    @ivar on: Condition of the join.
+    """
+
+    __slots__ = ("spec_index", "relation", "cls_info", "table", "columns",
+                 "on")
+
+    def __init__(self, find_spec, reference, index):
+        relation = getattr(reference, "_relation", None)
+        if relation is None or not relation.remote_key_is_primary:
+            raise FeatureError("joined() only supports references to "
+                               "primary keys, got %r" % (reference,))
+        for spec_index, (is_expr, info) in enumerate(
+                find_spec._cls_spec_info):
+            if not is_expr and issubclass(info.cls, reference._cls):
+                break
+        else:
+            raise FeatureError("%r isn't a reference of the classes found"
+                               % (reference,))
+        cls_info = get_cls_info(relation.remote_cls)
+        alias = ClassAlias(relation.remote_cls, "_join%d" % index)
+        alias_info = get_cls_info(alias)
+        local_columns = _get_columns_by_name(info, relation.local_key)
+        remote_columns = _get_columns_by_name(alias_info, relation.remote_key)
+
+        self.spec_index = spec_index
+        self.relation = relation
+        self.cls_info = cls_info
+        self.table = alias
+        self.columns = _get_columns_by_name(alias_info,
+                                            cls_info.loaded_columns)
+        self.on = compare_columns(local_columns, remote_columns)
+
+
+class _PartialLoad(object):
+    """Columns of a class loaded by L{ResultSet.load_only}.
+
+    @ivar select_columns: Columns selected, from the class in the find
+        spec, which may be an alias.  The primary key comes first.
+    @ivar columns: The same columns from the class of the objects.
+    @ivar primary_key_pos: Position of the primary key in C{columns}.
+    @ivar unloaded_columns: Columns left to be loaded on access.
+    """
+
+    __slots__ = ("select_columns", "columns", "primary_key_pos",
+                 "unloaded_columns")
+
+    def __init__(self, info, columns):
+        cls_info = get_cls_info(info.cls)
+        loaded = list(cls_info.primary_key)
+        loaded_ids = set(id(column) for column in loaded)
+        for column in _get_columns_by_name(cls_info, columns):
+            if id(column) not in loaded_ids:
+                loaded.append(column)
+                loaded_ids.add(id(column))
+        self.columns = tuple(loaded)
+        self.select_columns = _get_columns_by_name(info, self.columns)
+        self.primary_key_pos = tuple(iter_range(len(cls_info.primary_key)))
+        self.unloaded_columns = tuple(column for column in cls_info.columns
+                                      if id(column) not in loaded_ids)
+
+
+def _create_column_buffers(columns, as_):
+    if as_ not in ("array", "numpy"):
+        raise ValueError("Unknown buffer kind: %r" % (as_,))
+    if as_ == "numpy" and numpy is None:
+        raise FeatureError("NumPy must be installed to use as_='numpy'")
+    buffers = []
+    for column in columns:
+        variable_type = type(column.variable_factory())
+        if variable_type is IntVariable:
+            buffers.append(array("q"))
+        elif variable_type is FloatVariable:
+            buffers.append(array("d"))
+        else:
+            buffers.append([])
+    return buffers
+
+
+def _finish_column_buffers(columns, buffers, as_):
+    if as_ == "numpy":
+        buffers = [numpy.frombuffer(buf, dtype=buf.typecode)
+                   if isinstance(buf, array)
+                   else numpy.array(buf, dtype=object)
+                   for buf in buffers]
+    return dict(iter_zip(columns, buffers))
+
+
+def _encode_keyset_value(column, variable):
+    """Encode the value of an ordering column for a keyset token.
+
+    Values are stored as they're given to the database, along with a
+    tag telling how they're encoded in JSON: C{"n"} for numbers and
+    booleans, C{"u"} for text, C{"b"} for base64-encoded bytes, and
+    C{"s"} for other values that the column parses back from their
+    text form (e.g. decimals or dates).
+
+    @raises FeatureError: Raised if the value can't be restored from
+        its encoded form.
+    """
+    value = variable.get(to_db=True)
+    if isinstance(value, (bool, int, long_int, float)):
+        return ["n", value]
+    elif isinstance(value, ustr):
+        return ["u", value]
+    elif isinstance(value, (bstr, buffer, bytearray)):
+        return ["b", b64encode(bytes(value)).decode("ascii")]
+    text = ustr(value)
+    restored = column.variable_factory(value=text, from_db=True)
+    if restored.get(to_db=True) != value:
+        raise FeatureError("Can't paginate on %r with a token, %r values "
+                           "aren't supported" % (column, type(value)))
+    return ["s", text]
+
+
+def _decode_keyset_token(order, token):
+    try:
+        values = json.loads(
+            urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError()
+        variables = []
+        for (column, descending), (tag, value) in iter_zip(order, values):
+            if tag == "b":
+                value = b64decode(value.encode("ascii"))
+            elif tag not in ("n", "u", "s"):
+                raise ValueError()
+            variables.append(column.variable_factory(value=value,
+                                                     from_db=True))
+        return variables
+    except (ValueError, TypeError):
+        raise ValueError("Invalid keyset pagination token: %r" % (token,))
+
+
+def _get_columns_by_name(cls_info, columns):
+    """Return the columns of C{cls_info} named like C{columns}."""
+    by_name = dict((column.name, column) for column in cls_info.columns)
+    return tuple(by_name[column.name] for column in columns)
+
+
+def _get_primary_values(columns, primary_key_pos, values):
+    """Get the primary key of an object loaded from a row.
+
+    @param columns: The columns the row was fetched for.
+    @param primary_key_pos: The positions of the primary key in C{columns}.
+    @param values: The row fetched from the database.
+    @return: A tuple with the values of the primary key, as they're
+        given to the database, or C{None} if the row is full of C{NULL}s.
+    """
+    for value in values:
+        if value is not None:
+            break
+    else:
+        return None
+    primary_values = []
+    for i in primary_key_pos:
+        variable = columns[i].variable_factory(value=values[i], from_db=True)
+        primary_values.append(variable.get(to_db=True))
+    return tuple(primary_values)
+
+
+def _set_column_values(variables, columns, result, values,
+                       keep_defined=False, replace_unknown_lazy=False):
+    """Set the variables of an object to the values fetched for it.
+
+    Values of variables which weren't built yet are kept until they're
+    accessed, unless the result has its own way to set them.
+
+    @param variables: The object's L{ObjectVariables}.
+    @param result: The L{Result} the values were fetched from.
+    @param keep_defined: If true, variables which already have a value
+        aren't changed.
+    @param replace_unknown_lazy: If true, lazy values other than
+        L{AutoReload} are replaced rather than refused.
+    """
+    load_values = result.set_variable == Result.set_variable
+    for column, value in iter_zip(columns, values):
+        if load_values or value is None:
+            variable = variables.load_value(column, value, keep_defined)
+            if variable is None:
+                continue
+        else:
+            variable = variables[column]
+        lazy_value = variable.get_lazy()
+        is_unknown_lazy = not (lazy_value is None or
+                               lazy_value is AutoReload)
+        if keep_defined:
+            if variable.is_defined() or is_unknown_lazy:
+                continue
+        elif is_unknown_lazy and not replace_unknown_lazy:
+            # This should *never* happen, because whenever we get
+            # to this point it should be after a flush() which
+            # updated the database with lazy values and then replaced
+            # them by AutoReload.  Letting this go through means
+            # we're blindly discarding an unknown lazy value and
+            # replacing it by the value from the database.
+            raise RuntimeError("Unexpected situation. "
+                               "Please contact the developers.")
+        if value is None:
+            variable.set(value, from_db=True)
+        else:
+            result.set_variable(variable, value)
+
+        variable.checkpoint()
+
+
+if has_cextensions:
+    from storm.cextensions import _get_primary_values, _set_column_values
+
+
+def _set_autoreload(variables, column):
+    """Make a column be reloaded when accessed, building no variable."""
+    variable = variables.load_value(column, AutoReload)
+    if variable is not None:
+        variable.set(AutoReload)
+
+
+def _get_compared_columns(expr, variables):
+    """Find the columns C{variables} are compared to in C{expr}.
+
+    @return: A dictionary mapping the C{id()} of variables compared to a
+        column, directly or in an C{IN} list, to that column.
+    """
+    ids = set(id(variable) for variable in variables)
+    columns = {}
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, (tuple, list)):
+            stack.extend(expr)
+        elif isinstance(expr, Expr):
+            expr1 = getattr(expr, "expr1", None)
+            expr2 = getattr(expr, "expr2", None)
+            for column, other in ((expr1, expr2), (expr2, expr1)):
+                if isinstance(column, Column):
+                    if not isinstance(other, (tuple, list)):
+                        other = (other,)
+                    for item in other:
+                        if id(item) in ids:
+                            columns.setdefault(id(item), column)
+            for cls in type(expr).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                if isinstance(slots, string_types):
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ("compile_cache", "compile_id"):
+                        stack.append(getattr(expr, name, None))
+    return columns
+
+
+class PreparedFind(object):
+    """A query built once, and run with different values.
+
+    Instances are created by L{Store.prepare_find}, and calling them with
+    the values for the query parameters returns a L{ResultSet}.
+    Results which are iterated, or queried with L{ResultSet.any},
+    L{ResultSet.first}, L{ResultSet.last} or L{ResultSet.one}, reuse
+    the SQL compiled the first time, unless they were changed with
+    methods such as L{ResultSet.order_by} or L{ResultSet.find}.
+    """
+
+    def __init__(self, store, build):
+        self._store = store
+        self._parameters = get_parameters(build)
+        self._placeholders = []
+        args = []
+        kwargs = {}
+        for name, keyword_only, default in self._parameters:
+            placeholder = Variable()
+            if keyword_only:
+                kwargs[name] = placeholder
+            else:
+                args.append(placeholder)
+            self._placeholders.append(placeholder)
+        self._result = build(*args, **kwargs)
+        compared = _get_compared_columns(self._result._where,
+                                         self._placeholders)
+        self._columns = [compared.get(id(placeholder))
+                         for placeholder in self._placeholders]
+        # What the query is built from, to flush changes it may see.
+        self._flush_expr = (
+            self._result._tables,
+            [info if is_expr else info.cls
+             for is_expr, info in self._result._find_spec._cls_spec_info],
+            self._result._where)
+        self._statements = {}
+
+    def __call__(self, *args, **kwargs):
+        """Get the result of the query for the given values.
+
+        @raises TypeError: Raised if the values don't match the
+            parameters of the query.
+        @return: A L{ResultSet}.
+        """
+        positional = [name for name, keyword_only, default
+                      in self._parameters if not keyword_only]
+        if len(args) > len(positional):
+            raise TypeError("Expected at most %d positional values, got %d"
+                            % (len(positional), len(args)))
+        given = dict(iter_zip(positional, args))
+        for name, value in iter_items(kwargs):
+            if name in given:
+                raise TypeError("Got multiple values for parameter %r"
+                                % (name,))
+            given[name] = value
+        values = []
+        for name, keyword_only, default in self._parameters:
+            value = given.pop(name, default)
+            if value is Undef:
+                raise TypeError("Missing value for parameter %r" % (name,))
+            values.append(value)
+        if given:
+            raise TypeError("Unexpected parameter %r" % (sorted(given)[0],))
+        self._store._implicit_flush(self._flush_expr)
+        result = self._result.copy()
+        result._prepared = (self, tuple(values))
+        return result
+
+    def _bind(self, values):
+        for placeholder, column, value in iter_zip(
+            self._placeholders, self._columns, values):
+            if isinstance(value, Variable):
+                value = value.get(to_db=True)
+            elif column is not None and value is not None:
+                value = column.variable_factory(value=value).get(to_db=True)
+            placeholder.set(value)
+
+    def _get_statement(self, result, select, kind):
+        """Get the statement compiled for C{kind} if C{result} allows it.
+
+        Statements are compiled the first time each kind is requested,
+        and are only reused for results configured exactly like the one
+        built when preparing, as they're otherwise likely to differ.
+        """
+        template = self._result.__dict__
+        for name, value in iter_items(result.__dict__):
+            if name != "_prepared" and template.get(name, Undef) is not value:
+                return select
+        statement = self._statements.get(kind)
+        if statement is None:
+            state = State()
+            sql = self._store._connection.compile(select, state)
+            bound = set(id(param) for param in state.parameters)
+            if all(id(placeholder) in bound
+                   for placeholder in self._placeholders):
+                statement = SQL(sql, state.parameters)
+            else:
+                # The SQL may depend on the values, compile it every time.
+                statement = False
+            self._statements[kind] = statement
+        if statement is False:
+            return select
+        return statement
+
+
 class EmptyResultSet(object):
     """An object that looks like a L{ResultSet} but represents no rows.
 
@@ -1543,6 +3034,31 @@ class EmptyResultSet(object):
     def config(self, distinct=None, offset=None, limit=None):
         pass
 
+    def prefetch(self, *references):
+        return self
+
+    def joined(self, *references):
+        return self
+
+    def load_only(self, *columns):
+        return self
+
+    def stream(self, batch_size=1000):
+        return self
+
+    def after(self, item):
+        return self
+
+    def keyset_token(self, item):
+        return None
+
+    def paginate(self, page_size, after=None):
+        return [], None
+
+    def iter_batches(self, size, release=True):
+        return
+        yield None
+
     def __iter__(self):
         return
         yield None
@@ -1619,6 +3135,14 @@ class EmptyResultSet(object):
         return
         yield None
 
+    def columns(self, *columns, **kwargs):
+        as_ = kwargs.get("as_", "array")
+        if not columns:
+            raise FeatureError("columns() takes at least one column "
+                               "as argument")
+        buffers = _create_column_buffers(columns, as_)
+        return _finish_column_buffers(columns, buffers, as_)
+
     def set(self, *args, **kwargs):
         pass
 
@@ -1658,8 +3182,7 @@ class TableSet(object):
 
         @return: A L{ResultSet}.
         """
-        if self._store._implicit_flush_block_count == 0:
-            self._store.flush()
+        self._store._implicit_flush((self._tables, cls_spec, args))
         find_spec = FindSpec(cls_spec)
         where = get_where_for_args(args, kwargs, find_spec.default_cls)
         return self._store._result_set_factory(self._store, find_spec,
@@ -1696,16 +3219,24 @@ class FindSpec(object):
             self.default_cls_info = None
             self.default_order = Undef
 
-    def get_columns_and_tables(self):
+    def get_columns_and_tables(self, partials=None):
+        """Return the columns to select and the tables they come from.
+
+        @param partials: Optional dictionary mapping the position of
+            classes in the spec to the L{_PartialLoad} of their objects.
+        """
         columns = []
         default_tables = []
-        for is_expr, info in self._cls_spec_info:
+        for index, (is_expr, info) in enumerate(self._cls_spec_info):
             if is_expr:
                 columns.append(info)
                 if isinstance(info, Column):
                     default_tables.append(info.table)
             else:
-                columns.extend(info.columns)
+                if partials and index in partials:
+                    columns.extend(partials[index].select_columns)
+                else:
+                    columns.extend(info.loaded_columns)
                 default_tables.append(info.table)
         return columns, default_tables
 
@@ -1739,7 +3270,7 @@ class FindSpec(object):
                 return False
         return True
 
-    def load_objects(self, store, result, values):
+    def load_objects(self, store, result, values, partials=None):
         objects = []
         values_start = values_end = 0
         for is_expr, info in self._cls_spec_info:
@@ -1749,9 +3280,14 @@ class FindSpec(object):
                     value=values[values_start], from_db=True)
                 objects.append(variable.get())
             else:
-                values_end += len(info.columns)
+                partial = partials.get(len(objects)) if partials else None
+                if partial is not None:
+                    values_end += len(partial.columns)
+                else:
+                    values_end += len(info.loaded_columns)
                 obj = store._load_object(info, result,
-                                         values[values_start:values_end])
+                                         values[values_start:values_end],
+                                         partial)
                 objects.append(obj)
             values_start = values_end
         if self.is_tuple:
@@ -1801,6 +3337,69 @@ def get_where_for_args(args, kwargs, cls=None):
     return Undef
 
 
+def get_table_name(cls_info):
+    """Return the name of the table C{cls_info} is stored in, if known."""
+    if isinstance(cls_info.table, Table):
+        return cls_info.table.name
+    return None
+
+
+_table_slots = frozenset(["table", "tables", "default_table", "default_tables",
+                          "left", "right"])
+# Slots holding names or keywords rather than SQL.
+_name_slots = frozenset(["name", "type", "escape"])
+
+def get_tables_for_expr(expr):
+    """Return the set of names of the tables used by C{expr}.
+
+    @param expr: An expression, or a sequence of expressions.
+    @return: The set of table names, or C{None} if C{expr} includes raw
+        SQL, which may use any table.
+    """
+    tables = set()
+    stack = [(expr, False)]
+    while stack:
+        expr, in_table = stack.pop()
+        if isinstance(expr, (SQLRaw, SQL)):
+            return None
+        elif isinstance(expr, string_types):
+            if not in_table:
+                # Strings in expressions may be compiled as raw SQL,
+                # which may use any table.
+                return None
+            tables.add(expr)
+        elif isinstance(expr, (tuple, list)):
+            stack.extend((item, in_table) for item in expr)
+        elif isinstance(expr, Table):
+            tables.add(expr.name)
+        elif isinstance(expr, Column):
+            stack.append((expr.table, True))
+        elif isinstance(expr, type):
+            try:
+                # Aliased classes are stored in the table of the original.
+                cls_info = get_cls_info(get_cls_info(expr).cls)
+            except ClassInfoError:
+                return None
+            stack.append((cls_info.table, True))
+        elif isinstance(expr, Expr):
+            for cls in type(expr).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                if isinstance(slots, string_types):
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ("compile_cache", "compile_id"):
+                        value = getattr(expr, name, Undef)
+                        if not (name in _name_slots and
+                                isinstance(value, string_types)):
+                            stack.append((value,
+                                          in_table or name in _table_slots))
+            for name, value in iter_items(getattr(expr, "__dict__", {})):
+                if not (name in _name_slots and
+                        isinstance(value, string_types)):
+                    stack.append((value, in_table or name in _table_slots))
+    return tables
+
+
 def replace_columns(expr, columns):
     if isinstance(expr, Select):
         select = copy(expr)
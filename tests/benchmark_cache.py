@@ -0,0 +1,86 @@
+#
+# Copyright (c) 2006, 2007 Canonical
+#
+# Written by Gustavo Niemeyer <gustavo@niemeyer.net>
+#
+# This file is part of Storm Object Relational Mapper.
+#
+# Storm is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as
+# published by the Free Software Foundation; either version 2.1 of
+# the License, or (at your option) any later version.
+#
+# Storm is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Compare the cost of adding entries to the object caches.
+
+Run it with C{make benchmark-cache}, or directly with::
+
+    python -m tests.benchmark_cache [SIZE...]
+
+For each cache size (1k, 100k and 1M entries by default), entries are
+picked at random from a pool twice as large as the cache, so that about
+half of the additions evict an older entry, and the average time of
+L{Cache.add} and L{GenerationalCache.add} is printed in microseconds.
+"""
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from storm.compat import iter_range
+from storm.cache import Cache, GenerationalCache
+
+
+OPERATIONS = 200000
+
+
+class StubObjectInfo(object):
+
+    __slots__ = ("obj",)
+
+    def __init__(self):
+        self.obj = object()
+
+    def get_obj(self):
+        return self.obj
+
+
+def time_add(cache_factory, size, operations=OPERATIONS):
+    """Get the average time of adding random entries to a full cache.
+
+    @param cache_factory: The cache class to measure.
+    @param size: The size of the cache.
+    @param operations: How many entries to add once the cache is full.
+    @return: The average time of an addition, in microseconds.
+    """
+    pool = [StubObjectInfo() for i in iter_range(size * 2)]
+    cache = cache_factory(size)
+    for obj_info in pool:
+        cache.add(obj_info)
+    picked = [random.choice(pool) for i in iter_range(operations)]
+    add = cache.add
+    start = time.time()
+    for obj_info in picked:
+        add(obj_info)
+    return (time.time() - start) * 1e6 / operations
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [1000, 100000, 1000000]
+    print("%12s %12s %18s" % ("size", "Cache", "GenerationalCache"))
+    for size in sizes:
+        print("%12s %12.2f %18.2f" % (
+            "{:,}".format(size), time_add(Cache, size),
+            time_add(GenerationalCache, size)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -25,8 +25,9 @@ import sys
 import types
 
 from storm.compat import iter_items, iter_range, ustr
-from storm.exceptions import ClosedError, DatabaseError, DisconnectionError
-from storm.variables import Variable
+from storm.exceptions import (
+    ClosedError, DatabaseError, DisconnectionError, NoneError)
+from storm.variables import Variable, IntVariable, UnicodeVariable
 import storm.database
 from storm.database import *
 from storm.tracer import install_tracer, remove_all_tracers, DebugTracer
@@ -495,6 +496,31 @@ class ResultTest(TestHelper):
         self.result.set_variable(variable, marker)
         assert variable.get() == marker
 
+    def test_get_converter(self):
+        convert = self.result.get_converter(IntVariable)
+        value = 1 << 70
+        assert convert(value) is value
+        assert convert(None) is None
+        assert convert(2.5) == 2
+        assert type(convert(True)) is int
+
+    def test_get_converter_plain_variable(self):
+        assert self.result.get_converter(Variable) is None
+
+    def test_get_converter_uses_set_variable(self):
+        self.result.set_variable = lambda variable, value: variable.set(
+            value.decode("utf-8"), from_db=True)
+        convert = self.result.get_converter(UnicodeVariable)
+        assert convert(u"a") == u"a"
+        assert convert(b"b") == u"b"
+
+    def test_get_converter_disallowing_none(self):
+        convert = self.result.get_converter(
+            lambda: Variable(allow_none=False))
+        assert convert(marker) is marker
+        with pytest.raises(NoneError):
+            convert(None)
+
     def test_close(self):
         self.result.close()
         assert self.executed == ["RCLOSE"]
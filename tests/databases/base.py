@@ -29,10 +29,11 @@ import unittest
 
 from storm.compat import is_python2, ustr
 from storm.uri import URI
-from storm.expr import Select, Column, SQLToken, SQLRaw, Count, Alias
+from storm.expr import (
+    Select, Update, Column, SQLToken, SQLRaw, Count, Alias, And)
 from storm.variables import (Variable, RawStrVariable, DecimalVariable,
                              DateTimeVariable, DateVariable, TimeVariable,
-                             TimeDeltaVariable)
+                             TimeDeltaVariable, IntVariable)
 from storm.database import *
 from storm.xid import Xid
 from storm.event import EventSystem
@@ -173,6 +174,74 @@ class DatabaseTest(object):
         result = self.connection.execute(Select(SQLRaw("1")))
         assert result.get_one(), (1,)
 
+    def test_execute_many(self):
+        id_column = Column("id", SQLToken("test"))
+        title_column = Column("title", SQLToken("test"))
+        self.connection.execute_many(
+            [Update({title_column: u"Title %d" % (id * 10)},
+                    id_column == id, SQLToken("test"))
+             for id in (10, 20)])
+        result = self.connection.execute("SELECT * FROM test ORDER BY id")
+        assert result.get_all() == [(10, "Title 100"), (20, "Title 200")]
+
+    def test_execute_many_groups_same_statements(self):
+        calls = []
+        raw_execute_many = self.connection.raw_execute_many
+        def record_raw_execute_many(statement, params_list):
+            calls.append(len(params_list))
+            return raw_execute_many(statement, params_list)
+        self.connection.raw_execute_many = record_raw_execute_many
+
+        id_column = Column("id", SQLToken("test"))
+        title_column = Column("title", SQLToken("test"))
+        self.connection.execute_many(
+            [Update({title_column: u"Title %d" % id},
+                    id_column == id, SQLToken("test"))
+             for id in (10, 20)] +
+            [Update({id_column: 30}, id_column == 20, SQLToken("test"))])
+        assert calls == [2]
+        result = self.connection.execute("SELECT * FROM test ORDER BY id")
+        assert result.get_all() == [(10, "Title 10"), (30, "Title 20")]
+
+    def test_compile_cached(self):
+        id_column = Column("id", SQLToken("test"))
+        build_calls = []
+
+        def build(variables):
+            build_calls.append(variables)
+            return Select(Column("title", SQLToken("test")),
+                          And(id_column == variables[0], id_column != 15))
+
+        results = []
+        for id in (10, 20):
+            statement = self.connection.compile_cached(
+                "title", build, [IntVariable(id)])
+            results.append(self.connection.execute(statement).get_all())
+        assert len(build_calls) == 1
+        assert results == [[("Title 10",)], [("Title 20",)]]
+
+    def test_compile_cached_with_unbound_variable(self):
+        id_column = Column("id", SQLToken("test"))
+        build_calls = []
+
+        def build(variables):
+            build_calls.append(variables)
+            return Select(Column("title", SQLToken("test")),
+                          id_column == SQLRaw(str(variables[0].get())))
+
+        results = []
+        for id in (10, 20):
+            statement = self.connection.compile_cached(
+                "title", build, [IntVariable(id)])
+            results.append(self.connection.execute(statement).get_all())
+        assert len(build_calls) == 2
+        assert results == [[("Title 10",)], [("Title 20",)]]
+
+    def test_execute_streaming(self):
+        result = self.connection.execute_streaming(
+            "SELECT * FROM test ORDER BY id", batch_size=1)
+        assert list(result) == [(10, "Title 10"), (20, "Title 20")]
+
     def test_get_one(self):
         result = self.connection.execute("SELECT * FROM test ORDER BY id")
         assert result.get_one() == (10, "Title 10")
@@ -23,17 +23,18 @@ import os
 import pytest
 import json
 
-from storm.compat import bstr, iter_range, ustr
+from storm.compat import bstr, iter_range, ustr, StringIO
 from storm.databases.postgres import (
     Postgres, compile, currval, Returning, Case,
     make_dsn, JSONElement, JSONTextElement, JSON)
-from storm.database import create_database
+from storm.database import create_database, STATE_RECONNECT
 from storm.store import Store
-from storm.exceptions import InterfaceError, ProgrammingError
+from storm.tracer import debug, install_tracer, remove_tracer
+from storm.exceptions import IntegrityError, InterfaceError, ProgrammingError
 from storm.variables import DateTimeVariable, RawStrVariable
 from storm.variables import ListVariable, IntVariable, Variable
 from storm.properties import Int
-from storm.exceptions import DisconnectionError, OperationalError
+from storm.exceptions import DisconnectionError, Error, OperationalError
 from storm.expr import (
     Union, Select, Insert, Update, Alias, SQLRaw, SQLToken, State, Sequence,
     Like, Column, COLUMN, Cast, Func, FromExpr,
@@ -489,6 +490,174 @@ class PostgresTest(DatabaseTest, TestHelper):
         result = self.connection.execute("SELECT * FROM returning_test")
         assert result.get_one() == (123, 456)
 
+    def test_execute_many_batches_same_statements(self):
+        import psycopg2.extras
+        batches = []
+        execute_batch = psycopg2.extras.execute_batch
+        def record_execute_batch(cursor, statement, params_list):
+            batches.append((statement, params_list))
+            return execute_batch(cursor, statement, params_list)
+        self.addCleanup(setattr, psycopg2.extras, "execute_batch",
+                        execute_batch)
+        psycopg2.extras.execute_batch = record_execute_batch
+
+        id_column = Column("id", "test")
+        self.connection.execute_many(
+            [Update({"title": u"Title %d" % (id * 10)}, id_column == id,
+                    "test")
+             for id in (10, 20)] +
+            [Update({"id": 30}, id_column == 20, "test")])
+        assert batches == [
+            ('UPDATE test SET title=%s WHERE test.id = %s',
+             [("Title 100", 10), ("Title 200", 20)])]
+
+        result = self.connection.execute("SELECT * FROM test ORDER BY id")
+        assert result.get_all() == [(10, "Title 100"), (30, "Title 200")]
+
+    def test_execute_many_traces_failed_statement(self):
+        errors = []
+        class Tracer(object):
+            def connection_raw_execute_error(self, connection, raw_cursor,
+                                             statement, params, error):
+                errors.append((statement,
+                               [param.get() for param in params]))
+        tracer = Tracer()
+        install_tracer(tracer)
+        self.addCleanup(remove_tracer, tracer)
+
+        id_column = Column("id", "test")
+        with pytest.raises(IntegrityError):
+            self.connection.execute_many(
+                [Update({"title": u"Title; %d" % id}, id_column == id,
+                        "test")
+                 for id in (10, 20)] +
+                [Update({"id": 20}, id_column == 10, "test")])
+        assert errors == [("UPDATE test SET id=%s WHERE test.id = %s",
+                           [20, 10])]
+
+    def test_execute_streaming_uses_server_side_cursor(self):
+        result = self.connection.execute_streaming(
+            "SELECT * FROM test ORDER BY id", batch_size=1)
+        assert result._raw_cursor.name is not None
+        assert result.get_one() == (10, "Title 10")
+        self.connection.rollback()
+        with pytest.raises(ProgrammingError):
+            result.get_one()
+        result = self.connection.execute("SELECT * FROM test ORDER BY id")
+        assert result._raw_cursor.name is None
+
+    def test_execute_streaming_with_autocommit(self):
+        database = create_database(
+            os.environ["STORM_POSTGRES_URI"] + "?isolation=autocommit")
+        connection = database.connect()
+        self.addCleanup(connection.close)
+        result = connection.execute_streaming(
+            "SELECT * FROM test ORDER BY id", batch_size=1)
+        assert list(result) == [(10, "Title 10"), (20, "Title 20")]
+
+    def get_prepared_statements(self, connection):
+        result = connection.execute("SELECT name FROM pg_prepared_statements")
+        return sorted(name for name, in result)
+
+    def test_prepare_options(self):
+        database = create_database(
+            "postgres://un:pw@ht:12/db?prepare_threshold=5&prepare_size=20")
+        assert database._prepare_threshold == 5
+        assert database._prepare_size == 20
+        database = create_database("postgres://un:pw@ht:12/db")
+        assert database._prepare_threshold == 0
+
+    def test_wb_prepare_threshold(self):
+        self.database._prepare_threshold = 2
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+        for id in (10, 20, 10):
+            result = self.connection.execute(
+                "SELECT title FROM test WHERE id = ?", (id,))
+            assert result.get_all() == [("Title %d" % id,)]
+        statements = stream.getvalue()
+        assert statements.count("PREPARE storm_prepared_1 AS "
+                                "SELECT title FROM test WHERE id = $1") == 1
+        assert statements.count("EXECUTE storm_prepared_1") == 2
+        assert self.get_prepared_statements(self.connection) == [
+            "storm_prepared_1"]
+
+    def test_prepare_threshold_not_set(self):
+        for id in (10, 20, 10):
+            self.connection.execute(
+                "SELECT title FROM test WHERE id = ?", (id,))
+        assert self.get_prepared_statements(self.connection) == []
+
+    def test_wb_prepare_size(self):
+        self.database._prepare_threshold = 2
+        self.database._prepare_size = 1
+        for i in iter_range(2):
+            self.connection.execute(
+                "SELECT title FROM test WHERE id = ?", (10,))
+        for i in iter_range(2):
+            self.connection.execute(
+                "SELECT id FROM test WHERE title = ?", (u"Title 10",))
+        assert self.get_prepared_statements(self.connection) == [
+            "storm_prepared_2"]
+
+    def test_wb_prepare_failure_keeps_transaction(self):
+        self.database._prepare_threshold = 2
+        self.connection.execute(
+            "UPDATE test SET title='Title 15' WHERE id=10")
+        for i in iter_range(3):
+            result = self.connection.execute("SELECT ? IS NULL", (None,))
+            assert result.get_all() == [(True,)]
+        result = self.connection.execute("SELECT title FROM test WHERE id=10")
+        assert result.get_one() == ("Title 15",)
+        assert self.get_prepared_statements(self.connection) == []
+
+    def test_prepare_in_aborted_transaction(self):
+        self.database._prepare_threshold = 2
+        self.connection.execute("SELECT title FROM test WHERE id = ?", (10,))
+        with pytest.raises(ProgrammingError):
+            self.connection.execute("SELECT * FROM nonexistent")
+        with pytest.raises(Error) as info:
+            self.connection.execute(
+                "SELECT title FROM test WHERE id = ?", (10,))
+        assert "current transaction is aborted" in str(info.value)
+
+    def test_wb_prepare_per_parameter_types(self):
+        self.database._prepare_threshold = 2
+        for i in iter_range(2):
+            result = self.connection.execute("SELECT ?", (None,))
+            assert result.get_all() == [(None,)]
+        for i in iter_range(3):
+            result = self.connection.execute("SELECT ?", (1,))
+            assert result.get_all() == [(1,)]
+        assert len(self.connection._prepared_statements) == 1
+
+    def test_prepare_with_autocommit(self):
+        database = create_database(
+            os.environ["STORM_POSTGRES_URI"] +
+            "?isolation=autocommit&prepare_threshold=2")
+        connection = database.connect()
+        self.addCleanup(connection.close)
+        for i in iter_range(3):
+            result = connection.execute("SELECT ? IS NULL", (None,))
+            assert result.get_all() == [(True,)]
+        for i in iter_range(3):
+            result = connection.execute("SELECT ? + 1", (1,))
+            assert result.get_all() == [(2,)]
+        assert len(self.get_prepared_statements(connection)) == 1
+
+    def test_wb_prepare_after_reconnect(self):
+        self.database._prepare_threshold = 2
+        for i in iter_range(2):
+            self.connection.execute(
+                "SELECT title FROM test WHERE id = ?", (10,))
+        self.connection._raw_connection.close()
+        self.connection._state = STATE_RECONNECT
+        result = self.connection.execute(
+            "SELECT title FROM test WHERE id = ?", (10,))
+        assert result.get_all() == [("Title 10",)]
+        assert len(self.get_prepared_statements(self.connection)) == 1
+
     def test_wb_execute_insert_returning_not_used_with_old_postgres(self):
         """Shouldn't try to use RETURNING with PostgreSQL < 8.2."""
         column1 = Column("id1", "returning_test")
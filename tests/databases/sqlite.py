@@ -26,9 +26,11 @@ import unittest
 
 from storm.compat import is_python2, ustr
 from storm.exceptions import OperationalError
+from storm.expr import Row, Select
 from storm.databases.sqlite import SQLite
 from storm.database import create_database
 from storm.uri import URI
+from storm.variables import IntVariable
 
 from tests.databases.base import DatabaseTest, UnsupportedDatabaseTest
 from tests.helper import TestHelper, MakePath
@@ -92,6 +94,12 @@ class SQLiteMemoryTest(DatabaseTest, TestHelper):
         for word in reserved_words:
             assert self.connection.compile.is_reserved_word(word)
 
+    def test_compile_row(self):
+        expr = Row(IntVariable(1), IntVariable(2)) > Row(IntVariable(1),
+                                                         IntVariable(1))
+        assert self.connection.compile(expr) == "(?, ?) > (?, ?)"
+        assert self.connection.execute(Select(expr)).get_one() == (1,)
+
 
 class SQLiteFileTest(SQLiteMemoryTest):
 
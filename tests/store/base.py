@@ -20,7 +20,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from array import array
 import decimal
+import functools
 import gc
 import operator
 import pytest
@@ -34,15 +36,17 @@ from storm.properties import (
     Int, Float, JSON, RawStr, Unicode, Property, UUID)
 from storm.properties import PropertyPublisherMeta, Decimal
 from storm.expr import (
-    Asc, Desc, Select, LeftJoin, SQL, Count, Sum, Avg, And, Or, Eq, Lower)
+    Asc, Desc, Select, Join, LeftJoin, SQL, Count, Sum, Avg, And, Or, Eq,
+    Lower)
 from storm.variables import Variable, JSONVariable, UnicodeVariable, IntVariable
-from storm.info import get_obj_info, ClassAlias
+from storm.info import get_cls_info, get_obj_info, ClassAlias
 from storm.exceptions import (
     ClosedError, ConnectionBlockedError, FeatureError, LostObjectError,
-    NoStoreError, NotFlushedError, NotOneError, OrderLoopError, UnorderedError,
-    WrongStoreError, DisconnectionError)
-from storm.cache import Cache
+    NoneError, NoStoreError, NotFlushedError, NotOneError, OrderLoopError,
+    UnorderedError, WrongStoreError, DisconnectionError)
+from storm.cache import Cache, MemoryBudgetCache
 from storm.store import AutoReload, EmptyResultSet, Store, ResultSet
+from storm.store import _decode_keyset_token
 from storm.tracer import debug
 
 from tests.base import Wrapper
@@ -318,6 +322,60 @@ class StoreTest(object):
         with pytest.raises(ClosedError):
             store.execute("SELECT 1")
 
+    def test_memory_budget_cache(self):
+        store = Store(self.database, cache=MemoryBudgetCache())
+        try:
+            foo = store.get(Foo, 10)
+            obj_info = get_obj_info(foo)
+            assert store._cache.get_cached() == [obj_info]
+            usage = store._cache.get_usage()
+            assert usage > 0
+
+            store.get(Foo, 20)
+            assert store._cache.get_usage() > usage
+            usage = store._cache.get_usage()
+
+            store.invalidate(foo)
+            assert store._cache.get_usage() < usage
+        finally:
+            store.close()
+
+    def test_memory_budget_cache_counts_values_loaded_later(self):
+        self.store.execute("UPDATE foo SET title = '%s' WHERE id = 10"
+                           % ("x" * 100000))
+        self.store.commit()
+        store = Store(self.database, cache=MemoryBudgetCache())
+        try:
+            foo = store.find(Foo, id=10).load_only(Foo.id).one()
+            usage = store._cache.get_usage()
+            assert len(foo.title) == 100000
+            assert store._cache.get_usage() - usage > 99000
+
+            store.invalidate(foo)
+            store.find(Foo, id=10).load_only(Foo.id).one()
+            usage = store._cache.get_usage()
+            assert len(foo.title) == 100000
+            assert store._cache.get_usage() - usage > 99000
+        finally:
+            store.close()
+
+    def test_cache_without_update(self):
+        class OldCache(object):
+            def __init__(self):
+                self._cache = Cache()
+            def __getattr__(self, name):
+                if name == "update":
+                    raise AttributeError(name)
+                return getattr(self._cache, name)
+
+        store = Store(self.database, cache=OldCache())
+        try:
+            foo = store.find(Foo, id=10).load_only(Foo.id).one()
+            assert foo.title == "Title 30"
+            assert store._cache.get_cached() == [get_obj_info(foo)]
+        finally:
+            store.close()
+
     def test_get(self):
         foo = self.store.get(Foo, 10)
         assert foo.id == 10
@@ -490,6 +548,114 @@ class StoreTest(object):
         foo3 = self.store.find(Foo, Foo.id == 20).one()
         assert foo3.title == u"changed"
 
+    def test_wb_set_values_refuses_unknown_lazy_value(self):
+        foo = self.store.get(Foo, 20)
+        result = self.store.execute("SELECT 1")
+        foo.title = Lower(u"Title")
+        obj_info = get_obj_info(foo)
+        with pytest.raises(RuntimeError):
+            self.store._set_values(obj_info, (Foo.title,), result,
+                                   (u"Loaded",))
+        self.store._set_values(obj_info, (Foo.title,), result,
+                               (u"Loaded",), replace_unknown_lazy=True)
+        assert obj_info.variables[Foo.title].get_lazy() is None
+        assert foo.title == u"Loaded"
+
+    def test_wb_set_values_keep_defined(self):
+        foo = self.store.get(Foo, 20)
+        obj_info = get_obj_info(foo)
+        obj_info.variables[Foo.title].delete()
+        result = self.store.execute("SELECT 1")
+        self.store._set_values(obj_info, (Foo.id, Foo.title), result,
+                               (30, u"Loaded"), keep_defined=True)
+        assert foo.id == 20
+        assert foo.title == u"Loaded"
+        assert not obj_info.variables[Foo.title].has_changed()
+
+    def test_wb_loaded_object_carries_no_store_hooks(self):
+        foo = self.store.get(Foo, 20)
+        obj_info = get_obj_info(foo)
+        assert obj_info.event._hooks == {}
+        assert obj_info.event._shared_hooks == (self.store._change_hooks,
+                                                self.store._lazy_hooks)
+
+        foo.title = u"New title"
+        assert self.store._is_dirty(obj_info)
+
+        self.store.remove(foo)
+        self.store.flush()
+        assert obj_info.event._shared_hooks == ()
+
+    def test_load_object_with_overridden_variable_methods(self):
+        calls = []
+
+        class TracingVariable(UnicodeVariable):
+
+            def get_lazy(self, default=None):
+                calls.append("get_lazy")
+                return super(TracingVariable, self).get_lazy(default)
+
+            def set(self, value, from_db=False):
+                calls.append("set")
+                super(TracingVariable, self).set(value, from_db)
+
+            def checkpoint(self):
+                calls.append("checkpoint")
+                super(TracingVariable, self).checkpoint()
+
+        class MyFoo(Foo):
+            title = Property(variable_class=TracingVariable)
+
+        del calls[:]
+        foo = self.store.find(MyFoo, id=20).one()
+        assert foo.title == u"Title 20"
+        assert calls == ["get_lazy", "set", "checkpoint"]
+
+    def test_wb_load_object_keeps_values_until_accessed(self):
+        calls = []
+
+        class TracingVariable(UnicodeVariable):
+
+            def set(self, value, from_db=False):
+                calls.append("set")
+                super(TracingVariable, self).set(value, from_db)
+
+            def checkpoint(self):
+                calls.append("checkpoint")
+                super(TracingVariable, self).checkpoint()
+
+        class MyFoo(Foo):
+            title = Property(variable_class=TracingVariable)
+
+        # Results with the default set_variable() have their values
+        # kept in the variable slots, to be converted once accessed.
+        class StubResult(Result):
+            def __init__(self):
+                pass
+
+        cls_info = get_cls_info(MyFoo)
+        values = [{"id": 20, "title": u"Title 20"}[column.name]
+                  for column in cls_info.loaded_columns]
+        foo = self.store._load_object(cls_info, StubResult(), values)
+        slots = get_obj_info(foo).variables._slots
+        assert slots[cls_info.column_positions[id(MyFoo.title)]] == (
+            u"Title 20")
+        assert calls == []
+        assert foo.title == u"Title 20"
+        assert calls == ["set", "checkpoint"]
+
+    def test_load_object_with_bad_value_fails_when_accessed(self):
+        class StubResult(Result):
+            def __init__(self):
+                pass
+
+        cls_info = get_cls_info(Foo)
+        values = [{"id": 20, "title": 42}[column.name]
+                  for column in cls_info.loaded_columns]
+        foo = self.store._load_object(cls_info, StubResult(), values)
+        with pytest.raises(TypeError):
+            foo.title
+
     def test_obj_info_with_deleted_object_with_get(self):
         # Same thing, but using get rather than find.
 
@@ -515,25 +681,717 @@ class StoreTest(object):
         # Disable the cache, which holds strong references.
         self.get_cache(self.store).set_size(0)
 
-        foo = self.store.get(Foo, 20)
-        foo.title = u"Changed"
-        foo.tainted = True
-        obj_info = get_obj_info(foo)
+        foo = self.store.get(Foo, 20)
+        foo.title = u"Changed"
+        foo.tainted = True
+        obj_info = get_obj_info(foo)
+
+        del foo
+        gc.collect()
+
+        assert obj_info.get_obj()
+
+    def test_get_tuple(self):
+        class MyFoo(Foo):
+            __storm_primary__ = "title", "id"
+        foo = self.store.get(MyFoo, (u"Title 30", 10))
+        assert foo.id == 10
+        assert foo.title == "Title 30"
+
+        foo = self.store.get(MyFoo, (u"Title 20", 10))
+        assert foo == None
+
+    def test_get_many(self):
+        foo20 = self.store.get(Foo, 20)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        foos = self.store.get_many(Foo, [30, 40, 20, 10, 30])
+        assert stream.getvalue().count("SELECT") == 1
+        assert [foo and foo.id for foo in foos] == [30, None, 20, 10, 30]
+        assert foos[2] is foo20
+        assert foos[0] is foos[4]
+        assert foos[3] is self.store.get(Foo, 10)
+
+    def test_get_many_empty(self):
+        assert self.store.get_many(Foo, []) == []
+
+    def test_get_many_tuple(self):
+        links = self.store.get_many(Link, [(20, 100), (10, 400), (30, 300)])
+        assert links[0].foo_id == 20
+        assert links[0].bar_id == 100
+        assert links[1] is None
+        assert links[2].foo_id == 30
+        assert links[2].bar_id == 300
+
+    def test_get_many_respects_max_parameters(self):
+        self.store._connection.max_parameters = 2
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        foos = self.store.get_many(Foo, [10, 20, 30])
+        assert stream.getvalue().count("SELECT") == 2
+        assert [foo.id for foo in foos] == [10, 20, 30]
+
+    def test_get_many_remembers_missing_keys(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        assert self.store.get_many(Foo, [40]) == [None]
+        assert self.store.get_many(Foo, [40]) == [None]
+        assert stream.getvalue().count("SELECT") == 1
+
+        self.store.rollback()
+        assert self.store.get_many(Foo, [40]) == [None]
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_get_many_forgets_missing_keys_on_execute(self):
+        assert self.store.get_many(Foo, [40]) == [None]
+        self.store.execute("INSERT INTO foo (id, title)"
+                           " VALUES (40, 'Title 40')")
+        foo = self.store.get_many(Foo, [40])[0]
+        assert foo.title == u"Title 40"
+
+    def test_get_many_finds_added_objects(self):
+        assert self.store.get_many(Foo, [40]) == [None]
+        foo = Foo()
+        foo.id = 40
+        self.store.add(foo)
+        assert self.store.get_many(Foo, [40]) == [foo]
+
+    def test_get_many_finds_flushed_objects_after_collection(self):
+        self.get_cache(self.store).set_size(0)
+        assert self.store.get_many(Foo, [100]) == [None]
+        foo = Foo()
+        foo.id = 100
+        foo.title = u"Title 100"
+        self.store.add(foo)
+        self.store.flush()
+        del foo
+        gc.collect()
+
+        foo = self.store.get_many(Foo, [100])[0]
+        assert foo is not None
+        assert foo.title == u"Title 100"
+
+    def test_get_many_finds_objects_with_changed_primary_key(self):
+        self.get_cache(self.store).set_size(0)
+        assert self.store.get_many(Foo, [100]) == [None]
+        foo = self.store.get(Foo, 10)
+        foo.id = 100
+        self.store.flush()
+        del foo
+        gc.collect()
+
+        foo = self.store.get_many(Foo, [100])[0]
+        assert foo is not None
+        assert foo.title == u"Title 30"
+
+    def test_get_many_finds_objects_after_result_set(self):
+        assert self.store.get_many(Foo, [100]) == [None]
+        self.store.find(Foo, id=10).set(id=100)
+
+        foo = self.store.get_many(Foo, [100])[0]
+        assert foo is not None
+        assert foo.title == u"Title 30"
+
+    def test_prefetch_reference(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(Bar).order_by(Bar.id).prefetch(Bar.foo)
+        titles = [bar.foo.title for bar in result]
+        assert titles == [u"Title 30", u"Title 20", u"Title 10"]
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_prefetch_reference_with_remote_key(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(FooRef).order_by(FooRef.id)
+        bar_ids = [foo.bar.id for foo in result.prefetch(FooRef.bar)]
+        assert bar_ids == [100, 200, 300]
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_prefetch_reference_with_ambiguous_remote_key(self):
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 10, 'Title 400')")
+        result = self.store.find(FooRef, id=10).prefetch(FooRef.bar)
+        foo = result.one()
+        with pytest.raises(NotOneError):
+            foo.bar
+
+    def test_prefetch_reference_set(self):
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 10, 'Title 400')")
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(FooRefSetOrderID).order_by(Foo.id)
+        foos = list(result.prefetch(FooRefSetOrderID.bars))
+        assert [[bar.id for bar in foo.bars] for foo in foos] == [
+            [100, 400], [200], [300]]
+        assert [foo.bars.count() for foo in foos] == [2, 1, 1]
+        bar = self.store.get(Bar, 200)
+        assert bar in foos[1].bars
+        assert bar not in foos[0].bars
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_prefetch_indirect_reference_set(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(FooIndRefSetOrderID).order_by(Foo.id)
+        foos = list(result.prefetch(FooIndRefSetOrderID.bars))
+        assert [[bar.id for bar in foo.bars] for foo in foos] == [
+            [100, 200, 300], [100, 200], [300]]
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_prefetch_tuple_find(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find((FooRefSet, Bar), Bar.foo_id == Foo.id)
+        result.prefetch(FooRefSet.bars, Bar.foo)
+        for foo, bar in result:
+            assert list(foo.bars) == [bar]
+            assert bar.foo.id == foo.id
+        assert stream.getvalue().count("SELECT") == 3
+
+    def test_prefetch_respects_max_parameters(self):
+        self.store._connection.max_parameters = 1
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        foos = list(self.store.find(FooRefSet).prefetch(FooRefSet.bars))
+        bar_ids = sorted(bar.id for foo in foos for bar in foo.bars)
+        assert bar_ids == [100, 200, 300]
+        assert stream.getvalue().count("SELECT") == 4
+
+    def test_load_reference_sets(self):
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 10, 'Title 400')")
+        foos = list(self.store.find(FooRefSetOrderID).order_by(Foo.id))
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.load_reference_sets(foos, FooRefSetOrderID.bars)
+        assert [[bar.id for bar in foo.bars] for foo in foos] == [
+            [100, 400], [200], [300]]
+        assert [foo.bars.first().id for foo in foos] == [100, 200, 300]
+        assert [foo.bars.last().id for foo in foos] == [400, 200, 300]
+        assert foos[1].bars.one().id == 200
+        assert foos[2].bars.any().id == 300
+        with pytest.raises(NotOneError):
+            foos[0].bars.one()
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_load_indirect_reference_sets(self):
+        foos = list(self.store.find(FooIndRefSetOrderID).order_by(Foo.id))
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.load_reference_sets(foos, FooIndRefSetOrderID.bars)
+        assert [[bar.id for bar in foo.bars] for foo in foos] == [
+            [100, 200, 300], [100, 200], [300]]
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_load_reference_sets_with_filter_queries(self):
+        foo = self.store.get(FooRefSet, 10)
+        self.store.load_reference_sets([foo], FooRefSet.bars)
+        assert list(foo.bars.find(Bar.id == 200)) == []
+        assert foo.bars.any(Bar.id == 100).id == 100
+
+    def test_load_reference_sets_wrong_store(self):
+        foo = FooRefSet()
+        with pytest.raises(WrongStoreError):
+            self.store.load_reference_sets([foo], FooRefSet.bars)
+
+    def test_load_reference_sets_forgotten_on_clear(self):
+        foo = self.store.get(FooRefSet, 10)
+        self.store.load_reference_sets([foo], FooRefSet.bars)
+        foo.bars.clear()
+        assert list(foo.bars) == []
+
+    def test_load_reference_sets_forgotten_on_remove(self):
+        foo = self.store.get(FooRefSet, 10)
+        self.store.load_reference_sets([foo], FooRefSet.bars)
+        foo.bars.remove(self.store.get(Bar, 100))
+        assert list(foo.bars) == []
+
+    def test_load_indirect_reference_sets_forgotten_on_clear(self):
+        foo = self.store.get(FooIndRefSet, 20)
+        self.store.load_reference_sets([foo], FooIndRefSet.bars)
+        foo.bars.clear()
+        assert list(foo.bars) == []
+
+    def test_lazy_column(self):
+        class LazyFoo(object):
+            __storm_table__ = "foo"
+            id = Int(primary=True)
+            title = Unicode(lazy=True)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        foos = list(self.store.find(LazyFoo).order_by(LazyFoo.id))
+        foo = self.store.get(LazyFoo, 20)
+        assert "title" not in stream.getvalue()
+        assert foo.title == u"Title 20"
+        assert [foo.title for foo in foos] == [
+            u"Title 30", u"Title 20", u"Title 10"]
+        assert stream.getvalue().count("SELECT") == 4
+
+    def test_lazy_columns_load_together(self):
+        class LazyBar(object):
+            __storm_table__ = "bar"
+            id = Int(primary=True)
+            foo_id = Int(lazy=True)
+            title = Unicode(lazy=True)
+
+        bar = self.store.get(LazyBar, 100)
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        assert bar.title == u"Title 300"
+        assert bar.foo_id == 10
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_lazy_column_not_loaded_with_autoreload(self):
+        class LazyBar(object):
+            __storm_table__ = "bar"
+            id = Int(primary=True)
+            foo_id = Int()
+            title = Unicode(lazy=True)
+
+        bar = self.store.get(LazyBar, 100)
+        self.store.commit()
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        assert bar.foo_id == 10
+        assert "title" not in stream.getvalue()
+        assert bar.title == u"Title 300"
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_lazy_column_set(self):
+        class LazyFoo(object):
+            __storm_table__ = "foo"
+            id = Int(primary=True)
+            title = Unicode(lazy=True)
+
+        foo = self.store.get(LazyFoo, 20)
+        foo.title = u"New title"
+        self.store.flush()
+        assert self.store.execute("SELECT title FROM foo WHERE id=20"
+                                  ).get_one() == (u"New title",)
+        self.store.invalidate()
+        assert self.store.get(LazyFoo, 20).title == u"New title"
+
+    def test_load_only(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(Bar).order_by(Bar.id).load_only(Bar.title)
+        bars = list(result)
+        assert [bar.title for bar in bars] == [
+            u"Title 300", u"Title 200", u"Title 100"]
+        assert "foo_id" not in stream.getvalue()
+        assert bars[0].foo_id == 10
+        assert stream.getvalue().count("SELECT") == 2
+
+    def test_load_only_keeps_identity(self):
+        bar = self.store.get(Bar, 100)
+        bar.title = u"New title"
+        result = self.store.find(Bar, id=100).load_only(Bar.foo_id)
+        assert result.one() is bar
+        assert bar.title == u"New title"
+
+    def test_load_only_lazy_column(self):
+        class LazyFoo(object):
+            __storm_table__ = "foo"
+            id = Int(primary=True)
+            title = Unicode(lazy=True)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(LazyFoo, id=20).load_only(LazyFoo.title)
+        assert result.one().title == u"Title 20"
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_load_only_tuple_find(self):
+        result = self.store.find((Foo, Bar), Bar.foo_id == Foo.id,
+                                 Bar.id == 200)
+        foo, bar = result.load_only(Bar.title).one()
+        assert (foo.title, bar.title) == (u"Title 20", u"Title 200")
+        assert bar.foo is foo
+
+    def test_load_only_reset(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(Bar, id=100).load_only(Bar.title)
+        bar = result.load_only().one()
+        assert bar.foo_id == 10
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_load_only_unsupported(self):
+        with pytest.raises(FeatureError):
+            self.store.find(Bar).load_only(Foo.title)
+        result = self.store.find(Bar).load_only(Bar.title)
+        with pytest.raises(FeatureError):
+            result.union(self.store.find(Bar))
+
+    def test_stream(self):
+        result = self.store.find(Foo).order_by(Foo.id).stream(batch_size=2)
+        assert [foo.id for foo in result] == [10, 20, 30]
+
+    def test_stream_with_prefetch(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(Bar).order_by(Bar.id)
+        result.stream(batch_size=2).prefetch(Bar.foo)
+        assert [bar.foo.id for bar in result] == [10, 20, 30]
+        # One query for the bars, one for each batch of foos.
+        assert stream.getvalue().count("SELECT") == 3
+
+    def test_iter_batches(self):
+        result = self.store.find(Foo).order_by(Foo.id)
+        batches = result.iter_batches(2)
+        first = next(batches)
+        assert [foo.id for foo in first] == [10, 20]
+        cached = self.store._cache.get_cached()
+        assert get_obj_info(first[0]) in cached
+        second = next(batches)
+        assert [foo.id for foo in second] == [30]
+        cached = self.store._cache.get_cached()
+        assert get_obj_info(first[0]) not in cached
+        assert get_obj_info(second[0]) in cached
+        assert list(batches) == []
+        assert get_obj_info(second[0]) not in self.store._cache.get_cached()
+        # Objects still referenced keep their identity.
+        assert self.store.get(Foo, 10) is first[0]
+
+    def test_iter_batches_keeps_dirty_objects(self):
+        result = self.store.find(Foo).order_by(Foo.id)
+        for batch in result.iter_batches(2):
+            batch[0].title = u"Changed"
+        foo = self.store.find(Foo, id=10).one()
+        assert get_obj_info(foo) in self.store._cache.get_cached()
+        assert foo.title == u"Changed"
+
+    def test_iter_batches_without_release(self):
+        result = self.store.find((Foo, Bar), Bar.foo_id == Foo.id)
+        batches = list(result.iter_batches(2, release=False))
+        assert [len(batch) for batch in batches] == [2, 1]
+        cached = self.store._cache.get_cached()
+        for foo, bar in batches[0]:
+            assert get_obj_info(foo) in cached
+            assert get_obj_info(bar) in cached
+
+    def test_iter_batches_forgets_loaded_reference_sets(self):
+        result = self.store.find(FooRefSet).prefetch(FooRefSet.bars)
+        for batch in result.iter_batches(3):
+            assert len(self.store._reference_sets) == 3
+        assert self.store._reference_sets == {}
+        assert [foo.bars.count() for foo in batch] == [1, 1, 1]
+
+    def test_after(self):
+        result = self.store.find(Foo).order_by(Foo.title)
+        foo = self.store.get(Foo, 20)
+        assert [foo.id for foo in result.after(foo)] == [10]
+        assert [foo.id for foo in result] == [30, 20, 10]
+
+    def test_after_with_desc_and_tie_breaker(self):
+        self.store.execute("INSERT INTO foo (id, title)"
+                           " VALUES (40, 'Title 20')")
+        result = self.store.find(Foo).order_by(Desc(Foo.title), Foo.id)
+        foo = self.store.get(Foo, 20)
+        assert [foo.id for foo in result.after(foo)] == [40, 30]
+
+    def test_after_issues_single_query(self):
+        result = self.store.find(Foo).order_by(Foo.title, Foo.id)
+        foo = self.store.get(Foo, 30)
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+        assert [foo.id for foo in result.after(foo)[:1]] == [20]
+        statement = stream.getvalue()
+        assert statement.count("SELECT") == 1
+        assert "OFFSET" not in statement
+
+    def test_after_compares_row_values(self):
+        result = self.store.find(Foo).order_by(Desc(Foo.title), Desc(Foo.id))
+        foo = self.store.get(Foo, 20)
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+        assert [foo.id for foo in result.after(foo)] == [30]
+        statement = stream.getvalue()
+        assert "(foo.title, foo.id) < " in statement
+        assert " OR " not in statement
+
+    def test_after_bounds_leading_column(self):
+        result = self.store.find(Foo).order_by(Desc(Foo.title), Foo.id)
+        foo = self.store.get(Foo, 20)
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+        assert [foo.id for foo in result.after(foo)] == [30]
+        statement = stream.getvalue()
+        assert "WHERE foo.title <= " in statement
+        assert "foo.title < " in statement
+        assert " OR " in statement
+
+    def test_after_with_tuple(self):
+        result = self.store.find((Foo, Bar), Bar.foo_id == Foo.id)
+        result.order_by(Bar.title)
+        item = result.first()
+        assert [(foo.id, bar.id) for foo, bar in result.after(item)] == [
+            (20, 200), (10, 100)]
+
+    def test_after_with_default_order(self):
+        class MyFoo(Foo):
+            __storm_order__ = "-title"
+        result = self.store.find(MyFoo)
+        foo = self.store.get(MyFoo, 10)
+        assert [foo.id for foo in result.after(foo)] == [20, 30]
+
+    def test_after_unordered(self):
+        foo = self.store.get(Foo, 10)
+        with pytest.raises(UnorderedError):
+            self.store.find(Foo).after(foo)
+
+    def test_after_with_expression_order(self):
+        foo = self.store.get(Foo, 10)
+        result = self.store.find(Foo).order_by(Lower(Foo.title))
+        with pytest.raises(FeatureError):
+            result.after(foo)
+
+    def test_after_with_null_value(self):
+        bar = self.store.get(Bar, 100)
+        bar.foo_id = None
+        result = self.store.find(Bar).order_by(Bar.foo_id)
+        with pytest.raises(FeatureError):
+            result.after(bar)
+
+    def test_keyset_token(self):
+        result = self.store.find(Foo).order_by(Foo.title, Foo.id)
+        token = result.keyset_token(self.store.get(Foo, 30))
+        assert [foo.id for foo in result.after(token)] == [20, 10]
+
+    def test_keyset_token_with_decimal(self):
+        self.store.execute("INSERT INTO money (id, value)"
+                           " VALUES (20, '13.5')")
+        result = self.store.find(Money).order_by(Money.value)
+        token = result.keyset_token(self.store.get(Money, 10))
+        assert [money.id for money in result.after(token)] == [20]
+
+    def test_wb_keyset_token_with_bytes(self):
+        class RawFoo(object):
+            __storm_table__ = "foo"
+            id = Int(primary=True)
+            title = RawStr()
+        foo = RawFoo()
+        foo.id = 10
+        foo.title = b"\xff\x00; Title"
+        result = self.store.find(RawFoo).order_by(RawFoo.title, RawFoo.id)
+        token = result.keyset_token(foo)
+        variables = _decode_keyset_token(result._get_keyset_order(), token)
+        assert [variable.get() for variable in variables] == [
+            b"\xff\x00; Title", 10]
+
+    def test_keyset_token_with_unsupported_value(self):
+        class PairVariable(Variable):
+            def parse_get(self, value, to_db):
+                return tuple(value)
+        class PairFoo(object):
+            __storm_table__ = "foo"
+            id = Int(primary=True)
+            title = Property(variable_class=PairVariable)
+        foo = PairFoo()
+        foo.id = 10
+        foo.title = [1, 2]
+        result = self.store.find(PairFoo).order_by(PairFoo.title)
+        with pytest.raises(FeatureError):
+            result.keyset_token(foo)
+
+    def test_after_with_invalid_token(self):
+        result = self.store.find(Foo).order_by(Foo.title, Foo.id)
+        with pytest.raises(ValueError):
+            result.after("not a token")
+        token = result.keyset_token(self.store.get(Foo, 30))
+        with pytest.raises(ValueError):
+            self.store.find(Foo).order_by(Foo.id).after(token)
+
+    def test_paginate(self):
+        result = self.store.find(Foo).order_by(Foo.title, Foo.id)
+        items, token = result.paginate(2)
+        assert [foo.id for foo in items] == [30, 20]
+        items, token = result.paginate(2, after=token)
+        assert [foo.id for foo in items] == [10]
+        assert token is None
+
+    def test_paginate_unordered(self):
+        with pytest.raises(UnorderedError):
+            self.store.find(Foo).paginate(2)
+
+    def test_joined_reference(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(Bar).order_by(Bar.id).joined(Bar.foo)
+        titles = [bar.foo.title for bar in result]
+        assert titles == [u"Title 30", u"Title 20", u"Title 10"]
+        assert stream.getvalue().count("SELECT") == 1
+        assert "LEFT JOIN" in stream.getvalue()
+
+    def test_joined_reference_not_found(self):
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 40, 'Title 400')")
+        self.store.execute("INSERT INTO bar (id, title)"
+                           " VALUES (500, 'Title 500')")
+        result = self.store.find(Bar, Bar.id >= 300).order_by(Bar.id)
+        bars = list(result.joined(Bar.foo))
+        assert [bar.id for bar in bars] == [300, 400, 500]
+        assert [bar.foo and bar.foo.id for bar in bars] == [30, None, None]
+
+    def test_joined_self_reference(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.find(SelfRef).order_by(SelfRef.id)
+        items = [(obj.id, obj.selfref and obj.selfref.id)
+                 for obj in result.joined(SelfRef.selfref)]
+        assert items == [(15, None), (25, None), (35, 15)]
+        assert stream.getvalue().count("SELECT") == 1
+
+    def test_joined_tuple_find(self):
+        result = self.store.find((Foo, Bar), Bar.foo_id == Foo.id,
+                                 Foo.id == 20)
+        foo, bar = result.joined(Bar.foo).one()
+        assert bar.foo is foo
+
+    def test_joined_with_using(self):
+        result = self.store.using(Bar).find(Bar, Bar.id == 200)
+        bar = result.joined(Bar.foo).one()
+        assert get_obj_info(bar)[Bar.foo._relation]["remote"].id == 20
+
+    def test_joined_with_several_tables(self):
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        result = self.store.using(Foo, Bar).find(
+            (Foo, Bar), Foo.id == 20, Bar.id == 100)
+        foo, bar = result.joined(Bar.foo).one()
+        assert foo.id == 20
+        assert bar.foo.id == 10
+        assert "FROM foo, bar LEFT JOIN" in stream.getvalue()
+
+        result = self.store.using(Bar, Foo).find(
+            (Foo, Bar), Foo.id == 20, Bar.id == 100)
+        foo, bar = result.joined(Bar.foo).one()
+        assert bar.foo.id == 10
+
+    def test_joined_with_join_in_tables(self):
+        result = self.store.using(Foo, Join(Bar, Bar.foo_id == Foo.id)).find(
+            Bar, Bar.id == 200)
+        bar = result.joined(Bar.foo).one()
+        assert get_obj_info(bar)[Bar.foo._relation]["remote"].id == 20
+
+    def test_joined_with_tables_missing_the_class(self):
+        result = self.store.using(Foo).find(Bar).joined(Bar.foo)
+        with pytest.raises(FeatureError):
+            list(result)
+
+    def test_joined_class_alias(self):
+        BarAlias = ClassAlias(Bar, "bar_alias")
+        result = self.store.find(BarAlias, BarAlias.id == 200)
+        bar = result.joined(BarAlias.foo).one()
+        assert get_obj_info(bar)[Bar.foo._relation]["remote"].id == 20
 
-        del foo
-        gc.collect()
+    def test_joined_count(self):
+        assert self.store.find(Bar).joined(Bar.foo).count() == 3
 
-        assert obj_info.get_obj()
+    def test_joined_unsupported_reference(self):
+        result = self.store.find(FooRef)
+        with pytest.raises(FeatureError):
+            result.joined(FooRef.bar)
+        with pytest.raises(FeatureError):
+            self.store.find(FooRefSet).joined(FooRefSet.bars)
+        with pytest.raises(FeatureError):
+            self.store.find(Foo).joined(Bar.foo)
 
-    def test_get_tuple(self):
-        class MyFoo(Foo):
-            __storm_primary__ = "title", "id"
-        foo = self.store.get(MyFoo, (u"Title 30", 10))
-        assert foo.id == 10
-        assert foo.title == "Title 30"
+    def test_joined_unsupported_with_group_by(self):
+        result = self.store.find(Bar).group_by(Bar.id)
+        with pytest.raises(FeatureError):
+            result.joined(Bar.foo)
+        result = self.store.find(Bar).joined(Bar.foo)
+        with pytest.raises(FeatureError):
+            result.group_by(Bar.id)
 
-        foo = self.store.get(MyFoo, (u"Title 20", 10))
-        assert foo == None
+    def test_prefetch_reference_set_forgotten_on_change(self):
+        foo = self.store.find(FooRefSet, id=10).prefetch(FooRefSet.bars).one()
+        assert [bar.id for bar in foo.bars] == [100]
+        bar = Bar()
+        bar.id = 400
+        foo.bars.add(bar)
+        assert sorted(bar.id for bar in foo.bars) == [100, 400]
+        self.store.get(Bar, 400).foo_id = 20
+        assert [bar.id for bar in foo.bars] == [100]
+
+    def test_prefetch_indirect_reference_set_forgotten_on_change(self):
+        result = self.store.find(FooIndRefSet, id=30)
+        foo = result.prefetch(FooIndRefSet.bars).one()
+        assert [bar.id for bar in foo.bars] == [300]
+        foo.bars.add(self.store.get(Bar, 100))
+        assert sorted(bar.id for bar in foo.bars) == [100, 300]
+        foo.bars.remove(self.store.get(Bar, 100))
+        assert [bar.id for bar in foo.bars] == [300]
+
+    def test_prefetch_reference_set_forgotten_on_execute(self):
+        foo = self.store.find(FooRefSet, id=10).prefetch(FooRefSet.bars).one()
+        assert [bar.id for bar in foo.bars] == [100]
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 10, 'Title 400')")
+        assert sorted(bar.id for bar in foo.bars) == [100, 400]
+
+    def test_prefetch_reference_set_forgotten_on_rollback(self):
+        foo = self.store.find(FooRefSet, id=10).prefetch(FooRefSet.bars).one()
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        assert [bar.id for bar in foo.bars] == [100]
+        assert stream.getvalue().count("SELECT") == 0
+        self.store.rollback()
+        assert [bar.id for bar in foo.bars] == [100]
+        assert stream.getvalue().count("SELECT") == 1
 
     def test_of(self):
         foo = self.store.get(Foo, 10)
@@ -1116,6 +1974,249 @@ class StoreTest(object):
             (30, "Title 10"),
         ]
 
+    def test_find_values_with_conversion(self):
+        self.store.execute("INSERT INTO money (id, value) VALUES (20, NULL)")
+        result = self.store.find(Money).order_by(Money.id)
+        values = list(result.values(Money.id, Money.value))
+        assert values == [(10, decimal.Decimal("12.3455")), (20, None)]
+        assert type(values[0][1]) is decimal.Decimal
+
+    def test_find_values_with_none_disallowed(self):
+        class MyBar(object):
+            __storm_table__ = "bar"
+            id = Int(primary=True)
+            title = Unicode(allow_none=False)
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, 40, NULL)")
+        result = self.store.find(MyBar, MyBar.id == 400)
+        with pytest.raises(NoneError):
+            list(result.values(MyBar.id, MyBar.title))
+
+    def test_find_columns(self):
+        class FloatFoo(Foo):
+            id = Float(primary=True)
+        result = self.store.find(Foo).order_by(Foo.id)
+        buffers = result.columns(Foo.id, FloatFoo.id, Foo.title,
+                                 batch_size=2)
+        assert len(buffers) == 3
+        assert buffers[Foo.id] == array("q", [10, 20, 30])
+        assert buffers[FloatFoo.id] == array("d", [10.0, 20.0, 30.0])
+        assert buffers[Foo.title] == ["Title 30", "Title 20", "Title 10"]
+
+    def test_find_columns_with_null(self):
+        self.store.execute("INSERT INTO bar (id, foo_id, title)"
+                           " VALUES (400, NULL, 'Title 400')")
+        result = self.store.find(Bar)
+        assert sorted(result.columns(Bar.title)[Bar.title]) == [
+            "Title 100", "Title 200", "Title 300", "Title 400"]
+        with pytest.raises(FeatureError):
+            result.columns(Bar.foo_id)
+
+    def test_wb_find_columns_with_big_integers(self):
+        big = 30 * 2 ** 64
+        connection = self.store._connection
+        execute = connection.execute
+        def execute_with_big_integers(*args, **kwargs):
+            result = execute(*args, **kwargs)
+            result.get_converter = (
+                lambda variable_factory:
+                lambda value: big if value == 30 else value)
+            return result
+        connection.execute = execute_with_big_integers
+        self.addCleanup(delattr, connection, "execute")
+        result = self.store.find(Foo).order_by(Foo.id)
+        buffers = result.columns(Foo.id, batch_size=2)
+        assert buffers[Foo.id] == [10, 20, big]
+
+    def test_find_columns_with_no_arguments(self):
+        with pytest.raises(FeatureError):
+            self.store.find(Foo).columns()
+
+    def test_find_columns_with_unknown_kind(self):
+        with pytest.raises(ValueError):
+            self.store.find(Foo).columns(Foo.id, as_="tuple")
+
+    def test_find_columns_as_numpy(self):
+        numpy = pytest.importorskip("numpy")
+        result = self.store.find(Foo).order_by(Foo.id)
+        buffers = result.columns(Foo.id, Foo.title, as_="numpy")
+        assert buffers[Foo.id].dtype == numpy.int64
+        assert list(buffers[Foo.id]) == [10, 20, 30]
+        assert buffers[Foo.title].dtype == object
+        assert list(buffers[Foo.title]) == [
+            "Title 30", "Title 20", "Title 10"]
+
+    def test_get_compiles_statement_once(self):
+        connection = self.store._connection
+        compiled = []
+
+        def compile(expr, *args, **kwargs):
+            compiled.append(expr)
+            return type(connection).compile(expr, *args, **kwargs)
+
+        connection.compile = compile
+        self.addCleanup(delattr, connection, "compile")
+        foo1 = self.store.get(Foo, 10)
+        foo2 = self.store.get(Foo, 20)
+        assert (foo1.title, foo2.title) == ("Title 30", "Title 20")
+        assert [type(expr) for expr in compiled] == [Select, SQL, SQL]
+
+    def test_flush_updates_with_cached_statement(self):
+        for id in (10, 20):
+            foo = self.store.get(Foo, id)
+            foo.title = u"New %d" % id
+            self.store.flush()
+        foo.title = Lower(Foo.title)
+        self.store.flush()
+        assert self.get_items() == [
+            (10, "New 10"), (20, "new 20"), (30, "Title 10")]
+
+    def test_prepare(self):
+        find_by_title = self.store.prepare_find(
+            lambda title: self.store.find(Foo, Foo.title == title))
+        assert [foo.id for foo in find_by_title(u"Title 20")] == [20]
+        assert [foo.id for foo in find_by_title(title=u"Title 10")] == [30]
+        assert list(find_by_title(u"Title 40")) == []
+
+    def test_prepare_compiles_statement_once(self):
+        find_by_ids = self.store.prepare_find(
+            lambda id1, id2: self.store.find(
+                Foo, Or(Foo.id == id1, Foo.id == id2)).order_by(Foo.id))
+        connection = self.store._connection
+        compiled = []
+
+        def compile(expr, *args, **kwargs):
+            compiled.append(expr)
+            return type(connection).compile(expr, *args, **kwargs)
+
+        connection.compile = compile
+        self.addCleanup(delattr, connection, "compile")
+        assert [foo.id for foo in find_by_ids(10, 20)] == [10, 20]
+        assert [foo.id for foo in find_by_ids(30, 20)] == [20, 30]
+        assert find_by_ids(30, 20).first().id == 20
+        assert find_by_ids(30, 10).first().id == 10
+        assert [type(expr) for expr in compiled] == [
+            Select, SQL, SQL, Select, SQL, SQL]
+
+    def test_prepare_with_changed_result(self):
+        find_by_title = self.store.prepare_find(
+            lambda title: self.store.find(Foo, Foo.title != title))
+        result = find_by_title(u"Title 20").order_by(Desc(Foo.id))
+        assert [foo.id for foo in result] == [30, 10]
+        result = find_by_title(u"Title 10").find(Foo.id > 10)
+        assert [foo.id for foo in result] == [20]
+        assert find_by_title(u"Title 30").count() == 2
+        assert sorted(find_by_title(u"Title 30").values(Foo.id)) == [20, 30]
+
+    def test_prepare_keeps_values_per_result(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        result1 = find_by_id(10)
+        result2 = find_by_id(20)
+        assert result1.one().id == 10
+        assert result2.one().id == 20
+        assert result1.one().id == 10
+
+    def test_prepare_cached(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        foo = self.store.get(Foo, 20)
+        assert find_by_id(10).cached() == []
+        assert find_by_id(20).cached() == [foo]
+
+    def test_prepare_set_and_remove(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        find_by_id(10).set(title=u"New title")
+        find_by_id(20).remove()
+        assert self.get_items() == [(10, "New title"), (30, "Title 10")]
+
+    def test_prepare_with_variable_value(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        assert find_by_id(IntVariable(20)).one().id == 20
+
+    def test_prepare_with_wrong_arguments(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        with pytest.raises(TypeError):
+            find_by_id()
+        with pytest.raises(TypeError):
+            find_by_id(10, 20)
+        with pytest.raises(TypeError):
+            find_by_id(10, id=20)
+        with pytest.raises(TypeError):
+            find_by_id(title=u"Title 10")
+
+    def test_prepare_flushes_pending_changes(self):
+        find_by_title = self.store.prepare_find(
+            lambda title: self.store.find(Foo, Foo.title == title))
+        foo = self.store.get(Foo, 20)
+        foo.title = u"New title"
+        assert list(find_by_title(u"Title 20")) == []
+        assert list(find_by_title(u"New title")) == [foo]
+
+    def test_prepare_with_partial(self):
+        def find(cls, title):
+            return self.store.find(cls, cls.title == title)
+        find_by_title = self.store.prepare_find(functools.partial(find, Foo))
+        assert [foo.id for foo in find_by_title(u"Title 20")] == [20]
+        assert [foo.id for foo in find_by_title(title=u"Title 10")] == [30]
+
+    def test_prepare_with_bound_method(self):
+        class Finder(object):
+            def find(finder, title):
+                return self.store.find(Foo, Foo.title == title)
+        find_by_title = self.store.prepare_find(Finder().find)
+        assert [foo.id for foo in find_by_title(u"Title 20")] == [20]
+        with pytest.raises(TypeError):
+            find_by_title(u"Title 20", u"Title 10")
+
+    def test_prepare_with_variable_parameters(self):
+        with pytest.raises(TypeError):
+            self.store.prepare_find(
+                lambda *titles: self.store.find(Foo, Foo.title.is_in(titles)))
+
+    def test_prepare_converts_values_with_columns(self):
+        class TitleVariable(UnicodeVariable):
+            def parse_set(self, value, from_db):
+                if isinstance(value, int):
+                    value = u"Title %d" % value
+                return super(TitleVariable, self).parse_set(value, from_db)
+
+        class MyFoo(Foo):
+            title = Property(variable_class=TitleVariable)
+
+        find_by_title = self.store.prepare_find(
+            lambda title: self.store.find(MyFoo, MyFoo.title == title))
+        assert [foo.id for foo in find_by_title(20)] == [20]
+        find_by_titles = self.store.prepare_find(
+            lambda title1, title2: self.store.find(
+                MyFoo, MyFoo.title.is_in([title1, title2])))
+        assert sorted(foo.id for foo in find_by_titles(20, 30)) == [10, 20]
+
+    def test_prepare_with_default_values(self):
+        def find(title, id=20):
+            return self.store.find(Foo, Foo.title == title, Foo.id == id)
+        find_by_title = self.store.prepare_find(find)
+        assert [foo.id for foo in find_by_title(u"Title 20")] == [20]
+        assert list(find_by_title(u"Title 20", id=10)) == []
+
+    def test_prepare_two_phase_transaction(self):
+        calls = []
+        self.store._connection.prepare = lambda: calls.append("prepare")
+        self.addCleanup(delattr, self.store._connection, "prepare")
+        assert self.store.prepare() is None
+        assert calls == ["prepare"]
+
+    def test_prepare_unsupported_operations(self):
+        find_by_id = self.store.prepare_find(
+            lambda id: self.store.find(Foo, Foo.id == id))
+        with pytest.raises(FeatureError):
+            find_by_id(10).get_select_expr(Foo.id)
+        with pytest.raises(FeatureError):
+            find_by_id(10).union(find_by_id(20))
+
     def test_find_values_with_no_arguments(self):
         result = self.store.find(Foo).order_by(Foo.id)
         with pytest.raises(FeatureError):
@@ -1898,6 +2999,52 @@ class StoreTest(object):
         with pytest.raises(WrongStoreError):
             Store(self.database).remove(foo)
 
+    def test_remove_batches_deletes(self):
+        foos = list(self.store.find(Foo))
+        for foo in foos:
+            self.store.remove(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("DELETE") == 1
+
+        debug(False)
+        for foo in foos:
+            assert Store.of(foo) is None
+        assert self.store.find(Foo).is_empty()
+
+    def test_remove_batches_deletes_with_composed_key(self):
+        links = list(self.store.find(Link, foo_id=10))
+        for link in links:
+            self.store.remove(link)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("DELETE") == 1
+
+        debug(False)
+        assert self.store.find(Link, foo_id=10).is_empty()
+        assert self.store.find(Link).count() == 3
+
+    def test_remove_batches_respect_max_parameters(self):
+        self.store._connection.max_parameters = 2
+        for foo in self.store.find(Foo):
+            self.store.remove(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("DELETE") == 2
+        assert self.store.find(Foo).is_empty()
+
     def test_wb_remove_flush_update_isnt_dirty(self):
         foo = self.store.get(Foo, 20)
         obj_info = get_obj_info(foo)
@@ -2089,6 +3236,48 @@ class StoreTest(object):
         foo.id = 200
         assert self.store.get(Foo, 200) is foo
 
+    def test_update_batches_same_columns(self):
+        batches = []
+        execute_many = self.store._connection.execute_many
+        def record_execute_many(statements):
+            batches.append(len(statements))
+            execute_many(statements)
+        self.store._connection.execute_many = record_execute_many
+
+        for foo in self.store.find(Foo):
+            foo.title = u"Title %d" % (foo.id * 10)
+
+        self.store.flush()
+        assert batches == [3]
+        assert self.get_items() == [
+            (10, "Title 100"),
+            (20, "Title 200"),
+            (30, "Title 300"),
+        ]
+
+    def test_update_batches_split_on_different_columns(self):
+        batches = []
+        execute_many = self.store._connection.execute_many
+        def record_execute_many(statements):
+            batches.append(len(statements))
+            execute_many(statements)
+        self.store._connection.execute_many = record_execute_many
+
+        foo1 = self.store.get(Foo, 10)
+        foo2 = self.store.get(Foo, 20)
+        foo3 = self.store.get(Foo, 30)
+        foo1.title = u"Title 100"
+        foo2.id = 40
+        foo3.title = u"Title 300"
+
+        self.store.flush()
+        assert batches == []
+        assert self.get_items() == [
+            (10, "Title 100"),
+            (30, "Title 300"),
+            (40, "Title 20"),
+        ]
+
     def test_add_update(self):
         foo = Foo()
         foo.id = 40
@@ -4550,6 +5739,297 @@ class StoreTest(object):
         assert foo1.id < foo3.id
         assert foo3.id < foo5.id
 
+    def test_flush_order_picks_ready_objects_by_sequence(self):
+        foos = [Foo() for i in range(5)]
+        for i, foo in enumerate(foos):
+            foo.title = u"Object %d" % (i+1)
+            self.store.add(foo)
+
+        self.store.add_flush_order(foos[3], foos[0])
+        self.store.add_flush_order(foos[4], foos[1])
+
+        self.store.flush()
+
+        ids = [foo.id for foo in foos]
+        assert ids[2] < ids[3] < ids[0]
+        assert ids[2] < ids[4] < ids[1]
+
+    def test_flush_order_loop_leaves_objects_dirty(self):
+        foo1 = self.store.add(Foo())
+        foo2 = self.store.add(Foo())
+        foo3 = self.store.add(Foo())
+        self.store.add_flush_order(foo1, foo2)
+        self.store.add_flush_order(foo2, foo1)
+
+        with pytest.raises(OrderLoopError):
+            self.store.flush()
+
+        assert foo3.id is not None
+        self.store.remove_flush_order(foo2, foo1)
+        self.store.flush()
+        assert foo1.id < foo2.id
+
+    def test_flush_object(self):
+        foo1 = self.store.get(Foo, 10)
+        foo2 = self.store.get(Foo, 20)
+        foo1.title = u"Title 100"
+        foo2.title = u"Title 200"
+
+        self.store.flush(foo1)
+        assert self.get_items() == [
+            (10, "Title 100"),
+            (20, "Title 20"),
+            (30, "Title 10"),
+        ]
+
+        self.store.flush()
+        assert self.get_items() == [
+            (10, "Title 100"),
+            (20, "Title 200"),
+            (30, "Title 10"),
+        ]
+
+    def test_flush_objects(self):
+        foo1 = self.store.get(Foo, 10)
+        foo2 = self.store.get(Foo, 20)
+        foo3 = self.store.get(Foo, 30)
+        foo1.title = u"Title 100"
+        foo2.title = u"Title 200"
+        foo3.title = u"Title 300"
+
+        self.store.flush([foo1, foo3])
+        assert self.get_items() == [
+            (10, "Title 100"),
+            (20, "Title 20"),
+            (30, "Title 300"),
+        ]
+
+    def test_flush_object_flushes_predecessors(self):
+        foo1 = self.store.add(Foo())
+        foo2 = self.store.add(Foo())
+        foo3 = self.store.add(Foo())
+        foo4 = self.store.add(Foo())
+        self.store.add_flush_order(foo3, foo2)
+        self.store.add_flush_order(foo1, foo3)
+
+        self.store.flush(foo2)
+        ids = [id for (id, title) in self.get_items()]
+        assert len(ids) == 6
+        assert foo1.id < foo3.id < foo2.id
+
+        self.store.flush()
+        assert foo4.id > foo2.id
+
+    def test_flush_object_ordering_loop(self):
+        foo1 = self.store.add(Foo())
+        foo2 = self.store.add(Foo())
+        self.store.add_flush_order(foo1, foo2)
+        self.store.add_flush_order(foo2, foo1)
+        with pytest.raises(OrderLoopError):
+            self.store.flush(foo1)
+
+    def test_resolve_lazy_value_flushes_only_object(self):
+        foo1 = self.store.get(Foo, 10)
+        foo1.title = u"Title 100"
+        foo2 = Foo()
+        foo2.id = 40
+        foo2.title = AutoReload
+        self.store.add(foo2)
+
+        assert foo2.title == u"Default Title"
+        assert self.get_items() == [
+            (10, "Title 30"),
+            (20, "Title 20"),
+            (30, "Title 10"),
+            (40, "Default Title"),
+        ]
+
+    def test_table_aware_flush_find(self):
+        self.store._table_aware_flushes = True
+        foo = self.store.get(Foo, 10)
+        bar = self.store.get(Bar, 100)
+        foo.title = u"Title 100"
+        bar.title = u"Title 1000"
+
+        assert self.store.find(Bar, title=u"Title 1000").one() is bar
+        assert self.get_items()[0] == (10, "Title 30")
+
+        assert self.store.find(Foo, title=u"Title 100").one() is foo
+        assert self.get_items()[0] == (10, "Title 100")
+
+    def test_table_aware_flush_get(self):
+        self.store._table_aware_flushes = True
+        foo = self.store.get(Foo, 10)
+        foo.title = u"Title 100"
+        bar = Bar()
+        bar.id = 400
+        self.store.add(bar)
+
+        assert self.store.get(Bar, 400) is bar
+        assert self.get_items()[0] == (10, "Title 30")
+
+    def test_table_aware_flush_using_referenced_tables(self):
+        self.store._table_aware_flushes = True
+        foo = self.store.get(Foo, 10)
+        foo.title = u"Title 100"
+
+        result = self.store.find(Bar, Bar.foo_id == Foo.id,
+                                 Foo.title == u"Title 100")
+        assert [bar.id for bar in result] == [100]
+
+        foo.title = u"Title 1000"
+        result = self.store.find(
+            Bar, Bar.foo_id.is_in(Select(Foo.id,
+                                         Foo.title == u"Title 1000")))
+        assert [bar.id for bar in result] == [100]
+
+        foo.title = u"Title 10000"
+        result = self.store.using(Bar, Join(Foo, Bar.foo_id == Foo.id)).find(
+            Bar, Foo.title == u"Title 10000")
+        assert [bar.id for bar in result] == [100]
+
+    def test_table_aware_flush_raw_sql(self):
+        self.store._table_aware_flushes = True
+        foo = self.store.get(Foo, 10)
+        foo.title = u"Title 100"
+
+        self.store.execute("SELECT 1")
+        assert self.get_items()[0] == (10, "Title 100")
+
+        foo.title = u"Title 1000"
+        list(self.store.find(Bar, SQL("1 = 1")))
+        assert self.get_items()[0] == (10, "Title 1000")
+
+    def test_table_aware_flush_raw_sql_strings(self):
+        self.store._table_aware_flushes = True
+        foo = self.store.get(Foo, 10)
+        foo.title = u"Title 100"
+
+        result = self.store.find(
+            Bar, "bar.foo_id IN (SELECT id FROM foo WHERE title = 'Title 100')")
+        assert [bar.id for bar in result] == [100]
+
+        foo.title = u"Title 1000"
+        result = self.store.find(
+            Bar, Bar.id == 100,
+            "bar.foo_id IN (SELECT id FROM foo WHERE title = 'Title 1000')")
+        assert [bar.id for bar in result] == [100]
+
+    def test_table_aware_flush_flushes_predecessors(self):
+        self.store._table_aware_flushes = True
+        foo = Foo()
+        foo.title = u"New title"
+        bar = Bar()
+        bar.id = 400
+        bar.foo = foo
+        self.store.add(bar)
+
+        assert self.store.get(Bar, 400).foo_id == foo.id
+        assert (foo.id, "New title") in self.get_items()
+
+    def test_flush_batches_added_objects(self):
+        foos = [Foo() for i in range(3)]
+        for i, foo in enumerate(foos):
+            foo.id = 100 + i
+            foo.title = u"Batched %d" % i
+            self.store.add(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("INSERT") == 1
+
+        debug(False)
+        for i, foo in enumerate(foos):
+            assert self.store.get(Foo, 100 + i) is foo
+        result = self.store.execute("SELECT id, title FROM foo "
+                                    "WHERE id >= 100 ORDER BY id")
+        assert list(result) == [(100, u"Batched 0"), (101, u"Batched 1"),
+                                (102, u"Batched 2")]
+
+    def test_flush_batches_respect_max_parameters(self):
+        self.store._connection.max_parameters = 4
+        for i in range(5):
+            foo = Foo()
+            foo.id = 100 + i
+            foo.title = u"Batched %d" % i
+            self.store.add(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("INSERT") == 3
+        assert self.store.find(Foo, Foo.id >= 100).count() == 5
+
+    def test_flush_batches_split_on_different_columns(self):
+        foo1 = Foo()
+        foo1.id = 100
+        foo1.title = u"Title 100"
+        foo2 = Foo()
+        foo2.id = 101
+        foo3 = Foo()
+        foo3.id = 102
+        foo3.title = u"Title 102"
+        for foo in (foo1, foo2, foo3):
+            self.store.add(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        assert stream.getvalue().count("INSERT") == 3
+        debug(False)
+        assert foo2.title == u"Default Title"
+
+    def test_flush_insert_sees_changes_from_flushed_hooks(self):
+        class MyFoo(Foo):
+            other = None
+
+            def __storm_flushed__(self):
+                if self.other is not None:
+                    self.other.title = u"Hooked"
+
+        foo1 = MyFoo()
+        foo1.id = 40
+        foo1.title = u"Title 40"
+        foo2 = MyFoo()
+        foo2.id = 50
+        foo1.other = foo2
+        self.store.add(foo1)
+        self.store.add(foo2)
+        self.store.flush()
+        self.store.commit()
+        result = self.store.execute("SELECT title FROM foo WHERE id = 50")
+        assert result.get_one() == ("Hooked",)
+
+    def test_flush_batches_fill_generated_primary_keys(self):
+        foos = [Foo() for i in range(3)]
+        for i, foo in enumerate(foos):
+            foo.title = u"Generated %d" % i
+            self.store.add(foo)
+
+        stream = StringIO()
+        self.addCleanup(debug, False)
+        debug(True, stream)
+
+        self.store.flush()
+        # Rows returned by a multi-row insert can't be reliably matched
+        # to the objects, so generated keys are fetched one at a time.
+        assert stream.getvalue().count("INSERT") == 3
+        debug(False)
+
+        ids = [foo.id for foo in foos]
+        assert None not in ids
+        assert len(set(ids)) == 3
+        for foo in foos:
+            assert self.store.get(Foo, foo.id) is foo
+            assert self.store.get(Foo, foo.id).title == foo.title
+
     def test_variable_filter_on_load(self):
         foo = self.store.get(FooVariable, 20)
         assert foo.title == "to_py(from_db(Title 20))"
@@ -6076,6 +7556,13 @@ class EmptyResultSetTest(object):
     def test_iter(self):
         assert list(self.result) == list(self.empty)
 
+    def test_paginate(self):
+        self.result.order_by(Foo.id)
+        assert self.result.paginate(2) == self.empty.paginate(2)
+
+    def test_keyset_token(self):
+        assert self.empty.keyset_token(Foo()) is None
+
     def test_copy(self):
         assert self.result.copy() != self.result
         assert self.empty.copy() != self.empty
@@ -6198,6 +7685,13 @@ class EmptyResultSetTest(object):
         assert list(self.result.values(Foo.title)) == []
         assert list(self.empty.values(Foo.title)) == []
 
+    def test_columns(self):
+        assert self.result.columns(Foo.id) == self.empty.columns(Foo.id)
+        with pytest.raises(FeatureError):
+            self.result.columns()
+        with pytest.raises(FeatureError):
+            self.empty.columns()
+
     def test_set_no_args(self):
         assert self.result.set() == None
         assert self.empty.set() == None
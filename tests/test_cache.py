@@ -1,9 +1,9 @@
 import pytest
 
 from storm.compat import iter_range, ustr
-from storm.properties import Int
+from storm.properties import Int, List, RawStr
 from storm.info import get_obj_info
-from storm.cache import Cache, GenerationalCache
+from storm.cache import Cache, GenerationalCache, MemoryBudgetCache
 
 
 class StubObjectInfo(object):
@@ -33,6 +33,22 @@ class StubClass(object):
     id = Int(primary=True)
 
 
+class StubBlobClass(object):
+
+    __storm_table__ = "stub_blob_class"
+
+    id = Int(primary=True)
+    data = RawStr()
+    items = List()
+
+
+def make_blob(id, data_size):
+    blob = StubBlobClass()
+    blob.id = id
+    blob.data = b"x" * data_size
+    return get_obj_info(blob)
+
+
 @pytest.fixture
 def obj_infos():
     return [StubObjectInfo(i) for i in iter_range(10)]
@@ -106,6 +122,15 @@ def test_add_existing(Cache, obj1, obj2, obj3):
     assert sorted(cache.get_cached()) == [obj1, obj2, obj3]
 
 
+@multi_cache_test
+def test_update(Cache, obj1, obj2):
+    cache = Cache(5)
+    cache.add(obj1)
+    cache.update(obj1)
+    cache.update(obj2)
+    assert cache.get_cached() == [obj1]
+
+
 @multi_cache_test
 def test_add_with_size_zero(Cache, obj1):
     """Cache is disabled entirely on add() if size is 0."""
@@ -170,6 +195,19 @@ def test_cache_size_and_fifo_behaviour(obj_infos):
     assert [obj_info.id for obj_info in cache.get_cached()] == [9, 8, 7, 6, 5]
 
 
+def test_cache_readding_makes_most_recent(obj_infos):
+    cache = Cache(5)
+    for obj_info in obj_infos[:5]:
+        cache.add(obj_info)
+    cache.add(obj_infos[1])
+    cache.add(obj_infos[3])
+    assert [obj_info.id for obj_info in cache.get_cached()] == [3, 1, 4, 2, 0]
+
+    # The least recently added entry is the one evicted.
+    cache.add(obj_infos[5])
+    assert [obj_info.id for obj_info in cache.get_cached()] == [5, 3, 1, 4, 2]
+
+
 def test_cache_reduce_max_size_to_zero(obj1):
     """When setting the size to zero, there's an optimization."""
     cache = Cache(5)
@@ -397,3 +435,140 @@ def test_generational_cache_evict_lru(obj1, obj2, obj3):
     cache.add(obj3)
 
     assert sorted(cache.get_cached()) == [obj1, obj3]
+
+
+def test_memory_budget_cache_usage():
+    obj_info1 = make_blob(1, 1000)
+    obj_info2 = make_blob(2, 100000)
+    cache = MemoryBudgetCache()
+    assert cache.get_usage() == 0
+
+    cache.add(obj_info1)
+    usage1 = cache.get_usage()
+    assert usage1 > 1000
+
+    cache.add(obj_info2)
+    usage2 = cache.get_usage() - usage1
+    # Both objects only differ by the size of their data.
+    assert usage2 - usage1 == 99000
+
+    # Re-adding an object doesn't count it twice.
+    cache.add(obj_info1)
+    assert cache.get_usage() == usage1 + usage2
+
+    assert cache.remove(obj_info2)
+    assert cache.get_usage() == usage1
+    assert not cache.remove(obj_info2)
+    assert cache.get_usage() == usage1
+
+    cache.clear()
+    assert cache.get_usage() == 0
+    assert cache.get_cached() == []
+
+
+def test_memory_budget_cache_evicts_least_recent():
+    obj_infos = [make_blob(i, 10000) for i in iter_range(4)]
+    cache = MemoryBudgetCache(35000)
+    for obj_info in obj_infos[:3]:
+        cache.add(obj_info)
+    assert cache.get_cached() == obj_infos[2::-1]
+
+    cache.add(obj_infos[0])
+    cache.add(obj_infos[3])
+    assert cache.get_cached() == [obj_infos[3], obj_infos[0], obj_infos[2]]
+    assert cache.get_usage() <= 35000
+
+
+def test_memory_budget_cache_drops_objects_over_budget():
+    obj_info1 = make_blob(1, 1000)
+    obj_info2 = make_blob(2, 100000)
+    cache = MemoryBudgetCache(50000)
+    cache.add(obj_info1)
+    usage = cache.get_usage()
+    cache.add(obj_info2)
+    assert cache.get_cached() == [obj_info1]
+    assert cache.get_usage() == usage
+
+
+def test_memory_budget_cache_set_size():
+    obj_infos = [make_blob(i, 10000) for i in iter_range(4)]
+    cache = MemoryBudgetCache(100000)
+    for obj_info in obj_infos:
+        cache.add(obj_info)
+    cache.set_size(25000)
+    assert cache.get_cached() == obj_infos[:1:-1]
+    assert cache.get_usage() <= 25000
+
+    cache.set_size(0)
+    assert cache.get_cached() == []
+    assert cache.get_usage() == 0
+    cache.add(obj_infos[0])
+    assert cache.get_cached() == []
+
+
+def test_memory_budget_cache_update():
+    obj_info = make_blob(1, 1000)
+    cache = MemoryBudgetCache()
+    cache.add(obj_info)
+    usage = cache.get_usage()
+
+    obj_info.variables[StubBlobClass.data].set(b"x" * 100000)
+    cache.add(obj_info)
+    assert cache.get_usage() == usage
+    cache.update(obj_info)
+    assert cache.get_usage() - usage == 99000
+
+    obj_info.variables[StubBlobClass.data].set(b"x" * 1000)
+    cache.update(obj_info)
+    assert cache.get_usage() == usage
+
+
+def test_memory_budget_cache_update_evicts_least_recent():
+    obj_infos = [make_blob(i, 10000) for i in iter_range(3)]
+    cache = MemoryBudgetCache(35000)
+    for obj_info in obj_infos:
+        cache.add(obj_info)
+    assert cache.get_cached() == obj_infos[::-1]
+
+    obj_infos[2].variables[StubBlobClass.data].set(b"x" * 20000)
+    cache.update(obj_infos[2])
+    assert cache.get_cached() == [obj_infos[2], obj_infos[1]]
+    assert cache.get_usage() <= 35000
+
+
+def test_memory_budget_cache_update_drops_objects_over_budget():
+    obj_infos = [make_blob(i, 10000) for i in iter_range(3)]
+    cache = MemoryBudgetCache(35000)
+    for obj_info in obj_infos:
+        cache.add(obj_info)
+    usage = cache.get_usage()
+
+    obj_infos[2].variables[StubBlobClass.data].set(b"x" * 100000)
+    cache.update(obj_infos[2])
+    assert cache.get_cached() == [obj_infos[1], obj_infos[0]]
+    assert cache.get_usage() < usage
+
+
+def test_memory_budget_cache_update_uncached():
+    cache = MemoryBudgetCache()
+    cache.update(make_blob(1, 1000))
+    assert cache.get_cached() == []
+    assert cache.get_usage() == 0
+
+
+def test_memory_budget_cache_samples_containers():
+    blob = StubBlobClass()
+    blob.items = [b"x" * 1000 for i in iter_range(1000)]
+    cache = MemoryBudgetCache()
+    cache.add(get_obj_info(blob))
+    assert 1000000 < cache.get_usage() < 1100000
+
+
+def test_wb_memory_budget_cache_counts_values_of_unbuilt_variables():
+    obj_info = get_obj_info(StubBlobClass())
+    obj_info.variables.load_value(StubBlobClass.data, b"x" * 10000)
+    cache = MemoryBudgetCache()
+    cache.add(obj_info)
+    assert cache.get_usage() > 10000
+    position = obj_info.cls_info.column_positions[id(StubBlobClass.data)]
+    assert obj_info.variables._slots[position] == b"x" * 10000
@@ -107,3 +107,60 @@ def test_weak_reference():
     del marker
     event.emit("event")
     assert called == []
+
+
+def test_share_unshare_emit(event, marker):
+    callback1 = Mock()
+    callback2 = Mock()
+    hooks = {"one": (callback1,), "two": (callback1, callback2)}
+
+    event.share(hooks)
+    event.share(hooks)
+
+    event.emit("one", 1, 2)
+    event.emit("two", 3)
+    event.emit("three")
+    event.unshare(hooks)
+    event.emit("one", 4)
+
+    assert callback1.call_args_list == [call(marker, 1, 2), call(marker, 3)]
+    assert callback2.call_args_list == [call(marker, 3)]
+
+
+def test_shared_hooks_called_after_own_hooks(event, marker):
+    called = []
+    event.share({"event": (lambda owner: called.append("shared"),)})
+    event.hook("event", lambda owner: called.append("own"))
+
+    event.emit("event")
+
+    assert called == ["own", "shared"]
+
+
+def test_shared_hooks_not_unhooked_by_returning_false(event, marker):
+    called = []
+    def callback(owner):
+        called.append(owner)
+        return False
+
+    event.share({"event": (callback,)})
+
+    event.emit("event")
+    event.emit("event")
+
+    assert called == [marker, marker]
+
+
+def test_shared_hooks_weak_reference():
+    marker = Marker()
+
+    called = []
+    def callback(owner):
+        called.append(owner)
+
+    event = EventSystem(marker)
+    event.share({"event": (callback,)})
+
+    del marker
+    event.emit("event")
+    assert called == []
@@ -25,7 +25,7 @@ import pytest
 from storm.compat import add_metaclass, iter_zip
 from storm.exceptions import ClassInfoError
 from storm.properties import Property
-from storm.variables import Variable
+from storm.variables import Variable, LazyValue
 from storm.expr import Undef, Select, compile
 from storm.info import *
 
@@ -195,6 +195,33 @@ def test_cls_info_primary_key_pos():
     assert cls_info.primary_key_pos == (2, 0)
 
 
+def test_cls_info_lazy_columns():
+    class Class(object):
+        __storm_table__ = "table"
+        prop1 = Property("column1", lazy=True)
+        prop2 = Property("column2", primary=True)
+        prop3 = Property("column3")
+    cls_info = ClassInfo(Class)
+    assert cls_info.lazy_columns == (Class.prop1,)
+    assert cls_info.loaded_columns == (Class.prop2, Class.prop3)
+    assert cls_info.loaded_primary_key_pos == (0,)
+
+
+def test_cls_info_without_lazy_columns(Class, cls_info):
+    assert cls_info.lazy_columns == ()
+    assert cls_info.loaded_columns is cls_info.columns
+    assert cls_info.loaded_primary_key_pos == cls_info.primary_key_pos
+
+
+def test_cls_info_lazy_primary_key():
+    class Class(object):
+        __storm_table__ = "table"
+        prop1 = Property("column1", primary=True, lazy=True)
+
+    with pytest.raises(ClassInfoError):
+        ClassInfo(Class)
+
+
 class ObjectInfoTest(TestHelper):
 
     def setUp():
@@ -232,7 +259,7 @@ def test_obj_info_dict_subclass(obj_info):
 
 
 def test_obj_info_variables(cls_info, obj_info):
-    assert isinstance(obj_info.variables, dict)
+    assert isinstance(obj_info.variables, ObjectVariables)
 
     for column in cls_info.columns:
         variable = obj_info.variables.get(column)
@@ -242,6 +269,112 @@ def test_obj_info_variables(cls_info, obj_info):
     assert len(obj_info.variables) == len(cls_info.columns)
 
 
+def test_obj_info_variables_mapping(Class, cls_info, obj_info):
+    variables = obj_info.variables
+    assert list(variables) == list(cls_info.columns)
+    assert variables.keys() == list(cls_info.columns)
+    assert variables.values() == [variables[Class.prop1],
+                                  variables[Class.prop2]]
+    assert variables.items() == [(Class.prop1, variables[Class.prop1]),
+                                 (Class.prop2, variables[Class.prop2])]
+    assert Class.prop1 in variables
+    other = Property("column1")
+    assert other not in variables
+    assert variables.get(other) is None
+    assert variables.get(other, 1) == 1
+    with pytest.raises(KeyError):
+        variables[other]
+
+
+def test_cls_info_eager_variables_pos():
+    class Class(object):
+        __storm_table__ = "table"
+        prop1 = Property("column1", primary=True)
+        prop2 = Property("column2")
+        prop3 = Property("column3", variable_kwargs={"value": 1})
+        prop4 = Property("column4", variable_kwargs={"value_factory": list})
+    assert get_cls_info(Class).eager_variables_pos == (0, 2, 3)
+
+
+def test_cls_info_eager_variables_pos_with_get_lazy():
+    class LazyVariable(Variable):
+        def get_lazy(self, default=None):
+            return default
+    class Class(object):
+        __storm_table__ = "table"
+        prop1 = Property("column1", primary=True)
+        prop2 = Property("column2", variable_class=LazyVariable)
+        prop3 = Property("column3")
+    assert get_cls_info(Class).eager_variables_pos == (0, 1)
+
+
+def test_wb_obj_info_variables_built_on_access(Class, obj_info):
+    slots = obj_info.variables._slots
+    assert isinstance(slots[0], Variable)
+    assert slots[1] is Undef
+    variable = obj_info.variables[Class.prop2]
+    assert slots[1] is variable
+    assert obj_info.variables[Class.prop2] is variable
+    assert variable.column is Class.prop2
+    assert variable.event is obj_info.event
+
+
+def test_obj_info_variables_load_value(Class, obj_info):
+    changes = []
+    def changed(*args):
+        changes.append(args)
+    obj_info.event.hook("changed", changed)
+    variables = obj_info.variables
+    assert variables.load_value(Class.prop2, 10) is None
+    assert variables.load_value(Class.prop2, 20, keep_defined=True) is None
+    assert variables.get_lazy(Class.prop2) is None
+    variable = variables[Class.prop2]
+    assert variable.get() == 10
+    assert not variable.has_changed()
+    assert variables.load_value(Class.prop2, 30) is variable
+    assert changes == []
+
+
+def test_obj_info_variables_load_lazy_value(Class, obj_info):
+    lazy_value = LazyValue()
+    variables = obj_info.variables
+    assert variables.load_value(Class.prop2, lazy_value) is None
+    assert variables.get_lazy(Class.prop2) is lazy_value
+    assert variables.load_value(Class.prop2, 10, keep_defined=True) is None
+    variable = variables[Class.prop2]
+    assert variable.get_lazy() is None
+    assert variable.get() == 10
+
+
+def test_obj_info_variables_lazy_check_errors(Class, obj_info):
+    class BrokenValue(object):
+        @property
+        def __class__(self):
+            raise ZeroDivisionError()
+    variables = obj_info.variables
+    variables.load_value(Class.prop2, BrokenValue())
+    with pytest.raises(ZeroDivisionError):
+        variables.get_lazy(Class.prop2)
+    with pytest.raises(ZeroDivisionError):
+        variables.load_value(Class.prop2, 10, keep_defined=True)
+    with pytest.raises(ZeroDivisionError):
+        variables[Class.prop2]
+
+
+def test_wb_obj_info_variables_get_loaded_values(Class, obj_info):
+    variables = obj_info.variables
+    assert variables.get_loaded_values() == [Undef, Undef]
+    variables[Class.prop1].set(1)
+    variables.load_value(Class.prop2, 2)
+    assert variables.get_loaded_values() == [1, 2]
+    assert variables._slots[1] == 2
+
+
+def test_wb_obj_info_checkpoint_skips_unbuilt_variables(Class, obj_info):
+    obj_info.checkpoint()
+    assert obj_info.variables._slots[1] is Undef
+
+
 def test_obj_info_variable_has_validator_object_factory():
     args = []
     def validator(obj, attr, value):
@@ -94,6 +94,15 @@ def test_cls(cls1, cls2):
     assert cls1.prop2.cls == cls1
 
 
+def test_lazy():
+    class Class(object):
+        __storm_table__ = "table"
+        prop1 = Int(primary=True)
+        prop2 = Unicode(lazy=True)
+    assert Class.prop1.lazy is False
+    assert Class.prop2.lazy is True
+
+
 def test_name(Class):
     assert Class.prop1.name == "column1"
 